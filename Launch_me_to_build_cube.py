@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""
+Launcher of ndvi.build_cube (see its documentation, or run it with --help), so the
+script still runs from this folder as before:
+
+    run Launch_me_to_build_cube.py [options]
+
+The same step runs as the console script ndvi-build-cube once the package
+is installed (see pyproject.toml), and import Launch_me_to_build_cube still gives its functions.
+"""
+
+from pathlib import Path as Path
+
+import os as os
+
+from ndvi.build_cube import *
+from ndvi.build_cube import main as main
+
+
+# %% RING BELL
+if __name__ == "__main__":
+    # Relative routes in the options (e.g. ../Inputs) are relative to the scripts
+    os.chdir(Path(__file__).resolve().parent)
+    main()
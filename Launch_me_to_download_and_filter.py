@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""
+Launcher of ndvi.download_and_filter (see its documentation, or run it with --help), so the
+script still runs from this folder as before:
+
+    run Launch_me_to_download_and_filter.py [options]
+
+The same step runs as the console script ndvi-download-and-filter once the package
+is installed (see pyproject.toml), and import Launch_me_to_download_and_filter still gives its functions.
+"""
+
+from pathlib import Path as Path
+
+import os as os
+
+from ndvi.download_and_filter import *
+from ndvi.download_and_filter import main as main
+
+
+# %% RING BELL
+if __name__ == "__main__":
+    # Relative routes in the options (e.g. ../Inputs) are relative to the scripts
+    os.chdir(Path(__file__).resolve().parent)
+    main()
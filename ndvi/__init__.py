@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Library of the NDVI scripts of LABIF-UCO (https://doi.org/10.5281/zenodo.18620398).
+
+Every step is a module (download, filter, download_and_filter, sweep_filters,
+process, smooth, build_cube, extract, benchmark_download and benchmark_codecs)
+with a main() that runs it as a script (see the Launch_me_*.py launchers, and
+the console scripts in pyproject.toml). Importing a module does nothing but
+define its functions: the heavy libraries (xarray, dask, pandas, zarr, boto3,
+requests, tqdm...) are imported by the functions that use them.
+"""
+
+from pathlib import Path as Path
+
+import os as os
+
+Version = "20261017a"
+
+
+def f_Directory_scripts():
+    """
+    Returns
+    -------
+    Directory_scripts : Path
+        Folder of the Launch_me_*.py launchers (and of .credentials.ini): the
+        folder that holds this package, or General/Scripts when the package is
+        installed (see f_Directory_general).
+    """
+    Directory_package = Path(__file__).resolve().parent
+    if "NDVI_DIRECTORY" in os.environ or Directory_package.parent.name in ("site-packages", "dist-packages"):
+        return f_Directory_general() / "Scripts"
+    return Directory_package.parent
+
+
+def f_Directory_general():
+    """
+    Returns
+    -------
+    Directory_general : Path
+        Folder that holds Ancillary, Inputs, Outputs_* and Scripts: the environment
+        variable NDVI_DIRECTORY if it is set, the parent of the scripts when they
+        run from their folder, or the working directory when the package is installed.
+    """
+    if "NDVI_DIRECTORY" in os.environ:
+        return Path(os.environ["NDVI_DIRECTORY"]).expanduser().resolve()
+
+    Directory_package = Path(__file__).resolve().parent
+    if Directory_package.parent.name in ("site-packages", "dist-packages"):
+        return Path.cwd()
+    return Directory_package.parent.parent
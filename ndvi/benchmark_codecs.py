@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+TRACKING:
+    https://doi.org/10.5281/zenodo.18620398
+    Product developped by LABIF-UCO ("https://labif.es/").
+    Version 20261017a (last modified by Juanan).
+
+OBJECTIVE:
+    To choose the compression of the filtered NDVI (see --codec, --complevel and --no-shuffle in Launch_me_to_filter.py), by measuring the encode time, the decode time and the file size of every codec on a sample dekad.
+
+INFORMATION:
+    This script does as follows:
+
+    1) Takes a sample dekad (by default, the first NC file available in Outputs_downloaded), filters it with the same parameters as Launch_me_to_filter.py and saves it once, uncompressed, to a scratch file. The dekad is streamed chunk by chunk, so it is never held in memory.
+    2) Saves the filtered NDVI of the scratch file with every codec (codec[:complevel][:noshuffle], e.g. zlib:4, zstd:3, blosc_lz4:5:noshuffle, none), exactly as Launch_me_to_filter.py saves it.
+    3) Reads every file back, chunk by chunk: the whole NDVI, and a window of 1/16 of the grid (the read pattern of a regional study).
+    4) Reports the size, the compression ratio and the encode/decode times of every codec. Codecs whose HDF5 plugin is not available are skipped.
+
+EXAMPLES:
+
+    run Launch_me_to_benchmark_codecs.py
+        Benchmarks the default codecs on the first NC file available.
+
+    run Launch_me_to_benchmark_codecs.py --sample c_gls_NDVI300_202001010000_GLOBE_OLCI_V3.0.1.nc --codecs zlib:1 zlib:4 zstd:1 zstd:9 --Output_encoding uint8 --repeat 3
+        Benchmarks four codecs on a given dekad, saved as uint8, keeping the best of 3 runs.
+
+WARNINGS:
+    The files are written to a temporary folder (by default, next to Outputs_filtered, so the disk is the same), which is deleted at the end. It needs room for the uncompressed filtered dekad (about 23 GB as float32, 6 GB as uint8, for the global grid).
+    The encode times include reading the scratch file, which is the same for every codec (see the time of "none").
+"""
+
+# %% IMPORT THE LIBRARIES
+from pathlib import Path as Path
+
+import argparse as argparse
+import json as json
+import os as os
+import shutil as shutil
+import tempfile as tempfile
+import time as time
+
+import numpy as np
+
+from ndvi import filter as NDVI_filter
+
+
+# %% PREVIOUS INFORMATION
+# This Script requires the following information to run smoothly:
+# Input 1: codecs benchmarked by default
+Default_codecs = ["none", "zlib:1", "zlib:4", "zlib:9", "zlib:4:noshuffle", "zstd:1", "zstd:3", "zstd:9", "bzip2:9", "blosc_lz4:5", "blosc_zstd:5"]
+
+
+# %% ANCILLARY FUNCTIONS
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the compression codecs of the filtered NDVI"
+    )
+
+    # The filter parameters set the filtered NDVI that is compressed
+    NDVI_filter.add_arguments(parser)
+
+    # --- BENCHMARK ---
+    parser.add_argument(
+        "--sample",
+        type=str,
+        default=None,
+        help="NC file (name in Outputs_downloaded, or route) of the sample dekad. By default, the first available"
+    )
+
+    parser.add_argument(
+        "--codecs",
+        nargs="+",
+        default=Default_codecs,
+        help="Codecs to benchmark, as codec[:complevel][:noshuffle] (e.g. zlib:4 zstd:3 blosc_lz4:5:noshuffle none)"
+    )
+
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=1,
+        help="Runs of every codec (the best time is kept)"
+    )
+
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=None,
+        help="JSON file where the results are saved"
+    )
+
+    return parser.parse_args()
+
+
+def f_Parse_codec(text):
+    """
+    Parameters
+    ----------
+    text : str
+        codec[:complevel][:noshuffle], e.g. "zstd:3" or "zlib:4:noshuffle".
+
+    Returns
+    -------
+    codec : dict
+        Name, Codec, Complevel and Shuffle.
+    """
+    parts = text.split(":")
+    if parts[0] not in NDVI_filter.CODECS:
+        raise ValueError(f"Unknown codec '{parts[0]}' (expected one of {', '.join(NDVI_filter.CODECS)})")
+
+    return {
+        "Name": text,
+        "Codec": parts[0],
+        "Complevel": int(parts[1]) if len(parts) > 1 and parts[1] else NDVI_filter.Complevel,
+        "Shuffle": "noshuffle" not in parts[2:],
+    }
+
+
+def f_Sample_NC_file(sample, Directories):
+    """
+    Returns
+    -------
+    route_to_sample_NC : WindowsPath
+        Route to the sample dekad: sample (a route, or a name in Outputs_downloaded),
+        or the first NC file available in Outputs_downloaded.
+    """
+    print(f"         Running: {f_Sample_NC_file.__name__}()")
+
+    if sample is not None:
+        route_to_sample_NC = Path(sample)
+        if not route_to_sample_NC.exists():
+            route_to_sample_NC = Directories["Outputs_downloaded"] / sample
+        return route_to_sample_NC
+
+    return Directories["Outputs_downloaded"] / sorted(NDVI_filter.f_list_of_available_NC_files(Directories["Outputs_downloaded"]))[0]
+
+
+def f_Benchmark_codec(NDVI_variable, raw_NC_ds, codec, Output_encoding, route_to_tmp, repeat=1):
+    """
+    Saves NDVI_variable (lazy, see f_Scratch_NC_file) with codec, as f_Save_the_NC
+    does, and reads it back chunk by chunk (a reduction of dask, so the decoded
+    NDVI is never held in memory).
+
+    Returns
+    -------
+    result : dict
+        Size in bytes, and best encode, full decode and window decode times (seconds).
+    """
+    import xarray as xr
+
+    Compression = NDVI_filter.f_Codec_encoding(codec["Codec"], codec["Complevel"], codec["Shuffle"])
+    route_to_NC = Path(route_to_tmp) / f"{codec['Name'].replace(':', '_')}.nc"
+
+    NDVI_ds = NDVI_variable.to_dataset(name="NDVI")
+    NDVI_ds["NDVI"].attrs = raw_NC_ds["NDVI"].attrs
+    encoding = {"NDVI": NDVI_filter.f_NDVI_encoding(raw_NC_ds, Output_encoding, Compression)}
+
+    # Window of 1/16 of the grid (a quarter of every horizontal dimension)
+    window = {dimension: slice(0, max(1, length // 4)) for dimension, length in NDVI_variable.sizes.items() if dimension != "time"}
+
+    times = {"encode": [], "decode": [], "decode_window": []}
+    for _ in range(repeat):
+        route_to_NC.unlink(missing_ok=True)
+
+        start = time.perf_counter()
+        NDVI_ds.to_netcdf(route_to_NC, format="NETCDF4", engine="netcdf4", encoding=encoding)
+        times["encode"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with xr.open_dataset(route_to_NC, decode_cf=False, chunks={}) as output_NC_ds:
+            output_NC_ds["NDVI"].max().compute()
+        times["decode"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with xr.open_dataset(route_to_NC, decode_cf=False, chunks={}) as output_NC_ds:
+            output_NC_ds["NDVI"].isel(window).max().compute()
+        times["decode_window"].append(time.perf_counter() - start)
+
+    size = os.path.getsize(route_to_NC)
+    route_to_NC.unlink()
+
+    return {"bytes": size, **{name: min(values) for name, values in times.items()}}
+
+
+def f_Scratch_NC_file(raw_NC_ds, Parameters, route_to_tmp):
+    """
+    Filters raw_NC_ds (see NDVI_filter.f_Filter_fused) and saves it, uncompressed
+    and with the chunks of the filtered NC files, to a scratch file. The dekad is
+    computed and written along the chunks of the NC file, so only a few of them
+    are in memory at once.
+
+    Returns
+    -------
+    route_to_scratch_NC : Path
+        Route to the scratch file, which every codec encodes from.
+    """
+    print(f"         Running: {f_Scratch_NC_file.__name__}()")
+
+    route_to_scratch_NC = Path(route_to_tmp) / "scratch.nc"
+    chunksizes = raw_NC_ds["NDVI"].encoding.get("chunksizes")
+    chunks = dict(zip(raw_NC_ds["NDVI"].dims, chunksizes)) if chunksizes else "auto"
+    NDVI_ds = NDVI_filter.f_Filter_fused(raw_NC_ds.chunk(chunks), Parameters).to_dataset(name="NDVI")
+    encoding = {"NDVI": NDVI_filter.f_NDVI_encoding(raw_NC_ds, Parameters["Output_encoding"], NDVI_filter.f_Codec_encoding("none"))}
+    NDVI_ds.to_netcdf(route_to_scratch_NC, format="NETCDF4", engine="netcdf4", encoding=encoding)
+
+    return route_to_scratch_NC
+
+
+def f_Print_results(results, raw_bytes):
+    print()
+    print(f"           {'codec':<22} {'MB':>8} {'ratio':>6} {'encode s':>9} {'MB/s':>7} {'decode s':>9} {'window s':>9}")
+    for result in results:
+        if result.get("error"):
+            print(f"           {result['codec']:<22} {result['error']}")
+            continue
+        print(
+            f"           {result['codec']:<22} {result['bytes'] / 1e6:>8.2f} {raw_bytes / result['bytes']:>6.1f}"
+            f" {result['encode']:>9.2f} {raw_bytes / result['encode'] / 1e6:>7.1f} {result['decode']:>9.2f} {result['decode_window']:>9.3f}"
+        )
+
+
+# %% MAIN FUNCTION
+def main():
+    print(__doc__)
+    print("RUN THE SCRIPT:")
+    print(f"         Running: {main.__name__}()")
+
+    import xarray as xr
+
+    # %% LOAD THE INPUTS
+    args = parse_arguments()
+    Parameters = NDVI_filter.f_Filter_parameters(args)
+    codecs = [f_Parse_codec(text) for text in args.codecs]
+
+    # %% DEFINE THE DIRECTORIES
+    Directories = NDVI_filter.f_Define_the_directories()
+
+    # %% FILTER THE SAMPLE DEKAD
+    # Filtered once, to an uncompressed scratch file, so only the compression is measured
+    route_to_sample_NC = f_Sample_NC_file(args.sample, Directories)
+    print(f"           - Sample dekad: {route_to_sample_NC.name}")
+
+    route_to_tmp = tempfile.mkdtemp(prefix="ndvi_codecs_", dir=Directories["Outputs_filtered"].parent)
+    results = []
+    try:
+        # Opened with dask (chunks={}), so the layers are read chunk by chunk instead of cached whole
+        with xr.open_dataset(route_to_sample_NC, decode_cf=False, chunks={}) as raw_NC_ds, \
+             xr.open_dataset(f_Scratch_NC_file(raw_NC_ds, Parameters, route_to_tmp), decode_cf=False, chunks={}) as scratch_NC_ds:
+            NDVI = scratch_NC_ds["NDVI"]
+            raw_bytes = NDVI.nbytes
+            print(f"           - Filtered NDVI: {NDVI.shape}, {Parameters['Output_encoding']}, {raw_bytes / 1e6:.1f} MB uncompressed")
+
+            # %% BENCHMARK THE CODECS
+            for codec in codecs:
+                if not NDVI_filter.f_Codec_is_available(codec["Codec"]):
+                    print(f"           - {codec['Name']}: not available (no HDF5 plugin)")
+                    results.append({"codec": codec["Name"], "error": "not available"})
+                    continue
+
+                print(f"           - Benchmarking {codec['Name']}")
+                results.append({"codec": codec["Name"], **f_Benchmark_codec(NDVI, raw_NC_ds, codec, Parameters["Output_encoding"], route_to_tmp, args.repeat)})
+
+    finally:
+        shutil.rmtree(route_to_tmp, ignore_errors=True)
+
+    # %% SAVE THE RESULTS
+    f_Print_results(results, raw_bytes)
+    if args.output is not None:
+        args.output.write_text(json.dumps({"sample": route_to_sample_NC.name, "raw_bytes": raw_bytes, "results": results}, indent=1))
+        print(f"           - Results saved in {args.output}")
+
+    # %% ENDSCRIPT
+    print()
+    print("         Endscript");
+
+
+# %% RING BELL
+if __name__ == "__main__":
+    main()
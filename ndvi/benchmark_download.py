@@ -0,0 +1,724 @@
+# -*- coding: utf-8 -*-
+"""
+TRACKING:
+    https://doi.org/10.5281/zenodo.18620398
+    Product developped by LABIF-UCO ("https://labif.es/").
+    Version 20261017a (last modified by Juanan).
+
+OBJECTIVE:
+    To benchmark the download paths of Launch_me_to_download_NDVI.py against a local stand-in of CDSE, without credentials and without spending any CDSE quota.
+
+INFORMATION:
+    This script does as follows:
+
+    1) Builds a synthetic NDVI product (NDVI, NDVI_unc, NOBS and QFLAG, as in the CLMS files) of the requested size.
+    2) Starts a local stand-in of CDSE on 127.0.0.1: identity server (token), OData catalogue, S3 keys manager, catalogue CSV
+       and an S3-compatible eodata endpoint that serves the synthetic product under the name of every product.
+    3) Optionally, injects latency, 403/429 answers and dropped connections in the eodata requests.
+    4) Downloads the products with every selected download path of Launch_me_to_download_NDVI.py:
+         - serial:     f_Downloader, product by product (traverse_and_download_s3 → download_file_s3).
+         - concurrent: f_Download_concurrently, with --workers workers.
+         - bbox:       f_Download_concurrently, reading only the --bbox window of every product.
+    5) Reports products/hour and MB/s (bytes served by the stand-in) of every path.
+
+EXAMPLES:
+
+    run Launch_me_to_benchmark_download.py
+        Benchmarks the serial and concurrent paths with 8 products of 32 MB.
+
+    run Launch_me_to_benchmark_download.py --products 16 --size 64 --workers 4 --latency 0.05 --error-rate 0.05 --drop-rate 0.02 --paths serial concurrent bbox
+        Benchmarks the three paths with 50 ms of latency per request, 5 % of requests answered with 403/429 and 2 % of dropped connections.
+
+    run Launch_me_to_benchmark_download.py --serve --port 8765
+        Only starts the stand-in (until Ctrl+C), and prints the URLs to set in the config of Launch_me_to_download_NDVI.py.
+
+WARNINGS:
+    Nothing is sent to CDSE. The downloads are written to a temporary folder, which is deleted at the end.
+    Requires h5netcdf (bbox path) and netCDF4 (to build the synthetic product).
+"""
+
+# %% IMPORT THE LIBRARIES
+from pathlib import Path as Path
+
+import argparse as argparse
+import datetime as datetime
+import hashlib as hashlib
+import http.server as http_server
+import json as json
+import os as os
+import random as random
+import re as re
+import shutil as shutil
+import socket as socket
+import tempfile as tempfile
+import threading as threading
+import time as time
+import urllib.parse as urllib_parse
+import uuid as uuid
+from xml.sax.saxutils import escape as xml_escape
+
+import numpy as np
+
+from ndvi import download as downloader
+
+
+# %% PREVIOUS INFORMATION
+# This Script requires the following information to run smoothly:
+# Input 1: layout of the stand-in (same routes as the real services, under one local server)
+standin = {
+    "auth_path": "/auth/realms/CDSE/protocol/openid-connect/token",
+    "odata_path": "/odata/v1/Products",
+    "catalogue_csv_path": "/CatalogueCSV/ndvi_global_300m_10daily_v3_nc.csv",
+    "s3_keys_manager_path": "/api/user/credentials",
+    "bucket": "eodata",
+    "s3_prefix": "CLMS/bio-geophysical/vegetation_indices/ndvi_global_300m_10daily_v3",
+    "token_expires_in": 600,  # Seconds of validity of every access token
+    "first_date": datetime.datetime(2020, 1, 1),  # Date of the first synthetic product (then every dekad)
+}
+
+
+# %% ANCILLARY FUNCTIONS
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the download paths against a local stand-in of CDSE"
+    )
+
+    # --- SYNTHETIC PRODUCTS ---
+    parser.add_argument(
+        "--products",
+        type=int,
+        default=8,
+        help="Number of products downloaded by every path"
+    )
+
+    parser.add_argument(
+        "--size",
+        type=float,
+        default=32,
+        help="Approximate size of every synthetic product, in MB"
+    )
+
+    # --- FAULTS ---
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds added to every request to the stand-in"
+    )
+
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of eodata requests answered with 403/429"
+    )
+
+    parser.add_argument(
+        "--drop-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of eodata downloads whose connection is dropped halfway"
+    )
+
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed of the injected faults and of the synthetic product"
+    )
+
+    # --- DOWNLOADER ---
+    parser.add_argument(
+        "--paths",
+        nargs="+",
+        choices=["serial", "concurrent", "bbox"],
+        default=["serial", "concurrent"],
+        help="Download paths to benchmark"
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Products/objects downloaded at once by the concurrent and bbox paths"
+    )
+
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        default=downloader.config["s3_max_connections"],
+        help="Maximum number of simultaneous connections to the stand-in"
+    )
+
+    parser.add_argument(
+        "--max-bandwidth",
+        type=float,
+        default=0,
+        help="Maximum bandwidth, in MB/s (0 = unlimited, to measure the downloader itself)"
+    )
+
+    parser.add_argument(
+        "--part-size",
+        type=float,
+        default=downloader.config["transfer_part_size"],
+        help="Size of the byte ranges, in MB"
+    )
+
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=downloader.config["transfer_max_concurrency"],
+        help="Byte ranges of the same object downloaded at once"
+    )
+
+    parser.add_argument(
+        "--backoff",
+        type=float,
+        default=0.1,
+        help="Base delay of the backoff after a 403/429, in seconds (CDSE needs much more)"
+    )
+
+    parser.add_argument(
+        "--bbox",
+        nargs=4,
+        type=float,
+        default=[-10, 35.5, 4.5, 44],
+        metavar=("LON_MIN", "LAT_MIN", "LON_MAX", "LAT_MAX"),
+        help="Window read by the bbox path"
+    )
+
+    # --- OUTPUT ---
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=None,
+        help="JSON file where the results are saved"
+    )
+
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Only start the stand-in, until Ctrl+C"
+    )
+
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=0,
+        help="Port of the stand-in (0 = any free port)"
+    )
+
+    return parser.parse_args()
+
+
+def f_Synthetic_NC(route_to_NC, size, seed=0):
+    """
+    Writes a synthetic NDVI product of about `size` MB, with the variables,
+    attributes and chunked/compressed layout of the CLMS files. The layers are
+    random, so the compression barely reduces their size.
+
+    Returns
+    -------
+    data : bytes
+        Content of the written file.
+    """
+    import xarray as xr
+
+    downloader.f_Running(f_Synthetic_NC)
+
+    # Four uint8 layers of ny x 2ny pixels
+    ny = max(64, int((size * 1e6 / 8) ** 0.5))
+    nx = 2 * ny
+    rng = np.random.default_rng(seed)
+
+    def layer(high):
+        return rng.integers(0, high, (1, ny, nx), dtype=np.uint8)
+
+    valid_range = np.array([0, 250], dtype=np.uint8)
+    ds = xr.Dataset(
+        {
+            "NDVI": (("time", "lat", "lon"), layer(256), {
+                "scale_factor": 0.004, "add_offset": -0.08, "_FillValue": np.uint8(255),
+                "flag_values": np.array([252, 253, 254, 255], dtype=np.uint8),
+                "flag_meanings": "Unknown Snow Water Missing", "valid_range": valid_range,
+            }),
+            "NDVI_unc": (("time", "lat", "lon"), layer(256), {"scale_factor": 0.004, "valid_range": valid_range}),
+            "NOBS": (("time", "lat", "lon"), layer(33)),
+            "QFLAG": (("time", "lat", "lon"), layer(256)),
+        },
+        coords={
+            "time": [np.datetime64("2020-01-01")],
+            "lat": np.linspace(80, -60, ny),
+            "lon": np.linspace(-180, 180, nx),
+        },
+    )
+    encoding = {name: {"zlib": True, "complevel": 1, "chunksizes": (1, min(ny, 1024), min(nx, 1024))} for name in ds.data_vars}
+    ds.to_netcdf(route_to_NC, format="NETCDF4", engine="netcdf4", encoding=encoding)
+
+    return Path(route_to_NC).read_bytes()
+
+
+class Faults:
+    """
+    Faults injected by the stand-in: latency in every request, and 403/429
+    answers and dropped connections in a fraction of the eodata requests.
+    The draws come from a seeded generator, so runs can be repeated.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, drop_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """
+        Returns
+        -------
+        fault : int, str or None
+            403 or 429 (answer with that error), "drop" (drop the connection halfway) or None.
+        """
+        with self._lock:
+            value = self._random.random()
+            if value < self.error_rate:
+                return self._random.choice((403, 429))
+            if value < self.error_rate + self.drop_rate:
+                return "drop"
+            return None
+
+
+class CDSEStandIn(http_server.ThreadingHTTPServer):
+    """
+    Local stand-in of the CDSE services used by Launch_me_to_download_NDVI.py,
+    served from 127.0.0.1:
+
+      - Identity server: issues access and refresh tokens.
+      - OData catalogue: answers the single-product and the paged bulk queries.
+      - S3 keys manager: creates and deletes temporary S3 keys.
+      - Catalogue CSV: with ETag, so conditional requests get a 304.
+      - eodata: a minimal S3 endpoint (ListObjects, HEAD, ranged GET with If-Match)
+        that serves `data` under the name of every product.
+
+    Counters of the requests, errors and served bytes are kept in `counters`.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, data, products, faults=None, port=0):
+        super().__init__(("127.0.0.1", port), StandInHandler)
+        self.data = data
+        self.etag = f'"{hashlib.md5(data).hexdigest()}"'
+        self.products = products
+        self.faults = faults if faults is not None else Faults()
+        self.url = f"http://127.0.0.1:{self.server_address[1]}"
+        self.keys = set()
+        self.counters = {"requests": 0, "errors": 0, "drops": 0, "bytes": 0}
+        self._lock = threading.Lock()
+        self._thread = None
+
+        # Every product is a folder with a single NC file, as in eodata
+        self.objects = {
+            f"{self.s3_path(name).split('/', 2)[2]}/{name[:-3]}.nc": name
+            for name in products
+        }
+
+    def count(self, **increments):
+        with self._lock:
+            for counter, value in increments.items():
+                self.counters[counter] = self.counters[counter] + value
+
+    def reset_counters(self):
+        with self._lock:
+            self.counters = dict.fromkeys(self.counters, 0)
+
+    def s3_path(self, eo_product_name):
+        date = downloader.f_Date_of_product(eo_product_name)
+        return f"/{standin['bucket']}/{standin['s3_prefix']}/{date:%Y/%m/%d}/{eo_product_name}"
+
+    def config(self, base_config):
+        """
+        Returns a copy of base_config (the config of the downloader) pointing to the stand-in.
+        """
+        return dict(
+            base_config,
+            auth_server_url=self.url + standin["auth_path"],
+            odata_base_url=self.url + standin["odata_path"],
+            catalogue_csv_url=self.url + standin["catalogue_csv_path"],
+            s3_endpoint_url=self.url,
+            s3_keys_manager_url=self.url + standin["s3_keys_manager_path"],
+            s3_keys_propagation_delay=0,
+        )
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StandInHandler(http_server.BaseHTTPRequestHandler):
+    """
+    Routes every request to the stand-in service it belongs to.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # Keep the output of the benchmark clean
+        pass
+
+    # --- HELPERS ---
+    def _send(self, status, body=b"", content_type="application/json", headers=None):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+        elif isinstance(body, str):
+            body = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _send_s3_error(self, status, code, message):
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f"<Error><Code>{code}</Code><Message>{xml_escape(message)}</Message></Error>"
+        )
+        self._send(status, body, "application/xml")
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def _route(self):
+        self.server.count(requests=1)
+        if self.server.faults.latency > 0:
+            time.sleep(self.server.faults.latency)
+        url = urllib_parse.urlsplit(self.path)
+        return urllib_parse.unquote(url.path), urllib_parse.parse_qs(url.query)
+
+    # --- METHODS ---
+    def do_POST(self):
+        path, query = self._route()
+        form = urllib_parse.parse_qs(self._read_body().decode())
+
+        if path == standin["auth_path"]:
+            if form.get("grant_type", [""])[0] not in ("password", "refresh_token"):
+                return self._send(400, {"error": "unsupported_grant_type"})
+            return self._send(200, {
+                "access_token": uuid.uuid4().hex,
+                "expires_in": standin["token_expires_in"],
+                "refresh_token": uuid.uuid4().hex,
+                "refresh_expires_in": 6 * standin["token_expires_in"],
+                "token_type": "Bearer",
+            })
+
+        if path == standin["s3_keys_manager_path"]:
+            access_id = uuid.uuid4().hex[:20]
+            self.server.keys.add(access_id)
+            return self._send(200, {"access_id": access_id, "secret": uuid.uuid4().hex})
+
+        self._send(404, {"error": "not found"})
+
+    def do_DELETE(self):
+        path, query = self._route()
+        prefix = standin["s3_keys_manager_path"] + "/access_id/"
+        if path.startswith(prefix):
+            access_id = path[len(prefix):]
+            if access_id in self.server.keys:
+                self.server.keys.discard(access_id)
+                return self._send(204)
+        self._send(404, {"error": "not found"})
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        path, query = self._route()
+
+        if path == standin["odata_path"]:
+            return self._odata(query)
+        if path == standin["catalogue_csv_path"]:
+            return self._catalogue_csv()
+        if path == f"/{standin['bucket']}" or path.startswith(f"/{standin['bucket']}/"):
+            # Only the S3 keys created by the keys manager (and not deleted) are accepted
+            match = re.search(r"Credential=([^/]+)/", self.headers.get("Authorization", ""))
+            if match is None or match.group(1) not in self.server.keys:
+                return self._send_s3_error(403, "InvalidAccessKeyId", "The S3 keys do not exist")
+        if path == f"/{standin['bucket']}" or path == f"/{standin['bucket']}/":
+            return self._s3_list(query)
+        if path.startswith(f"/{standin['bucket']}/"):
+            return self._s3_object(path.split("/", 2)[2])
+
+        self._send(404, {"error": "not found"})
+
+    # --- SERVICES ---
+    def _odata(self, query):
+        odata_filter = query.get("$filter", [""])[0]
+        products = sorted(self.server.products, key=downloader.f_Date_of_product)
+
+        # Single product: $filter=Name eq '<name>'
+        match = re.fullmatch(r"Name eq '([^']+)'", odata_filter.strip())
+        if match is not None:
+            products = [name for name in products if name == match.group(1)]
+        else:
+            match = re.search(r"startswith\(Name,'([^']*)'\)", odata_filter)
+            if match is not None:
+                products = [name for name in products if name.startswith(match.group(1))]
+
+        skip = int(query.get("$skip", ["0"])[0])
+        top = int(query.get("$top", ["20"])[0])
+        self._send(200, {"value": [
+            {
+                "Id": str(uuid.uuid5(uuid.NAMESPACE_URL, name)),
+                "Name": name,
+                "S3Path": self.server.s3_path(name),
+                "ContentDate": {"Start": f"{downloader.f_Date_of_product(name):%Y-%m-%dT%H:%M:%S.000Z}"},
+            }
+            for name in products[skip:skip + top]
+        ]})
+
+    def _catalogue_csv(self):
+        rows = ["id;name;s3path"] + [
+            f"{index};{name};{self.server.s3_path(name)}" for index, name in enumerate(sorted(self.server.products))
+        ]
+        body = ("\n".join(rows) + "\n").encode()
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        if self.headers.get("If-None-Match") == etag:
+            return self._send(304, headers={"ETag": etag})
+        self._send(200, body, "text/csv", {"ETag": etag})
+
+    def _s3_list(self, query):
+        prefix = query.get("prefix", [""])[0]
+        keys = sorted(key for key in self.server.objects if key.startswith(prefix))
+        contents = "".join(
+            "<Contents>"
+            f"<Key>{xml_escape(key)}</Key>"
+            "<LastModified>2020-01-01T00:00:00.000Z</LastModified>"
+            f"<ETag>{xml_escape(self.server.etag)}</ETag>"
+            f"<Size>{len(self.server.data)}</Size>"
+            "<StorageClass>STANDARD</StorageClass>"
+            "</Contents>"
+            for key in keys
+        )
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+            f"<Name>{standin['bucket']}</Name><Prefix>{xml_escape(prefix)}</Prefix>"
+            f"<KeyCount>{len(keys)}</KeyCount><MaxKeys>1000</MaxKeys><IsTruncated>false</IsTruncated>"
+            f"{contents}</ListBucketResult>"
+        )
+        self._send(200, body, "application/xml")
+
+    def _s3_object(self, key):
+        if key not in self.server.objects:
+            return self._send_s3_error(404, "NoSuchKey", f"{key} does not exist")
+
+        fault = self.server.faults.draw()
+        if fault in (403, 429):
+            self.server.count(errors=1)
+            code = "AccessDenied" if fault == 403 else "TooManyRequests"
+            return self._send_s3_error(fault, code, "Injected by the stand-in")
+
+        if self.headers.get("If-Match") not in (None, self.server.etag):
+            return self._send_s3_error(412, "PreconditionFailed", "The ETag does not match")
+
+        data = self.server.data
+        start, end = 0, len(data) - 1
+        status = 200
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match is not None:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), end) if match.group(2) else end
+            if start > end:
+                return self._send_s3_error(416, "InvalidRange", "The range is not satisfiable")
+            status = 206
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("ETag", self.server.etag)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Last-Modified", "Wed, 01 Jan 2020 00:00:00 GMT")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+
+        body = memoryview(data)[start:end + 1]
+        if fault == "drop" and len(body) > 1:
+            # Send half of the body and drop the connection
+            self.server.count(drops=1, bytes=len(body) // 2)
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+
+        self.wfile.write(body)
+        self.server.count(bytes=len(body))
+
+
+def f_Product_names(number_of_products):
+    """
+    Returns
+    -------
+    names : list
+        Names of number_of_products dekadal products, as listed in the catalogue CSV.
+    """
+    names = []
+    date = standin["first_date"]
+    while len(names) < number_of_products:
+        for day in (1, 11, 21):
+            if len(names) < number_of_products:
+                names.append(f"c_gls_NDVI300_{date:%Y%m}{day:02d}0000_GLOBE_OLCI_V3.0.1_nc")
+        date = (date + datetime.timedelta(days=32)).replace(day=1)
+    return names
+
+
+def f_Benchmark_path(path, server, args):
+    """
+    Downloads every product of the stand-in with one download path of
+    Launch_me_to_download_NDVI.py, into a temporary folder.
+
+    Returns
+    -------
+    result : dict
+        Products downloaded and failed, seconds, bytes served, products/hour, MB/s,
+        and the requests, injected errors and dropped connections seen by the stand-in.
+    """
+    downloader.f_Running(f_Benchmark_path)
+
+    products = sorted(server.products)
+    output_dir = Path(tempfile.mkdtemp(prefix=f"ndvi_benchmark_{path}_"))
+    try:
+        with downloader.CDSESession(server.config(downloader.config), "benchmark", "benchmark") as session:
+            # Log in, create the S3 keys and resolve the products outside of the timed section
+            S3_paths = {
+                name: details["S3Path"]
+                for name, details in downloader.get_eo_products_details_in_bulk(session.config, session.headers, products).items()
+            }
+            session.s3_resource
+
+            limiter = downloader.QuotaLimiter(
+                max_connections=args.max_connections,
+                max_bandwidth=args.max_bandwidth * 1e6 if args.max_bandwidth > 0 else None,
+                base_delay=args.backoff,
+                max_delay=10 * args.backoff,
+                renew_s3_keys=session.renew_s3_keys,
+            )
+            transfer_config = downloader.f_Transfer_config(args.part_size, args.max_concurrency)
+
+            server.reset_counters()
+            start = time.perf_counter()
+
+            if path == "serial":
+                failed = []
+                for name in products:
+                    try:
+                        downloader.f_Downloader(session, name, str(output_dir), S3_paths[name], limiter, transfer_config=transfer_config)
+                    except RuntimeError:
+                        failed.append(name)
+            else:
+                failed = downloader.f_Download_concurrently(
+                    session, products, S3_paths, str(output_dir), args.workers, limiter, transfer_config,
+                    bbox=args.bbox if path == "bbox" else None,
+                )
+
+            seconds = time.perf_counter() - start
+            counters = dict(server.counters)
+
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    downloaded = len(products) - len(failed)
+    return {
+        "path": path,
+        "products": downloaded,
+        "failed": len(failed),
+        "seconds": round(seconds, 3),
+        "bytes": counters["bytes"],
+        "products_per_hour": round(downloaded / seconds * 3600, 1) if seconds > 0 else None,
+        "MBps": round(counters["bytes"] / seconds / 1e6, 2) if seconds > 0 else None,
+        "requests": counters["requests"],
+        "injected_errors": counters["errors"],
+        "dropped_connections": counters["drops"],
+    }
+
+
+def f_Print_results(results):
+    print()
+    print(f"           {'path':<11} {'products':>8} {'failed':>6} {'seconds':>8} {'MB':>9} {'products/h':>11} {'MB/s':>8} {'requests':>8} {'errors':>6} {'drops':>5}")
+    for result in results:
+        print(
+            f"           {result['path']:<11} {result['products']:>8} {result['failed']:>6} {result['seconds']:>8.2f}"
+            f" {result['bytes'] / 1e6:>9.1f} {result['products_per_hour'] or 0:>11.0f} {result['MBps'] or 0:>8.2f}"
+            f" {result['requests']:>8} {result['injected_errors']:>6} {result['dropped_connections']:>5}"
+        )
+
+
+# %% MAIN FUNCTION
+def main():
+    print(__doc__)
+    print("RUN THE SCRIPT:")
+    downloader.f_Running(main)
+
+    # %% LOAD THE INPUTS
+    args = parse_arguments()
+
+    # %% BUILD THE SYNTHETIC PRODUCT
+    with tempfile.TemporaryDirectory(prefix="ndvi_benchmark_") as route_to_tmp:
+        data = f_Synthetic_NC(Path(route_to_tmp) / "synthetic.nc", args.size, args.seed)
+    print(f"           - Synthetic product of {len(data) / 1e6:.1f} MB")
+
+    # %% START THE STAND-IN
+    faults = Faults(args.latency, args.error_rate, args.drop_rate, args.seed)
+    server = CDSEStandIn(data, f_Product_names(args.products), faults, args.port).start()
+    print(f"           - Stand-in of CDSE listening on {server.url}")
+
+    try:
+        if args.serve:
+            print("           - Set these entries in the config of Launch_me_to_download_NDVI.py (Ctrl+C to stop):")
+            standin_config = server.config(downloader.config)
+            for name in ("auth_server_url", "odata_base_url", "catalogue_csv_url", "s3_endpoint_url", "s3_keys_manager_url", "s3_keys_propagation_delay"):
+                print(f'               "{name}": {standin_config[name]!r},')
+            while True:
+                time.sleep(3600)
+
+        # %% RUN THE BENCHMARKS
+        # The output of the downloader is silenced, so only the results are printed
+        downloader.config["quiet"] = True
+        results = []
+        for path in args.paths:
+            print(f"           - Benchmarking the {path} path")
+            results.append(f_Benchmark_path(path, server, args))
+
+    except KeyboardInterrupt:
+        return
+
+    finally:
+        server.stop()
+
+    # %% SAVE THE RESULTS
+    f_Print_results(results)
+    if args.output is not None:
+        args.output.write_text(json.dumps({"arguments": {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()}, "results": results}, indent=1))
+        print(f"           - Results saved in {args.output}")
+
+    # %% ENDSCRIPT
+    print()
+    print("         Endscript");
+
+
+# %% RING BELL
+if __name__ == "__main__":
+    main()
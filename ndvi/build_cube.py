@@ -0,0 +1,474 @@
+# -*- coding: utf-8 -*-
+"""
+TRACKING:
+    https://doi.org/10.5281/zenodo.18620398
+    Product developped by LABIF-UCO ("https://labif.es/").
+    Version 20261017a (last modified by Juanan).
+
+OBJECTIVE:
+    To gather the filtered dekads (see Launch_me_to_filter.py) in a single time-series cube (time, lat, lon), chunked for time-series access, so the NDVI history of a pixel comes back in a few chunk reads instead of one read per NC file.
+
+INFORMATION:
+    This script does as follows:
+
+    1) Looks for the filtered NC files (in Section_PROCESSING\\Outputs_filtered) that are not in the cube yet (by default, Outputs_cube\\NDVI_cube.zarr).
+    2) Appends every new dekad, in order of date, to the staging area of the cube: a Zarr array with one dekad per chunk, so an append only writes the new dekad.
+    3) Once the staging area holds a whole time chunk (by default, 36 dekads, i.e. a year), moves it to the cube: a Zarr array with chunks long in time and small in space (by default, 36 x 128 x 128), so every chunk of the cube is written once, and completely.
+    4) The cube and the staging area are read together as a single dataset (see f_Open_cube). The NDVI is stored as the native uint8 digital numbers, with the scale_factor, add_offset and _FillValue of the product, so it is CF-decodable.
+
+EXAMPLES:
+
+    run Launch_me_to_build_cube.py
+        Appends the new filtered dekads to the cube.
+
+    run Launch_me_to_build_cube.py --start 2014-01-01 --end 2023-12-31 --time-chunk 108 --space-chunk 64
+        Builds a cube of ten years, with chunks of three years of 64 x 64 pixels.
+
+    run Launch_me_to_build_cube.py --flush
+        Appends the new filtered dekads, and moves the whole staging area to the cube (the last time chunk of the cube may stay incomplete).
+
+    run Launch_me_to_build_cube.py --rebuild
+        Deletes the cube and builds it again from every filtered dekad.
+
+WARNINGS:
+    The cube is append-only: a dekad older than the last dekad of the cube, a dekad filtered with other parameters or on another grid, and a dekad filtered again after it was appended are reported and left out. Use --rebuild to take them in.
+    The chunks of the cube (--time-chunk, --space-chunk and --staging-chunk) are fixed when the cube is created.
+    Requires zarr (version 2).
+"""
+
+# %% IMPORT THE LIBRARIES
+from pathlib import Path as Path
+
+import argparse as argparse
+import os as os
+import shutil as shutil
+import time as time
+
+import numpy as np
+
+from ndvi import download as downloader
+from ndvi import filter as NDVI_filter
+
+
+# %% PREVIOUS INFORMATION
+# This Script requires the following information to run smoothly:
+# Input 1: chunks of the cube: long in time (36 dekads, a year), small in space
+Time_chunk = 36
+Space_chunk = 128
+
+# Input 2: chunks of the staging area: one dekad, large in space (a multiple of Space_chunk)
+Staging_chunk = 1024
+
+# Input 3: compression of the cube (uint8 digital numbers): Blosc, zstd, with bit shuffle (numcodecs.Blosc.BITSHUFFLE)
+Compressor = {"cname": "zstd", "clevel": 5, "shuffle": 2}
+
+# Input 4: time units of the cube (the dekads start at 00:00)
+Time_units = "days since 1970-01-01"
+
+
+# %% ANCILLARY FUNCTIONS
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Append the filtered dekads to a time-series cube (Zarr)"
+    )
+
+    # --- CUBE ---
+    parser.add_argument(
+        "--cube",
+        type=Path,
+        default=None,
+        help="Route to the cube. By default, Outputs_cube/NDVI_cube.zarr"
+    )
+
+    parser.add_argument(
+        "--time-chunk",
+        type=int,
+        default=Time_chunk,
+        help="Dekads per chunk of the cube (only when the cube is created)"
+    )
+
+    parser.add_argument(
+        "--space-chunk",
+        type=int,
+        default=Space_chunk,
+        help="Pixels per side of the chunks of the cube (only when the cube is created)"
+    )
+
+    parser.add_argument(
+        "--staging-chunk",
+        type=int,
+        default=Staging_chunk,
+        help="Pixels per side of the chunks of the staging area, a multiple of --space-chunk (only when the cube is created)"
+    )
+
+    parser.add_argument(
+        "--flush",
+        action="store_true",
+        help="Move the whole staging area to the cube, even if it does not fill a time chunk"
+    )
+
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Delete the cube and build it again from every filtered dekad"
+    )
+
+    # Dates of the dekads appended
+    NDVI_filter.add_selection_arguments(parser)
+
+    return parser.parse_args()
+
+
+def f_Define_the_directories():
+    """
+    Returns
+    -------
+    Directories : dict
+        Directories of the filter (see NDVI_filter.f_Define_the_directories), and
+        Outputs_cube, where the cube is saved.
+    """
+    Directories = NDVI_filter.f_Define_the_directories()
+    Directories["Outputs_cube"] = Directories["General"] / "Outputs_cube"
+    Directories["Outputs_cube"].mkdir(parents=True, exist_ok=True)
+
+    return Directories
+
+
+def f_JSON_attrs(attrs):
+    """
+    Returns
+    -------
+    attrs : dict
+        attrs with numpy values as plain Python values, as Zarr saves them in JSON.
+    """
+    return {key: value.tolist() if isinstance(value, (np.ndarray, np.generic)) else value for key, value in attrs.items()}
+
+
+def f_Dekad_record(route_to_filtered_NC):
+    """
+    Returns
+    -------
+    record : dict
+        Name, date (days since 1970-01-01, from the name), filter parameters and
+        checksum of the input of a filtered NC file (see NDVI_filter.f_Provenance).
+    """
+    import xarray as xr
+
+    date = downloader.f_Date_of_product(route_to_filtered_NC.name)
+    with xr.open_dataset(route_to_filtered_NC, decode_cf=False) as filtered_NC_ds:
+        attrs = filtered_NC_ds.attrs
+
+    return {
+        "name": route_to_filtered_NC.name,
+        "date": int((np.datetime64(date, "D") - np.datetime64("1970-01-01", "D")).astype(int)),
+        "filter_parameters": attrs.get("filter_parameters"),
+        "input_checksum": attrs.get("input_checksum"),
+    }
+
+
+def f_Create_cube(route_to_cube, route_to_filtered_NC, filter_parameters, time_chunk, space_chunk, staging_chunk):
+    """
+    Creates the cube with the grid and the attributes of a filtered NC file: the
+    arrays of the cube (chunks of time_chunk x space_chunk x space_chunk) at the
+    root, and those of the staging area (chunks of 1 x staging_chunk x
+    staging_chunk) in the group "staging". Both are empty (no dekads).
+    """
+    import numcodecs as numcodecs
+    import xarray as xr
+    import zarr as zarr
+
+    compressor = numcodecs.Blosc(**Compressor)
+
+    print(f"         Running: {f_Create_cube.__name__}()")
+
+    if staging_chunk % space_chunk:
+        raise ValueError(f"--staging-chunk ({staging_chunk}) must be a multiple of --space-chunk ({space_chunk})")
+
+    with xr.open_dataset(route_to_filtered_NC, decode_cf=False) as filtered_NC_ds:
+        NDVI = filtered_NC_ds["NDVI"]
+        time_dim, *space_dims = NDVI.dims
+        NDVI_attrs = {key: value for key, value in NDVI.attrs.items() if key != "_FillValue"}
+        fill_value = int(NDVI.attrs.get("_FillValue", 255))
+        coordinates = {dim: (filtered_NC_ds[dim].values, f_JSON_attrs(filtered_NC_ds[dim].attrs)) for dim in space_dims}
+
+    root = zarr.open_group(str(route_to_cube), mode="w")
+    root.attrs.update({
+        "filter_parameters": filter_parameters,
+        "time_chunk": time_chunk,
+        "space_chunk": space_chunk,
+        "staging_chunk": staging_chunk,
+        "dekads": [],
+    })
+
+    for group, chunks in ((root, (time_chunk, space_chunk, space_chunk)), (root.create_group("staging"), (1, staging_chunk, staging_chunk))):
+        group.attrs["dekads"] = []
+
+        for dim, (values, attrs) in coordinates.items():
+            array = group.array(dim, values, chunks=values.shape, compressor=compressor)
+            array.attrs.update({**attrs, "_ARRAY_DIMENSIONS": [dim]})
+
+        array = group.zeros("time", shape=(0,), chunks=(4096,), dtype="int32", compressor=compressor)
+        array.attrs.update({"units": Time_units, "calendar": "proleptic_gregorian", "_ARRAY_DIMENSIONS": [time_dim]})
+
+        shape = (0, *(values.size for values, _ in coordinates.values()))
+        array = group.full("NDVI", fill_value=fill_value, shape=shape, chunks=(chunks[0], *(min(size, length) for size, length in zip(chunks[1:], shape[1:]))), dtype="uint8", compressor=compressor)
+        array.attrs.update({**f_JSON_attrs(NDVI_attrs), "_ARRAY_DIMENSIONS": [time_dim, *space_dims]})
+
+    print(f"           - Cube created in {route_to_cube}: chunks of {root['NDVI'].chunks}, staging chunks of {root['staging/NDVI'].chunks}")
+    return root
+
+
+def f_Recover(root):
+    """
+    Brings the cube back to its last complete state. Every change is committed by
+    the "dekads" attribute of its group, written last, so the dekads written
+    after it (an interrupted append or flush) are dropped, and a staging area
+    already moved to the cube (an interrupted flush) is emptied.
+    """
+    for group in (root, root["staging"]):
+        length = len(group.attrs["dekads"])
+        if group["time"].shape[0] != length or group["NDVI"].shape[0] != length:
+            print(f"           - WARNING: Dropping an interrupted write in {group.name}")
+            group["time"].resize(length)
+            group["NDVI"].resize(length, *group["NDVI"].shape[1:])
+
+    names_in_cube = {record["name"] for record in root.attrs["dekads"]}
+    if any(record["name"] in names_in_cube for record in root["staging"].attrs["dekads"]):
+        print("           - WARNING: Emptying a staging area already moved to the cube")
+        f_Empty_staging(root)
+
+
+def f_Empty_staging(root):
+    staging = root["staging"]
+    staging.attrs["dekads"] = []
+    staging["time"].resize(0)
+    staging["NDVI"].resize(0, *staging["NDVI"].shape[1:])
+
+
+def f_Tiles(shape, size):
+    """
+    Yields the (rows, columns) slices that cover a grid of shape, in tiles of
+    size x size pixels.
+    """
+    for row in range(0, shape[0], size):
+        for column in range(0, shape[1], size):
+            yield slice(row, min(row + size, shape[0])), slice(column, min(column + size, shape[1]))
+
+
+def f_Check_dekad(root, record, route_to_filtered_NC):
+    """
+    Returns
+    -------
+    problem : str or None
+        Why the dekad can not be appended to the cube (None if it can).
+    """
+    import xarray as xr
+
+    dekads = root.attrs["dekads"] + root["staging"].attrs["dekads"]
+
+    if record["date"] is None:
+        return "no date in its name"
+    if dekads and record["date"] <= dekads[-1]["date"]:
+        return "older than the last dekad of the cube"
+    if record["filter_parameters"] != root.attrs["filter_parameters"]:
+        return "filtered with other parameters than the cube"
+
+    with xr.open_dataset(route_to_filtered_NC, decode_cf=False) as filtered_NC_ds:
+        for dim in filtered_NC_ds["NDVI"].dims[1:]:
+            if not np.array_equal(filtered_NC_ds[dim].values, root[dim][:]):
+                return f"on another grid than the cube ({dim})"
+
+    return None
+
+
+def f_Append_to_staging(root, record, route_to_filtered_NC):
+    """
+    Appends a filtered dekad to the staging area, tile by tile (the chunks of the
+    staging area), as uint8 digital numbers. The excluded pixels (NaN, if the
+    dekad was saved as float32) take the _FillValue of the cube.
+    """
+    import xarray as xr
+
+    staging = root["staging"]
+    NDVI = staging["NDVI"]
+    index = NDVI.shape[0]
+
+    NDVI.resize(index + 1, *NDVI.shape[1:])
+    with xr.open_dataset(route_to_filtered_NC, decode_cf=False) as filtered_NC_ds:
+        filtered_NDVI = filtered_NC_ds["NDVI"]
+        for rows, columns in f_Tiles(NDVI.shape[1:], NDVI.chunks[1]):
+            tile = filtered_NDVI[0, rows, columns].values
+            if tile.dtype != np.uint8:
+                tile = np.where(np.isnan(tile), NDVI.fill_value, tile).astype(np.uint8)
+            NDVI[index, rows, columns] = tile
+
+    staging["time"].append(np.array([record["date"]], dtype="int32"))
+
+    # Commit
+    staging.attrs["dekads"] = staging.attrs["dekads"] + [{key: record[key] for key in ("name", "date", "input_checksum")}]
+
+
+def f_Flush_staging(root):
+    """
+    Moves the staging area to the cube, tile by tile (the chunks of the staging
+    area, so the memory is dekads x staging_chunk² bytes). When the staging
+    area completes the last time chunk of the cube, every chunk of the cube is
+    written once.
+    """
+    print(f"         Running: {f_Flush_staging.__name__}()")
+    start = time.perf_counter()
+
+    staging = root["staging"]
+    NDVI = root["NDVI"]
+    index, count = NDVI.shape[0], staging["NDVI"].shape[0]
+
+    NDVI.resize(index + count, *NDVI.shape[1:])
+    for rows, columns in f_Tiles(NDVI.shape[1:], staging["NDVI"].chunks[1]):
+        NDVI[index:, rows, columns] = staging["NDVI"][:, rows, columns]
+
+    root["time"].append(staging["time"][:])
+
+    # Commit: first the cube, then the staging area (see f_Recover)
+    root.attrs["dekads"] = root.attrs["dekads"] + staging.attrs["dekads"]
+    f_Empty_staging(root)
+
+    end = time.perf_counter()
+    print(f"           - {count} dekads moved to the cube ({NDVI.shape[0]} dekads). The process took {end - start:.2f} seconds")
+
+
+def f_Is_time_to_flush(root):
+    """
+    Returns
+    -------
+    is_time_to_flush : bool
+        True once the staging area completes the last time chunk of the cube.
+    """
+    time_chunk = root["NDVI"].chunks[0]
+    missing = time_chunk - root["NDVI"].shape[0] % time_chunk
+    return root["staging"]["NDVI"].shape[0] >= missing
+
+
+def f_Open_cube(route_to_cube, decode_cf=True):
+    """
+    Parameters
+    ----------
+    route_to_cube : WindowsPath
+        Route to the cube (see main).
+    decode_cf : bool
+        Decode the digital numbers to physical values (and the _FillValue to NaN),
+        and the time to dates.
+
+    Returns
+    -------
+    cube_ds : xarray.Dataset
+        NDVI of the cube and of its staging area, lazily (dask, along the chunks
+        of the cube), as a single time series.
+    """
+    import dask.array
+    import xarray as xr
+    import zarr as zarr
+
+    root = zarr.open_group(str(route_to_cube), mode="r")
+
+    parts = []
+    for group in (root, root["staging"]):
+        NDVI = group["NDVI"]
+        dims = NDVI.attrs["_ARRAY_DIMENSIONS"]
+        coordinates = {
+            dim: (dim, group[name][:], {key: value for key, value in group[name].attrs.items() if key != "_ARRAY_DIMENSIONS"})
+            for dim, name in zip(dims, ("time", *dims[1:]))
+        }
+        NDVI_attrs = {key: value for key, value in NDVI.attrs.items() if key != "_ARRAY_DIMENSIONS"}
+        parts.append(xr.Dataset({"NDVI": (dims, dask.array.from_zarr(NDVI), {**NDVI_attrs, "_FillValue": NDVI.fill_value})}, coords=coordinates))
+
+    cube_ds = xr.concat(parts, dim=dims[0]) if parts[1].sizes[dims[0]] else parts[0]
+
+    return xr.decode_cf(cube_ds) if decode_cf else cube_ds
+
+
+# %% MAIN FUNCTION
+def main():
+    print(__doc__)
+    print("RUN THE SCRIPT:")
+    print(f"         Running: {main.__name__}()")
+    start = time.perf_counter()
+
+    import zarr as zarr
+
+    # %% LOAD THE INPUTS
+    args = parse_arguments()
+
+    # %% DEFINE THE DIRECTORIES
+    Directories = f_Define_the_directories()
+    route_to_cube = args.cube if args.cube is not None else Directories["Outputs_cube"] / "NDVI_cube.zarr"
+
+    if args.rebuild and route_to_cube.exists():
+        print(f"           - Deleting {route_to_cube}")
+        shutil.rmtree(route_to_cube)
+
+    # %% LIST THE FILTERED DEKADS
+    list_of_filtered_NC_files = NDVI_filter.f_list_of_processed_NC_files(Directories)
+    records = []
+    for every_NC_file in list_of_filtered_NC_files:
+        date = downloader.f_Date_of_product(every_NC_file)
+        if date is None or (args.start is not None and date < args.start) or (args.end is not None and date > args.end):
+            continue
+        records.append(f_Dekad_record(Directories["Outputs_filtered"] / every_NC_file))
+    records.sort(key=lambda record: record["date"])
+
+    # %% OPEN THE CUBE
+    if route_to_cube.exists():
+        root = zarr.open_group(str(route_to_cube), mode="r+")
+        f_Recover(root)
+    elif records:
+        root = f_Create_cube(route_to_cube, Directories["Outputs_filtered"] / records[0]["name"], records[0]["filter_parameters"], args.time_chunk, args.space_chunk, args.staging_chunk)
+    else:
+        print("           - WARNING: There are no filtered NC files to build the cube")
+        return
+
+    # Dekads in the cube that were filtered again after they were appended
+    in_cube = {record["name"]: record for record in root.attrs["dekads"] + root["staging"].attrs["dekads"]}
+    changed = [record["name"] for record in records if record["name"] in in_cube and record["input_checksum"] != in_cube[record["name"]]["input_checksum"]]
+    if changed:
+        print(f"           - WARNING: {len(changed)} dekads of the cube were filtered again from another input. Use --rebuild to take them in")
+
+    bucket_list = [record for record in records if record["name"] not in in_cube]
+    print(f"           - {len(in_cube)} dekads in the cube. {len(bucket_list)} new filtered dekads")
+
+    # %% APPEND THE NEW DEKADS
+    appended = 0
+    for counter, record in enumerate(bucket_list, start=1):
+        route_to_filtered_NC = Directories["Outputs_filtered"] / record["name"]
+        problem = f_Check_dekad(root, record, route_to_filtered_NC)
+        if problem is not None:
+            print(f"           - WARNING: {record['name']} left out ({problem})")
+            continue
+
+        f_Append_to_staging(root, record, route_to_filtered_NC)
+        appended += 1
+        print(f"           - {record['name']} appended. {counter} of {len(bucket_list)} dekads done.")
+
+        # Once the staging area completes a time chunk, move it to the cube
+        if f_Is_time_to_flush(root):
+            f_Flush_staging(root)
+
+    if args.flush and root["staging"]["NDVI"].shape[0]:
+        f_Flush_staging(root)
+
+    # %% SUMMARY
+    end = time.perf_counter()
+    in_cube, staged = root["NDVI"].shape[0], root["staging"]["NDVI"].shape[0]
+    print()
+    print(f"           - {appended} dekads appended. The cube holds {in_cube} dekads, and the staging area {staged} dekads")
+    print(f"           - The history of a pixel takes {-(-in_cube // root['NDVI'].chunks[0])} chunk reads from the cube and {staged} from the staging area")
+    print(f"           - The process took {end - start:.2f} seconds")
+
+    # %% ENDSCRIPT
+    print()
+    print("         Endscript");
+
+
+# %% RING BELL
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2416 @@
+# -*- coding: utf-8 -*-
+"""
+TRACKING:
+    https://doi.org/10.5281/zenodo.18620398
+    Product developped by LABIF-UCO ("https://labif.es/").
+    Version 20260206a (last modified by Juanan).
+    The process includes scripts provided by Copernicus ("https://documentation.dataspace.copernicus.eu/APIs/S3.html").
+    
+OBJECTIVE:
+    To download all the products pending to download of the "Normalised Difference Vegetation Index 2014-present (raster 300 m), global, 10-daily – version 3" (DOI: "https://doi.org/10.2909/905223f4-2c3d-4cb6-ad8c-d6d065707465") product of CLMS.
+    
+INFORMATION:
+    https://land.copernicus.eu/en/products/vegetation/normalised-difference-vegetation-index-v3-0-300m 
+    Generated using European Union's Copernicus Land Monitoring Service information; doi.org/10.2909/905223f4-2c3d-4cb6-ad8c-d6d065707465.
+    
+WARNINGS:
+    The directory must contain a ".credentials.ini" file with your credentials to log in into CDSE (https://dataspace.copernicus.eu/).
+    This file must follow the next structure:
+        
+      [cdse]
+      username = username@example.org
+      password = MyPa5sWoRd
+
+    CDSE sets quotas and limitations for the downloads ("https://documentation.dataspace.copernicus.eu/Quotas.html"). Reaching these quotas and limitations triggers a Runtime Error while creating temporary S3 credentials (error #403). 
+"""
+
+# %% IMPORT THE LIBRARIES
+# boto3, requests and tqdm are imported by the functions that use them (e.g. a
+# worker that only needs f_Downloader does not pay for the rest at import)
+from pathlib import Path as Path
+
+import argparse as argparse
+import atexit as atexit
+from concurrent.futures import ThreadPoolExecutor as ThreadPoolExecutor, as_completed as as_completed
+import collections as collections
+import configparser as configparser
+import contextlib as contextlib
+import csv as csv
+import datetime as datetime
+import io as io
+import json as json
+import os as os
+import random as random
+import re as re
+import signal as signal
+import sqlite3 as sqlite3
+import sys as sys
+import threading as threading
+import time as time
+
+import ndvi as ndvi
+
+
+# %% PREVIOUS INFORMATION
+# This Script requires the following information to run smoothly:
+# Input 1: configuration
+config = {
+    "auth_server_url": "https://identity.dataspace.copernicus.eu/auth/realms/CDSE/protocol/openid-connect/token",
+    "odata_base_url": "https://catalogue.dataspace.copernicus.eu/odata/v1/Products",
+    "catalogue_csv_url": "https://s3.waw3-1.cloudferro.com/swift/v1/CatalogueCSV/bio-geophysical/vegetation_indices/ndvi_global_300m_10daily_v3/ndvi_global_300m_10daily_v3_nc.csv",
+    "s3_endpoint_url": "https://eodata.dataspace.copernicus.eu",
+    "s3_keys_manager_url": "https://s3-keys-manager.cloudferro.com/api/user/credentials",
+    "client_id": "cdse-public",
+    "token_refresh_margin": 60,  # Seconds before expiry at which the access token is refreshed
+    "s3_keys_propagation_delay": 5,  # Seconds that new S3 keys need before being accepted by eodata
+    "s3_keys_min_age": 60,  # Seconds before S3 keys rejected by eodata are renewed again (see CDSESession.renew_s3_keys)
+    "s3_max_pool_connections": 10,  # Size of the connection pool of the S3 client
+    "odata_collection": "CLMS",  # Collection that holds the NDVI 300 m products in the catalogue
+    "odata_page_size": 1000,  # Maximum $top accepted by the catalogue
+    "odata_date_margin_days": 20,  # Margin added to the date range of the bulk queries (ContentDate vs date in the name)
+    "s3_max_connections": 4,  # Concurrent connections allowed by CDSE to eodata (https://documentation.dataspace.copernicus.eu/Quotas.html)
+    "s3_max_bandwidth": 20,  # Bandwidth allowed by CDSE to eodata, in MB/s (https://documentation.dataspace.copernicus.eu/Quotas.html)
+    "transfer_part_size": 16,  # Size of the byte ranges in which the objects are downloaded, in MB
+    "transfer_max_concurrency": 4,  # Ranges of the same object downloaded at once
+    "bbox_variables": ["NDVI", "NDVI_unc", "NOBS", "QFLAG"],  # Variables read when only a bbox is downloaded
+    "job_max_attempts": 5,  # Attempts of every product before it is moved to the dead-letter list
+    "job_retry_delay": 30,  # Seconds before the first retry of a failed product (doubled after every attempt)
+    "quiet": False,  # If True, the functions do not print their name when they run (see --quiet)
+}
+
+
+# %% ANCILLARY FUNCTIONS
+
+def f_Running(function):
+    """
+    Prints the name of the running function, unless the script runs with --quiet.
+    """
+    if not config["quiet"]:
+        print(f"         Running: {function.__name__}()")
+
+
+class TransferStats:
+    """
+    Counters of the transfer of a single product, shared by the threads that download its objects.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.retries = 0
+        self.quota_errors = 0
+
+    def add(self, bytes=0, retries=0, quota_errors=0):
+        with self._lock:
+            self.bytes = self.bytes + bytes
+            self.retries = self.retries + retries
+            self.quota_errors = self.quota_errors + quota_errors
+
+
+class Metrics:
+    """
+    Per-stage timings and counters of the downloader.
+
+    Every observation is appended as a JSON line to route_to_jsonl (by
+    default, Ancillary/download_metrics.jsonl):
+
+        {"time": ..., "event": "stage", "stage": "token", "seconds": ...}
+        {"time": ..., "event": "product", "name": ..., "status": ..., "seconds": ..., "bytes": ...,
+         "throughput_MBps": ..., "retries": ..., "quota_errors": ...}
+        {"time": ..., "event": "summary", ...}
+
+    The stages are: token (login/refresh), s3_keys (creation of the S3 keys),
+    s3_keys_propagation (wait for the new keys), catalogue_csv, resolution
+    (OData lookups) and listing. write_prometheus() writes the totals in the
+    Prometheus textfile format (e.g. for node_exporter's textfile collector).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._route_to_jsonl = None
+        self._start = time.time()
+        self.stages = collections.defaultdict(lambda: {"seconds": 0.0, "calls": 0})
+        self.products = collections.Counter()
+        self.bytes = 0
+        self.retries = 0
+        self.quota_errors = 0
+
+    def open(self, route_to_jsonl):
+        self._route_to_jsonl = Path(route_to_jsonl)
+        self._start = time.time()
+
+    def _write(self, event):
+        event = dict(time=datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ"), **event)
+        if self._route_to_jsonl is not None:
+            with open(self._route_to_jsonl, "a", encoding="utf-8") as f:
+                f.write(json.dumps(event) + "\n")
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self.stages[stage]["seconds"] = self.stages[stage]["seconds"] + seconds
+            self.stages[stage]["calls"] = self.stages[stage]["calls"] + 1
+            self._write({"event": "stage", "stage": stage, "seconds": round(seconds, 6)})
+
+    @contextlib.contextmanager
+    def stage(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def product(self, name, status, seconds, stats):
+        with self._lock:
+            self.products[status] = self.products[status] + 1
+            self.bytes = self.bytes + stats.bytes
+            self.retries = self.retries + stats.retries
+            self.quota_errors = self.quota_errors + stats.quota_errors
+            self._write({
+                "event": "product",
+                "name": name,
+                "status": status,
+                "seconds": round(seconds, 3),
+                "bytes": stats.bytes,
+                "throughput_MBps": round(stats.bytes / seconds / 1e6, 3) if seconds > 0 else None,
+                "retries": stats.retries,
+                "quota_errors": stats.quota_errors,
+            })
+
+    def summary(self):
+        with self._lock:
+            seconds = time.time() - self._start
+            summary = {
+                "event": "summary",
+                "seconds": round(seconds, 3),
+                "products": dict(self.products),
+                "bytes": self.bytes,
+                "throughput_MBps": round(self.bytes / seconds / 1e6, 3) if seconds > 0 else None,
+                "retries": self.retries,
+                "quota_errors": self.quota_errors,
+                "stages": {stage: dict(values) for stage, values in self.stages.items()},
+            }
+            self._write(summary)
+            return summary
+
+    def write_prometheus(self, route_to_textfile):
+        summary = self.summary()
+        lines = [
+            "# HELP ndvi_download_stage_seconds_total Time spent in every stage of the downloader.",
+            "# TYPE ndvi_download_stage_seconds_total counter",
+        ]
+        lines += [f'ndvi_download_stage_seconds_total{{stage="{stage}"}} {values["seconds"]:.6f}' for stage, values in summary["stages"].items()]
+        lines += [
+            "# HELP ndvi_download_stage_calls_total Calls to every stage of the downloader.",
+            "# TYPE ndvi_download_stage_calls_total counter",
+        ]
+        lines += [f'ndvi_download_stage_calls_total{{stage="{stage}"}} {values["calls"]}' for stage, values in summary["stages"].items()]
+        lines += [
+            "# HELP ndvi_download_products_total Products processed in the last run, by status.",
+            "# TYPE ndvi_download_products_total gauge",
+        ]
+        lines += [f'ndvi_download_products_total{{status="{status}"}} {count}' for status, count in summary["products"].items()]
+        lines += [
+            "# HELP ndvi_download_bytes_total Bytes downloaded in the last run.",
+            "# TYPE ndvi_download_bytes_total gauge",
+            f"ndvi_download_bytes_total {summary['bytes']}",
+            "# HELP ndvi_download_throughput_bytes_per_second Average throughput of the last run.",
+            "# TYPE ndvi_download_throughput_bytes_per_second gauge",
+            f"ndvi_download_throughput_bytes_per_second {(summary['throughput_MBps'] or 0) * 1e6:.0f}",
+            "# HELP ndvi_download_retries_total Retried requests in the last run.",
+            "# TYPE ndvi_download_retries_total gauge",
+            f"ndvi_download_retries_total {summary['retries']}",
+            "# HELP ndvi_download_quota_errors_total Requests answered with 403/429/503 in the last run.",
+            "# TYPE ndvi_download_quota_errors_total gauge",
+            f"ndvi_download_quota_errors_total {summary['quota_errors']}",
+            "# HELP ndvi_download_last_run_timestamp_seconds End of the last run.",
+            "# TYPE ndvi_download_last_run_timestamp_seconds gauge",
+            f"ndvi_download_last_run_timestamp_seconds {time.time():.0f}",
+        ]
+        
+        # The textfile collector must never read a half-written file
+        route_to_textfile = Path(route_to_textfile)
+        route_to_tmp = route_to_textfile.with_name(route_to_textfile.name + ".tmp")
+        route_to_tmp.write_text("\n".join(lines) + "\n")
+        os.replace(route_to_tmp, route_to_textfile)
+        
+        return summary
+
+
+# Metrics of the current run (written to disk once main() opens them)
+metrics = Metrics()
+
+# netCDF4 (libnetcdf and its HDF5) is not thread-safe: the windows (--bbox) of
+# the products downloaded at once are written one at a time
+netCDF_lock = threading.Lock()
+
+
+def f_Open_metrics(args, Directories):
+    """
+    Applies --quiet and starts recording the metrics of the run in --metrics
+    (by default, Ancillary/download_metrics.jsonl).
+    """
+    config["quiet"] = args.quiet
+    metrics.open(args.metrics if args.metrics is not None else Directories["Ancillary"] / "download_metrics.jsonl")
+
+
+def f_Close_metrics(args):
+    """
+    Records the summary of the run, writes it to --prometheus-textfile if
+    given, and prints it.
+    """
+    if args.prometheus_textfile is not None:
+        summary = metrics.write_prometheus(args.prometheus_textfile)
+    else:
+        summary = metrics.summary()
+    
+    print(f"           - {sum(summary['products'].values())} products processed ({', '.join(f'{count} {status}' for status, count in summary['products'].items()) or 'none'})")
+    print(f"           - {summary['bytes'] / 1e6:.1f} MB downloaded in {summary['seconds']:.1f} seconds ({summary['throughput_MBps'] or 0:.2f} MB/s)")
+    print(f"           - {summary['retries']} retries, {summary['quota_errors']} quota errors")
+    for stage, values in summary["stages"].items():
+        print(f"           - {stage}: {values['seconds']:.2f} seconds in {values['calls']} calls")
+    
+    return summary
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Download the NDVI products pending to download"
+    )
+    
+    add_arguments(parser)
+
+    return parser.parse_args()
+
+
+def add_arguments(parser):
+    """
+    Adds the arguments of the downloader to parser, so other scripts (e.g.
+    Launch_me_to_download_and_filter.py) can offer the same options.
+    """
+
+    # --- CONCURRENCY ---
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of products/objects downloaded at once"
+    )
+
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        default=config["s3_max_connections"],
+        help="Maximum number of simultaneous connections to eodata"
+    )
+
+    parser.add_argument(
+        "--max-bandwidth",
+        type=float,
+        default=config["s3_max_bandwidth"],
+        help="Maximum bandwidth, in MB/s (0 for no limit)"
+    )
+
+    # --- TRANSFER OF EVERY OBJECT ---
+    parser.add_argument(
+        "--part-size",
+        type=float,
+        default=config["transfer_part_size"],
+        help="Size of the byte ranges in which every object is downloaded, in MB"
+    )
+
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=config["transfer_max_concurrency"],
+        help="Number of byte ranges of the same object downloaded at once"
+    )
+
+    # --- SELECTION ---
+    parser.add_argument(
+        "--start",
+        type=f_Parse_date,
+        default=None,
+        help="First date to download (YYYY-MM-DD)"
+    )
+
+    parser.add_argument(
+        "--end",
+        type=f_Parse_date,
+        default=None,
+        help="Last date to download (YYYY-MM-DD)"
+    )
+
+    parser.add_argument(
+        "--bbox",
+        type=float,
+        nargs=4,
+        default=None,
+        metavar=("LON_MIN", "LAT_MIN", "LON_MAX", "LAT_MAX"),
+        help="Download only this window of NDVI, NDVI_unc, NOBS and QFLAG, read remotely from S3"
+    )
+
+    # --- JOBS ---
+    parser.add_argument(
+        "--max-attempts",
+        type=int,
+        default=config["job_max_attempts"],
+        help="Attempts of every product before it is moved to the dead-letter list"
+    )
+
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="Queue again the products of the dead-letter list"
+    )
+
+    # --- REPORTING ---
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Do not print the name of every function when it runs"
+    )
+
+    parser.add_argument(
+        "--metrics",
+        type=Path,
+        default=None,
+        help="JSON lines file for the timings and counters of the run (default: Ancillary/download_metrics.jsonl)"
+    )
+
+    parser.add_argument(
+        "--prometheus-textfile",
+        type=Path,
+        default=None,
+        help="Also write the totals of the run to this file, in the Prometheus textfile format"
+    )
+
+    return parser
+
+
+def f_Define_the_directories():
+    """
+    Returns
+    -------
+    Directories : dict
+        Dictionary with the routes to the defined directories.
+    """
+    f_Running(f_Define_the_directories)
+    
+    Directory_general = ndvi.f_Directory_general()
+
+    Directories = {
+        "General": Directory_general,
+        "Ancillary": Directory_general / "Ancillary",
+        "Inputs": Directory_general / "Inputs",
+        "Outputs_downloaded": Directory_general / "Outputs_downloaded",
+        "Scripts": Directory_general / "Scripts",
+    }  # Add new lines if nedded
+    
+    # Make sure that these directories exist. If not, create them.
+    for directory_name, directory_path in Directories.items():
+        if not directory_path.exists():
+            directory_path.mkdir(parents=True)
+            print(f"           - Created directory: {directory_name} → {directory_path}")
+
+    return Directories
+
+
+def f_Bbox_folder(route_to_folder, bbox=None):
+    """
+    Returns
+    -------
+    route_to_bbox_folder : Path
+        Folder of the windows downloaded with bbox: a subfolder of route_to_folder
+        named after the window (e.g. bbox_-10_35.5_4.5_44), with its own manifest.
+        route_to_folder itself if bbox is None.
+    """
+    if bbox is None:
+        return Path(route_to_folder)
+    return Path(route_to_folder) / ("bbox_" + "_".join(f"{value:g}" for value in bbox))
+
+
+def f_Bbox_directories(Directories, bbox=None):
+    """
+    Returns
+    -------
+    Directories : dict
+        Copy of Directories whose Outputs_downloaded is the folder of the windows
+        of bbox (see f_Bbox_folder), created if needed, so the windows never
+        replace the products downloaded in full (or for another window).
+    """
+    if bbox is None:
+        return Directories
+    
+    Directories = dict(Directories, Outputs_downloaded=f_Bbox_folder(Directories["Outputs_downloaded"], bbox))
+    if not Directories["Outputs_downloaded"].exists():
+        Directories["Outputs_downloaded"].mkdir(parents=True)
+        print(f"           - Created directory: Outputs_downloaded → {Directories['Outputs_downloaded']}")
+    
+    return Directories
+
+
+def f_Import_credentials(filename=".credentials.ini"):
+    """
+    Reads CDSE credentials from an ini file located in the same
+    directory as the scripts (see ndvi.f_Directory_scripts).
+    """
+    f_Running(f_Import_credentials)
+    
+    
+    config = configparser.ConfigParser()
+
+    cred_path = ndvi.f_Directory_scripts() / filename
+
+    if not cred_path.exists():
+        raise FileNotFoundError(
+            f"           - Credentials file not found: {cred_path}"
+        )
+
+    config.read(cred_path)
+
+    try:
+        _username = config["cdse"]["username"]
+        _password = config["cdse"]["password"]
+        
+    except KeyError as e:
+        raise KeyError(
+            "           - Missing [cdse] section or keys in credentials file"
+        ) from e
+
+    return _username, _password
+
+
+def f_download_csv_file(route_to_download_the_csv, filename, target_url):
+    
+    """
+    Parameters
+    ----------
+    route_to_download_the_csv : WindowsPath
+        Route to save the downloaded CSV.
+
+    Returns
+    -------
+    downloaded : bool
+        False if the CSV has not changed since the last download (the server answered 304), True otherwise.
+        The ETag and Last-Modified of the last download are kept next to the CSV, in "<filename>.meta.json".
+    """
+    import requests as requests
+    
+    f_Running(f_download_csv_file)
+    
+    route_to_csv = route_to_download_the_csv / filename
+    route_to_meta = route_to_download_the_csv / f"{filename}.meta.json"
+    
+    # Ask only for a newer version of the CSV, if there is a previous one
+    headers = {}
+    if route_to_csv.exists() and route_to_meta.exists():
+        try:
+            meta = json.loads(route_to_meta.read_text())
+        except ValueError:
+            meta = {}
+        if meta.get("ETag"):
+            headers["If-None-Match"] = meta["ETag"]
+        if meta.get("Last-Modified"):
+            headers["If-Modified-Since"] = meta["Last-Modified"]
+
+    # Download the file
+    start = time.perf_counter()
+    response = requests.get(target_url, headers=headers, timeout=60, stream=True)
+    
+    if response.status_code == 304:
+        response.close()
+        metrics.observe("catalogue_csv", time.perf_counter() - start)
+        print("           - The CSV has not changed since the last download")
+        return False
+    
+    response.raise_for_status()
+
+    # Save it (through a temporary file, so an interrupted download never replaces a good CSV)
+    route_to_tmp = route_to_download_the_csv / f"{filename}.tmp"
+    with open(route_to_tmp, "wb") as f:
+        for chunk in response.iter_content(chunk_size=1024 * 1024):
+            f.write(chunk)
+    os.replace(route_to_tmp, route_to_csv)
+    metrics.observe("catalogue_csv", time.perf_counter() - start)
+    
+    route_to_meta.write_text(json.dumps({
+        "ETag": response.headers.get("ETag"),
+        "Last-Modified": response.headers.get("Last-Modified"),
+    }))
+    
+    return True
+
+
+def f_list_of_available_files(route_where_the_csv_were_downloaded, filename, desired_column):
+    
+    """
+    Parameters
+    ----------
+    route_where_the_csv_were_downloaded: WindowsPath
+        Route to the CSV to read.
+
+    Returns
+    -------
+    list_of_available_files: list
+    List within the csv with the available files to download.
+    """
+    f_Running(f_list_of_available_files)
+    
+    route_to_csv = route_where_the_csv_were_downloaded / filename
+    
+    # Read the CSV row by row, skipping the header, and extract the column that contains the desired information
+    with open(route_to_csv, newline="", encoding="utf-8") as f:
+        rows = csv.reader(f, delimiter=";")
+        next(rows, None)
+        list_of_available_files = [row[desired_column] for row in rows if len(row) > desired_column]
+    
+    return list_of_available_files
+
+
+HDF5_SIGNATURE = b"\x89HDF\r\n\x1a\n"
+
+
+def f_Is_valid_NC(route_to_NC, expected_size=None):
+    """
+    Fast, header-only check of a NetCDF file. Only the first bytes of the
+    file are read, so it can be run on every file of the archive.
+
+    Parameters
+    ----------
+    route_to_NC : WindowsPath
+        Route to the NC file.
+    expected_size : int, optional
+        Size, in bytes, that the file must have.
+
+    Returns
+    -------
+    is_valid : bool
+        False if the file is missing, has not the expected size, is not a NetCDF file,
+        or (NetCDF4/HDF5 files) is shorter than the end-of-file address stored in its superblock.
+    """
+    try:
+        actual_size = os.path.getsize(route_to_NC)
+    except OSError:
+        return False
+    
+    if expected_size is not None and actual_size != expected_size:
+        return False
+    
+    with open(route_to_NC, "rb") as f:
+        # Classic NetCDF (CDF-1, CDF-2 and CDF-5): only the magic number can be checked
+        magic = f.read(4)
+        if magic[:3] == b"CDF" and magic[3:4] in (b"\x01", b"\x02", b"\x05"):
+            return True
+        
+        # NetCDF4: the HDF5 superblock is at offset 0, 512, 1024, 2048...
+        offset = 0
+        while offset + 8 <= actual_size:
+            f.seek(offset)
+            if f.read(8) == HDF5_SIGNATURE:
+                break
+            offset = 512 if offset == 0 else offset * 2
+        else:
+            return False
+        
+        superblock = f.read(64)
+    
+    if len(superblock) < 8:
+        return False
+    
+    version = superblock[0]
+    if version in (0, 1):
+        size_of_offsets = superblock[5]
+        position = 16 if version == 0 else 20
+    elif version in (2, 3):
+        size_of_offsets = superblock[1]
+        position = 4
+    else:
+        return False
+    
+    addresses = superblock[position:position + 3 * size_of_offsets]
+    if size_of_offsets not in (2, 4, 8) or len(addresses) < 3 * size_of_offsets:
+        return False
+    
+    # Base address and end-of-file address (relative to the base address)
+    base_address = int.from_bytes(addresses[:size_of_offsets], "little")
+    end_of_file_address = int.from_bytes(addresses[2 * size_of_offsets:], "little")
+    
+    return base_address + end_of_file_address <= actual_size
+
+
+class Manifest:
+    """
+    Integrity record of the downloaded products, kept as a JSON file
+    (by default, Outputs_downloaded/manifest.json):
+
+        {eo_product_name: {
+            "s3_path": ...,
+            "completed": ...,  # UTC time at which the product was verified
+            "files": [{"name": ..., "key": ..., "size": ..., "etag": ...}, ...]
+        }}
+
+    The sizes and ETags are taken from head_object. A product is complete
+    only if every one of its files exists, has the recorded size and passes
+    f_Is_valid_NC, so truncated or corrupt files are downloaded again.
+    Products whose raw files were deleted on purpose are flagged with
+    "raw_deleted" and count as complete. Products of which only a window
+    was downloaded (--bbox) record it in "bbox", and only count as complete
+    for that same window.
+    """
+
+    def __init__(self, route_to_manifest):
+        self.route_to_manifest = Path(route_to_manifest)
+        self._lock = threading.Lock()
+        self.records = {}
+        
+        if self.route_to_manifest.exists():
+            try:
+                self.records = json.loads(self.route_to_manifest.read_text())
+            except ValueError:
+                print(f"           - WARNING: Corrupt manifest ignored: {self.route_to_manifest}")
+
+    def _save(self):
+        route_to_tmp = self.route_to_manifest.with_name(self.route_to_manifest.name + ".tmp")
+        route_to_tmp.write_text(json.dumps(self.records, indent=1, sort_keys=True))
+        os.replace(route_to_tmp, self.route_to_manifest)
+
+    def record(self, eo_product_name, s3_path, files, bbox=None):
+        with self._lock:
+            self.records[eo_product_name] = {
+                "s3_path": s3_path,
+                "completed": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "files": sorted(files, key=lambda file: file["name"]),
+            }
+            if bbox is not None:
+                self.records[eo_product_name]["bbox"] = list(bbox)
+            self._save()
+
+    def mark_deleted(self, eo_product_name):
+        """
+        Records that the raw files of the product were deleted on purpose
+        (e.g. once filtered), so the product is not downloaded again.
+        """
+        with self._lock:
+            if eo_product_name in self.records:
+                self.records[eo_product_name]["raw_deleted"] = True
+                self._save()
+
+    def remove(self, eo_product_name):
+        with self._lock:
+            if self.records.pop(eo_product_name, None) is not None:
+                self._save()
+
+    def is_complete(self, eo_product_name, bbox=None):
+        record = self.records.get(eo_product_name)
+        if not record or not record["files"]:
+            return False
+        # A product downloaded for another window (or in full) has to be downloaded again
+        if record.get("bbox") != (list(bbox) if bbox is not None else None):
+            return False
+        if record.get("raw_deleted"):
+            return True
+        directory = self.route_to_manifest.parent
+        return all(
+            f_Is_valid_NC(directory / file["name"], file["size"]) if file["name"].endswith(".nc")
+            else (directory / file["name"]).exists() and (directory / file["name"]).stat().st_size == file["size"]
+            for file in record["files"]
+        )
+
+
+def  f_list_of_current_files(route_to_folder, bbox=None):
+    
+    """
+    Parameters
+    ----------
+    route_to_folder : WindowsPath
+        Route to the folder where the script must look for the already downloaded NC files.
+
+    bbox : list, optional
+        Window (lon_min, lat_min, lon_max, lat_max) of the products, if only a window is downloaded.
+
+    Returns
+    -------
+    list_of_current_files : list
+        Products recorded in the manifest of the folder whose files are complete and valid.
+        Files in the folder that are not in the manifest do not count (see download_file_s3).
+    """
+    f_Running(f_list_of_current_files)
+    
+    manifest = Manifest(route_to_folder / "manifest.json")
+    
+    # Products whose files were verified after the download, and still are
+    list_of_current_files = [name for name in manifest.records if manifest.is_complete(name, bbox)]
+    
+    # Let the user know about the products that have to be downloaded again:
+    # those downloaded for another window (or in full) are not corrupt
+    set_of_current_files = set(list_of_current_files)
+    Other_window = [
+        name for name in manifest.records
+        if name not in set_of_current_files and manifest.records[name].get("bbox") != (list(bbox) if bbox is not None else None)
+    ]
+    Number_of_broken_products = len(manifest.records) - len(list_of_current_files) - len(Other_window)
+    if Other_window:
+        print(f"           - WARNING: {len(Other_window)} products in the manifest were downloaded for another window (--bbox) and will be downloaded again for this one")
+    if Number_of_broken_products:
+        print(f"           - WARNING: {Number_of_broken_products} products in the manifest are missing or corrupt and will be downloaded again")
+       
+    return list_of_current_files
+
+
+def f_Parse_date(text):
+    """
+    Argument type for dates given as YYYY-MM-DD.
+    """
+    try:
+        return datetime.datetime.strptime(text, "%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid date '{text}' (expected YYYY-MM-DD)")
+
+
+def f_Select_dates(list_of_products, start=None, end=None):
+    """
+    Returns
+    -------
+    list_of_selected_products : list
+        Products of list_of_products whose date (taken from their name) is within [start, end].
+        Products without a date in their name are left out.
+    """
+    f_Running(f_Select_dates)
+    
+    list_of_selected_products = []
+    for name in list_of_products:
+        date = f_Date_of_product(name)
+        if date is None:
+            continue
+        if (start is None or date >= start) and (end is None or date <= end):
+            list_of_selected_products.append(name)
+    
+    print(f"           - {len(list_of_selected_products)} of {len(list_of_products)} products within the dates")
+    
+    return list_of_selected_products
+
+
+def f_Bucket_list(Directories, start=None, end=None, bbox=None):
+    
+    """
+    Parameters
+    ----------
+    Directories : dict
+        Dictionary with, at least, two WindowsPath: one named Inputs were the CSV will be saved, and another one named Outputs, where the already downloaded files should be
+    start, end : datetime.datetime, optional
+        Only the products whose date (taken from their name) is within [start, end] are listed.
+    bbox : list, optional
+        Window (lon_min, lat_min, lon_max, lat_max) of the products, if only a window is downloaded.
+
+    Returns
+    -------
+    bucket_list : list
+        List with the names of the NC files to download.
+
+    """
+    f_Running(f_Bucket_list)
+    
+    # Target URL for the request
+    target_url = config["catalogue_csv_url"]
+
+    # Define the filename of the requested file
+    filename = "ndvi_global_300m_10daily_v3_nc.csv"
+    
+    # Column of the csv file that contains the desired information
+    # Take into account that the first column gets the number 0
+    desired_column = 1
+    
+    try:
+              
+        # Download the csv file containing the available files
+        # Note that it will be downloaded in the input folder, as it will be an 
+        # input during the rest of the script
+        f_download_csv_file(Directories["Inputs"], filename, target_url)
+        
+        # Read the csv and get a list with the names of the available files to download
+        list_of_available_files = f_list_of_available_files(Directories["Inputs"], filename, desired_column)
+        
+        # Keep only the products within the requested dates
+        if start is not None or end is not None:
+            list_of_available_files = f_Select_dates(list_of_available_files, start, end)
+        
+        # Check which files were already downloaded, and are thus in the Outputs folder
+        list_of_current_files = f_list_of_current_files(Directories["Outputs_downloaded"], bbox)
+        
+        # Compare both lists, and get a new list with the name of the files yet to download
+        # (a set makes every lookup O(1); the order of the CSV is kept)
+        set_of_current_files = set(list_of_current_files)
+        bucket_list = [x for x in list_of_available_files if x not in set_of_current_files]
+  
+        print(f"           - Of the {len(list_of_available_files)} available files, {len(bucket_list)} remain to be downloaded")
+        
+        return bucket_list
+    
+    except Exception as e:
+        print(f"Error: {e}")
+        # Let the caller decide: a run with unfinished jobs can go on without the catalogue
+        raise
+
+
+def get_access_token(config, _username, _password):
+    f_Running(get_access_token)
+    return get_token_payload(config, {
+        "client_id": config["client_id"],
+        "grant_type": "password",
+        "username": _username,
+        "password": _password,
+    })["access_token"]
+
+
+def get_token_payload(config, auth_data):
+    """
+    Posts auth_data to the CDSE identity server and returns the whole token
+    response (access_token, expires_in, refresh_token, refresh_expires_in...).
+    """
+    import requests as requests
+    
+    f_Running(get_token_payload)
+    with metrics.stage("token"):
+        response = requests.post(
+            config["auth_server_url"],
+            data=auth_data,
+            verify=True,
+            allow_redirects=False,
+        )
+
+    if response.status_code == 200:
+        return response.json()
+    raise RuntimeError(
+        f"Failed to retrieve access token ({response.status_code})"
+    )
+
+
+def get_eo_product_details(config, headers, eo_product_name):
+    import requests as requests
+    
+    f_Running(get_eo_product_details)
+    odata_url = (
+        f"{config['odata_base_url']}?$filter=Name eq '{eo_product_name}'"
+    )
+    response = requests.get(odata_url, headers=headers)
+
+    if response.status_code == 200:
+        product = response.json()["value"][0]
+        return product["Id"], product["S3Path"]
+
+    raise RuntimeError(
+        f"Failed to retrieve EO product details ({response.status_code})"
+    )
+
+
+def f_Date_of_product(eo_product_name):
+    """
+    Parameters
+    ----------
+    eo_product_name : str
+        Name of the product, as listed in the catalogue CSV (e.g. "c_gls_NDVI300_202401010000_GLOBE_OLCI_V3.0.1_nc").
+
+    Returns
+    -------
+    date : datetime.datetime or None
+        Date encoded in the name of the product (YYYYMMDDhhmm), or None if the name does not contain one.
+    """
+    match = re.search(r"_(\d{12})_", eo_product_name)
+    if match is None:
+        return None
+    return datetime.datetime.strptime(match.group(1), "%Y%m%d%H%M")
+
+
+def f_Load_S3_paths_cache(route_to_cache):
+    f_Running(f_Load_S3_paths_cache)
+    
+    if not route_to_cache.exists():
+        return {}
+    
+    try:
+        return json.loads(route_to_cache.read_text())
+    except ValueError:
+        print(f"           - WARNING: Corrupt cache ignored: {route_to_cache}")
+        return {}
+
+
+def f_Save_S3_paths_cache(route_to_cache, S3_paths):
+    f_Running(f_Save_S3_paths_cache)
+    
+    # Write to a temporary file and rename it, so an interrupted run never leaves a truncated cache
+    route_to_tmp = route_to_cache.with_suffix(route_to_cache.suffix + ".tmp")
+    route_to_tmp.write_text(json.dumps(S3_paths, indent=1, sort_keys=True))
+    os.replace(route_to_tmp, route_to_cache)
+
+
+def get_eo_products_details_in_bulk(config, headers, eo_product_names):
+    """
+    Resolves many products with a few paged OData queries instead of one
+    query per product. The queries select the products of the collection
+    whose name starts with the common prefix of eo_product_names and whose
+    ContentDate falls within the date range spanned by them.
+
+    Returns
+    -------
+    details : dict
+        {eo_product_name: {"Id": ..., "S3Path": ...}} for the products that were found.
+        Products not returned by the bulk queries, and those without a date in
+        their name (they can not be placed in the date range), are simply missing.
+    """
+    import requests as requests
+    
+    f_Running(get_eo_products_details_in_bulk)
+    
+    # The products without a date are left to the queries product by product
+    wanted = {name for name in eo_product_names if f_Date_of_product(name) is not None}
+    if not wanted:
+        return {}
+    
+    dates = [f_Date_of_product(name) for name in wanted]
+    
+    margin = datetime.timedelta(days=config["odata_date_margin_days"])
+    start = (min(dates) - margin).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    end = (max(dates) + margin).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    prefix = os.path.commonprefix(sorted(wanted))
+    
+    odata_filter = (
+        f"Collection/Name eq '{config['odata_collection']}'"
+        f" and startswith(Name,'{prefix}')"
+        f" and ContentDate/Start ge {start}"
+        f" and ContentDate/Start le {end}"
+    )
+    
+    details = {}
+    page_size = config["odata_page_size"]
+    skip = 0
+    while True:
+        response = requests.get(
+            config["odata_base_url"],
+            params={
+                "$filter": odata_filter,
+                "$orderby": "ContentDate/Start asc",
+                "$top": page_size,
+                "$skip": skip,
+            },
+            headers=headers,
+            timeout=120,
+        )
+        if response.status_code != 200:
+            raise RuntimeError(
+                f"Failed to retrieve EO product details ({response.status_code})"
+            )
+        
+        page = response.json()["value"]
+        for product in page:
+            if product["Name"] in wanted:
+                details[product["Name"]] = {"Id": product["Id"], "S3Path": product["S3Path"]}
+        
+        if len(page) < page_size or len(details) == len(wanted):
+            break
+        skip = skip + page_size
+    
+    return details
+
+
+def f_Resolve_S3_paths(session, Bucket_list, Directories, errors=None):
+    """
+    Parameters
+    ----------
+    session : CDSESession
+        Session used to query the catalogue.
+    Bucket_list : list
+        Names of the products to download.
+    Directories : dict
+        Dictionary with, at least, the Ancillary directory, where the cache is kept.
+    errors : dict, optional
+        If given, the products that can not be resolved are recorded in it
+        ({eo_product_name: exception}) and left out of S3_paths, instead of
+        stopping the resolution of the others.
+
+    Returns
+    -------
+    S3_paths : dict
+        {eo_product_name: S3Path} for every (resolved) product of Bucket_list.
+        Resolved products are kept in a local cache, so later runs do not query the catalogue for them again.
+    """
+    import requests as requests
+    
+    f_Running(f_Resolve_S3_paths)
+    start = time.perf_counter()
+    
+    route_to_cache = Directories["Ancillary"] / "S3_paths_cache.json"
+    cache = f_Load_S3_paths_cache(route_to_cache)
+    
+    pending = [name for name in Bucket_list if name not in cache]
+    print(f"           - {len(Bucket_list) - len(pending)} products found in the cache, {len(pending)} to resolve")
+    
+    if pending:
+        try:
+            cache.update(get_eo_products_details_in_bulk(session.config, session.headers, pending))
+        except (RuntimeError, requests.RequestException, ValueError, KeyError) as e:
+            # Errors of the catalogue, dropped connections and timeouts, and pages that are not the expected JSON
+            print(f"           - WARNING: Bulk resolution failed ({e}). Resolving product by product")
+        
+        # Whatever the bulk queries did not return is resolved one by one
+        for name in pending:
+            if name not in cache:
+                try:
+                    product_id, s3_path = get_eo_product_details(session.config, session.headers, name)
+                except Exception as e:
+                    if errors is None:
+                        raise
+                    errors[name] = e
+                    continue
+                cache[name] = {"Id": product_id, "S3Path": s3_path}
+        
+        f_Save_S3_paths_cache(route_to_cache, cache)
+    
+    if errors:
+        print(f"           - WARNING: {len(errors)} products could not be resolved")
+    
+    end = time.perf_counter()
+    metrics.observe("resolution", end - start)
+    print(f"           - The process took {end - start:.2f} seconds")
+    
+    return {name: cache[name]["S3Path"] for name in Bucket_list if name in cache}
+
+
+class S3KeysError(RuntimeError):
+    """
+    Raised when the S3 keys manager does not create the temporary S3 keys.
+    status_code is the HTTP status of its answer (403 or 429 when a CDSE quota is reached).
+    """
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def get_temporary_s3_credentials(headers, config=config):
+    import requests as requests
+    
+    f_Running(get_temporary_s3_credentials)
+    
+    with metrics.stage("s3_keys"):
+        response = requests.post(
+            config["s3_keys_manager_url"],
+            headers=headers,
+        )
+
+    if response.status_code == 200:
+        return response.json()
+
+    raise S3KeysError(
+        f"Failed to create temporary S3 credentials ({response.status_code})",
+        response.status_code,
+    )
+
+
+def delete_temporary_s3_credentials(headers, access_id, config=config):
+    import requests as requests
+    
+    f_Running(delete_temporary_s3_credentials)
+    
+    response = requests.delete(
+        f"{config['s3_keys_manager_url']}/access_id/{access_id}",
+        headers=headers,
+    )
+    
+    if response.status_code not in (200, 204, 404):
+        print(f"           - WARNING: Failed to delete temporary S3 credentials ({response.status_code})")
+
+
+class CDSESession:
+    """
+    Keeps one CDSE login, one pair of temporary S3 keys and one pooled S3
+    resource for the whole run.
+
+    The access token is refreshed with the refresh_token shortly before it
+    expires (falling back to a new password login when the refresh token has
+    expired too). The S3 keys are created the first time they are needed and
+    deleted once, when the session is closed. close() is registered with
+    atexit, so the keys are also removed if the run crashes.
+
+    Use it as a context manager:
+
+        with CDSESession(config, _username, _password) as session:
+            f_Downloader(session, eo_product_name, output_dir)
+    """
+
+    def __init__(self, config, _username, _password):
+        self.config = config
+        self._username = _username
+        self._password = _password
+        
+        self._access_token = None
+        self._access_expires_at = 0.0
+        self._refresh_token = None
+        self._refresh_expires_at = 0.0
+        
+        self._s3_creds = None
+        self._s3_created_at = 0.0
+        self._s3_resource = None
+        self._s3_client = SessionS3Client(self)
+        self._closed = False
+        self._lock = threading.RLock()
+        
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def _store_token(self, payload):
+        now = time.monotonic()
+        self._access_token = payload["access_token"]
+        self._access_expires_at = now + float(payload.get("expires_in", 600))
+        self._refresh_token = payload.get("refresh_token")
+        self._refresh_expires_at = now + float(payload.get("refresh_expires_in", 0))
+
+    def _login(self):
+        self._store_token(get_token_payload(self.config, {
+            "client_id": self.config["client_id"],
+            "grant_type": "password",
+            "username": self._username,
+            "password": self._password,
+        }))
+
+    def _refresh(self):
+        try:
+            self._store_token(get_token_payload(self.config, {
+                "client_id": self.config["client_id"],
+                "grant_type": "refresh_token",
+                "refresh_token": self._refresh_token,
+            }))
+        except RuntimeError:
+            # The refresh token may have been revoked: log in again
+            self._login()
+
+    @property
+    def access_token(self):
+        with self._lock:
+            margin = self.config["token_refresh_margin"]
+            now = time.monotonic()
+            
+            if self._access_token is not None and now < self._access_expires_at - margin:
+                return self._access_token
+            
+            if self._refresh_token is not None and now < self._refresh_expires_at - margin:
+                self._refresh()
+            else:
+                self._login()
+            
+            return self._access_token
+
+    @property
+    def headers(self):
+        return {
+            "Authorization": f"Bearer {self.access_token}",
+            "Accept": "application/json",
+        }
+
+    @property
+    def s3_resource(self):
+        import boto3 as boto3
+        from botocore.config import Config as BotoConfig
+        
+        with self._lock:
+            if self._s3_resource is None:
+                self._s3_creds = get_temporary_s3_credentials(self.headers, self.config)
+                self._s3_created_at = time.monotonic()
+                
+                # New keys are not accepted by eodata straight away
+                with metrics.stage("s3_keys_propagation"):
+                    time.sleep(self.config["s3_keys_propagation_delay"])
+                
+                self._s3_resource = boto3.resource(
+                    "s3",
+                    endpoint_url=self.config["s3_endpoint_url"],
+                    aws_access_key_id=self._s3_creds["access_id"],
+                    aws_secret_access_key=self._s3_creds["secret"],
+                    config=BotoConfig(max_pool_connections=self.config["s3_max_pool_connections"]),
+                )
+            
+            return self._s3_resource
+
+    @property
+    def s3_client(self):
+        # Unlike the resource, the client can be shared between threads
+        return self._s3_client
+
+    def renew_s3_keys(self):
+        """
+        Replaces the temporary S3 keys after eodata rejected them (e.g. they
+        expired or were revoked): the next call of s3_client creates new ones.
+        Keys younger than config["s3_keys_min_age"] are kept, so the workers
+        that report the keys already renewed by another one do not renew them again.
+
+        Returns
+        -------
+        renewed : bool
+            True if the keys were dropped, False if they were kept.
+        """
+        with self._lock:
+            if self._s3_creds is None or time.monotonic() - self._s3_created_at < self.config["s3_keys_min_age"]:
+                return False
+            s3_creds = self._s3_creds
+            self._s3_creds = None
+            self._s3_resource = None
+        
+        print("           - WARNING: eodata rejected the S3 keys. Renewing them")
+        try:
+            delete_temporary_s3_credentials(self.headers, s3_creds["access_id"], self.config)
+        except Exception as e:
+            print(f"           - WARNING: Could not delete temporary S3 credentials ({e})")
+        return True
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        
+        if self._s3_creds is not None:
+            try:
+                delete_temporary_s3_credentials(self.headers, self._s3_creds["access_id"], self.config)
+            except Exception as e:
+                print(f"           - WARNING: Could not delete temporary S3 credentials ({e})")
+            self._s3_creds = None
+            self._s3_resource = None
+
+
+class SessionS3Client:
+    """
+    S3 client of a CDSESession. Every call goes to the client of the current
+    S3 keys of the session (created on the first call), so the calls retried
+    after the keys were renewed (see CDSESession.renew_s3_keys) are signed
+    with the new keys.
+    """
+
+    def __init__(self, session):
+        self._session = session
+
+    def __getattr__(self, name):
+        def method(*args, **kwargs):
+            return getattr(self._session.s3_resource.meta.client, name)(*args, **kwargs)
+        
+        method.__name__ = name
+        return method
+
+
+def f_Transfer_config(part_size=None, max_concurrency=None):
+    """
+    Parameters
+    ----------
+    part_size : float, optional
+        Size of the byte ranges, in MB. Objects smaller than this are downloaded in a single range.
+    max_concurrency : int, optional
+        Number of ranges of the same object downloaded at once.
+
+    Returns
+    -------
+    transfer_config : TransferConfig
+    """
+    from boto3.s3.transfer import TransferConfig as TransferConfig
+    
+    part_size = int((part_size if part_size is not None else config["transfer_part_size"]) * 1024 * 1024)
+    return TransferConfig(
+        multipart_threshold=part_size,
+        multipart_chunksize=part_size,
+        max_concurrency=max_concurrency if max_concurrency is not None else config["transfer_max_concurrency"],
+    )
+
+
+def format_filename(filename, length=40):
+    f_Running(format_filename)
+    return (
+        filename[: length - 3] + "..."
+        if len(filename) > length
+        else filename.ljust(length)
+    )
+
+
+class TokenBucket:
+    """
+    Token bucket: tokens are added at `rate` per second, up to `capacity`.
+    consume() blocks until the requested amount of tokens is available.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount):
+        # Amounts larger than the capacity are consumed in several steps
+        while amount > 0:
+            step = min(amount, self.capacity)
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                self._tokens = self._tokens - step
+                wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            if wait > 0:
+                time.sleep(wait)
+            amount = amount - step
+
+
+# Error codes of eodata for S3 keys that are not valid (any more), as opposed to a quota
+S3_AUTH_ERRORS = ("InvalidAccessKeyId", "SignatureDoesNotMatch", "ExpiredToken", "InvalidToken")
+
+
+def f_S3_error_code(exception):
+    """
+    Returns the error code of an S3 ClientError (e.g. "AccessDenied", or the HTTP
+    status for the answers without body, such as those to HEAD), and None for
+    any other exception.
+    """
+    from botocore.exceptions import ClientError as ClientError
+    
+    if not isinstance(exception, ClientError):
+        return None
+    return exception.response.get("Error", {}).get("Code")
+
+
+def f_Is_S3_auth_error(exception):
+    """
+    Returns True if eodata rejected the S3 keys of the call that raised exception.
+    """
+    return f_S3_error_code(exception) in S3_AUTH_ERRORS
+
+
+def f_Quota_status(exception):
+    """
+    Returns the HTTP status code of exception if it is one of the codes CDSE
+    answers with when a quota or limit is reached (403, 429, 503), and None
+    otherwise. S3 keys rejected by eodata are not a quota (see f_Is_S3_auth_error),
+    while the S3 keys manager refusing new keys is (see S3KeysError).
+    """
+    from botocore.exceptions import ClientError as ClientError
+    import requests as requests
+    
+    status = None
+    if isinstance(exception, S3KeysError):
+        status = exception.status_code
+    elif isinstance(exception, ClientError) and not f_Is_S3_auth_error(exception):
+        status = exception.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    elif isinstance(exception, requests.HTTPError) and exception.response is not None:
+        status = exception.response.status_code
+    return status if status in (403, 429, 503) else None
+
+
+class QuotaLimiter:
+    """
+    Keeps the concurrent downloads under the limits CDSE publishes for eodata
+    ("https://documentation.dataspace.copernicus.eu/Quotas.html"):
+
+      - A semaphore caps the number of simultaneous connections.
+      - A token bucket caps the bandwidth (bytes per second).
+      - Calls answered with 403/429/503 are retried with an exponential
+        backoff shared by all the workers, instead of aborting the run.
+      - Calls whose S3 keys were rejected (see f_Is_S3_auth_error) are retried
+        straight away with new keys, if renew_s3_keys is given (see
+        CDSESession.renew_s3_keys), and not retried otherwise. A 403 without
+        error code (HEAD) renews the keys too, unless they are new: then it is
+        backed off as a quota.
+    """
+
+    def __init__(self, max_connections, max_bandwidth=None, max_attempts=8, base_delay=2.0, max_delay=300.0, renew_s3_keys=None):
+        self.max_connections = max_connections
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.renew_s3_keys = renew_s3_keys
+        
+        self._connections = threading.BoundedSemaphore(max_connections)
+        self._bandwidth = TokenBucket(max_bandwidth) if max_bandwidth else None
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+
+    def throttle(self, nbytes):
+        if self._bandwidth is not None:
+            self._bandwidth.consume(nbytes)
+
+    def backoff(self, attempt):
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        return delay
+
+    def _wait_if_paused(self):
+        while True:
+            with self._lock:
+                wait = self._paused_until - time.monotonic()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def call(self, func, *args, **kwargs):
+        """
+        Runs func(*args, **kwargs) holding one connection slot. Quota errors
+        pause every worker and are retried up to max_attempts times.
+        """
+        return self.call_with_stats(None, func, *args, **kwargs)
+
+    def call_with_stats(self, stats, func, *args, **kwargs):
+        """
+        As call(), counting the quota errors and retries in stats (TransferStats).
+        """
+        for attempt in range(self.max_attempts):
+            self._wait_if_paused()
+            with self._connections:
+                try:
+                    return func(*args, **kwargs)
+                except Exception as e:
+                    status = f_Quota_status(e)
+                    rejected = f_Is_S3_auth_error(e)
+                    # The answers to HEAD have no body: a 403 without error code may also be rejected keys
+                    unclear = status == 403 and f_S3_error_code(e) == "403"
+                    if status is not None and stats is not None:
+                        stats.add(quota_errors=1)
+                    if attempt == self.max_attempts - 1 or (status is None and (not rejected or self.renew_s3_keys is None)):
+                        raise
+            if stats is not None:
+                stats.add(retries=1)
+            if self.renew_s3_keys is not None and (rejected or unclear) and (self.renew_s3_keys() or rejected):
+                continue
+            delay = self.backoff(attempt)
+            print(f"           - WARNING: CDSE answered {status}. Backing off for {delay:.0f} seconds")
+
+
+class AggregateProgress:
+    """
+    Single tqdm bar shared by all the workers. The total grows as the objects
+    to download are discovered.
+    """
+
+    def __init__(self, desc="Downloading"):
+        from tqdm import tqdm as tqdm
+        
+        self._bar = tqdm(total=0, unit="B", unit_scale=True, desc=desc, ncols=80)
+        self._lock = threading.Lock()
+
+    def add_total(self, nbytes):
+        with self._lock:
+            self._bar.total = self._bar.total + nbytes
+            self._bar.refresh()
+
+    def update(self, nbytes):
+        with self._lock:
+            self._bar.update(nbytes)
+
+    def close(self):
+        self._bar.close()
+
+
+def f_Load_part_state(route_to_state, size, etag, part_size):
+    """
+    Returns the indices of the ranges already written to the .part file, or an
+    empty set if there is no state or it belongs to another version of the object.
+    """
+    if not route_to_state.exists():
+        return set()
+    try:
+        state = json.loads(route_to_state.read_text())
+    except ValueError:
+        return set()
+    if (state.get("size"), state.get("etag"), state.get("part_size")) != (size, etag, part_size):
+        return set()
+    return set(state.get("done", []))
+
+
+def f_Save_part_state(route_to_state, size, etag, part_size, done):
+    route_to_tmp = route_to_state.with_name(route_to_state.name + ".tmp")
+    route_to_tmp.write_text(json.dumps({"size": size, "etag": etag, "part_size": part_size, "done": sorted(done)}))
+    os.replace(route_to_tmp, route_to_state)
+
+
+def f_Download_ranges(s3, bucket, key, local_path, size, etag, transfer_config, limiter, progress, max_attempts=3, stats=None):
+    """
+    Downloads an object as byte ranges of transfer_config.multipart_chunksize
+    bytes, up to transfer_config.max_concurrency of them at once, into
+    "<local_path>.part". The ranges already written are recorded in
+    "<local_path>.part.json", so an interrupted download resumes from them
+    instead of starting over. The .part file is renamed to local_path only
+    when every range has been written.
+    """
+    from botocore.exceptions import ClientError as ClientError
+    
+    if stats is None:
+        stats = TransferStats()
+    
+    route_to_part = Path(f"{local_path}.part")
+    route_to_state = Path(f"{local_path}.part.json")
+    
+    part_size = transfer_config.multipart_chunksize if size >= transfer_config.multipart_threshold else max(size, 1)
+    ranges = [(index, start, min(start + part_size, size) - 1) for index, start in enumerate(range(0, size, part_size))]
+    
+    done = f_Load_part_state(route_to_state, size, etag, part_size) if route_to_part.exists() else set()
+    if not done:
+        # Nothing to resume: (re)create the .part file with its final size
+        with open(route_to_part, "wb") as f:
+            f.truncate(size)
+    
+    resumed = sum(end - start + 1 for index, start, end in ranges if index in done)
+    if resumed:
+        print(f"           - Resuming {os.path.basename(local_path)} ({resumed} of {size} bytes already downloaded)")
+        progress.update(resumed)
+    
+    lock = threading.Lock()
+    
+    def fetch(index, start, end):
+        transferred = 0
+        try:
+            response = s3.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}", IfMatch=etag)
+            with open(route_to_part, "r+b") as f:
+                f.seek(start)
+                for chunk in response["Body"].iter_chunks(1024 * 1024):
+                    f.write(chunk)
+                    transferred = transferred + len(chunk)
+                    progress.update(len(chunk))
+                    stats.add(bytes=len(chunk))
+                    limiter.throttle(len(chunk))
+            if transferred != end - start + 1:
+                raise IOError(f"Range {start}-{end} of {key} truncated ({transferred} bytes)")
+        except Exception:
+            # The range is fetched again from its start, so take back its bytes
+            progress.update(-transferred)
+            raise
+        
+        with lock:
+            done.add(index)
+            f_Save_part_state(route_to_state, size, etag, part_size, done)
+    
+    def fetch_with_retries(index, start, end):
+        for attempt in range(max_attempts):
+            try:
+                return limiter.call_with_stats(stats, fetch, index, start, end)
+            except ClientError as e:
+                if e.response.get("ResponseMetadata", {}).get("HTTPStatusCode") == 412:
+                    # The object changed on the server: the .part file can not be resumed
+                    route_to_state.unlink(missing_ok=True)
+                    raise
+                if attempt == max_attempts - 1:
+                    raise
+            except Exception:
+                # Dropped connections and truncated ranges: fetch the range again
+                if attempt == max_attempts - 1:
+                    raise
+            stats.add(retries=1)
+    
+    pending = [r for r in ranges if r[0] not in done]
+    with ThreadPoolExecutor(max_workers=max(1, transfer_config.max_concurrency)) as pool:
+        for future in as_completed([pool.submit(fetch_with_retries, *r) for r in pending]):
+            future.result()
+    
+    if route_to_part.stat().st_size != size:
+        raise IOError(f"Size mismatch for {key} ({route_to_part.stat().st_size} != {size})")
+    
+    os.replace(route_to_part, local_path)
+    route_to_state.unlink(missing_ok=True)
+
+
+class S3RangeFile(io.RawIOBase):
+    """
+    Read-only, seekable file object over an S3 object. Every read is served
+    with HTTP byte-range requests of block_size bytes, and the last
+    max_blocks blocks are kept in memory, so libraries that read a file
+    piece by piece (e.g. h5netcdf/h5py reading HDF5 chunks) only transfer
+    the parts of the object they actually need. A block whose read fails
+    (dropped connection, truncated body) is fetched again, up to max_attempts
+    times, as the ranges of f_Download_ranges.
+    """
+
+    def __init__(self, s3, bucket, key, size=None, etag=None, limiter=None, progress=None, block_size=2 * 1024 * 1024, max_blocks=64, stats=None, max_attempts=3):
+        super().__init__()
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.limiter = limiter if limiter is not None else QuotaLimiter(max_connections=1)
+        self.progress = progress
+        self.stats = stats if stats is not None else TransferStats()
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self.max_attempts = max_attempts
+        self.transferred = 0
+        
+        if size is None or etag is None:
+            head = self.limiter.call(s3.head_object, Bucket=bucket, Key=key)
+            size, etag = head["ContentLength"], head.get("ETag")
+        self.size = size
+        self.etag = etag
+        
+        self._position = 0
+        self._blocks = collections.OrderedDict()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position = self._position + offset
+        elif whence == io.SEEK_END:
+            self._position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence ({whence})")
+        return self._position
+
+    def _block(self, index):
+        from botocore.exceptions import ClientError as ClientError
+        
+        if index in self._blocks:
+            self._blocks.move_to_end(index)
+            return self._blocks[index]
+        
+        start = index * self.block_size
+        end = min(start + self.block_size, self.size) - 1
+        
+        def fetch():
+            response = self.s3.get_object(Bucket=self.bucket, Key=self.key, Range=f"bytes={start}-{end}", IfMatch=self.etag)
+            data = response["Body"].read()
+            if len(data) != end - start + 1:
+                raise IOError(f"Range {start}-{end} of {self.key} truncated ({len(data)} bytes)")
+            return data
+        
+        for attempt in range(self.max_attempts):
+            try:
+                data = self.limiter.call_with_stats(self.stats, fetch)
+                break
+            except ClientError as e:
+                # The object changed on the server (412), or the error persists
+                if e.response.get("ResponseMetadata", {}).get("HTTPStatusCode") == 412 or attempt == self.max_attempts - 1:
+                    raise
+            except Exception:
+                # Dropped connections and truncated ranges: fetch the block again
+                if attempt == self.max_attempts - 1:
+                    raise
+            self.stats.add(retries=1)
+        self.limiter.throttle(len(data))
+        self.transferred = self.transferred + len(data)
+        self.stats.add(bytes=len(data))
+        if self.progress is not None:
+            self.progress.add_total(len(data))
+            self.progress.update(len(data))
+        
+        self._blocks[index] = data
+        if len(self._blocks) > self.max_blocks:
+            self._blocks.popitem(last=False)
+        return data
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast("B")
+        length = min(len(view), max(0, self.size - self._position))
+        written = 0
+        while written < length:
+            index, offset = divmod(self._position, self.block_size)
+            data = self._block(index)[offset:offset + length - written]
+            view[written:written + len(data)] = data
+            written = written + len(data)
+            self._position = self._position + len(data)
+        return written
+
+
+def f_Parse_bbox(bbox, lat, lon):
+    """
+    Parameters
+    ----------
+    bbox : list
+        [lon_min, lat_min, lon_max, lat_max] (West, South, East, North), in degrees.
+    lat, lon : array
+        Coordinates of the grid.
+
+    Returns
+    -------
+    selection : dict
+        {"lat": slice, "lon": slice} to pass to .sel(), taking into account whether lat/lon are ascending or descending.
+    """
+    lon_min, lat_min, lon_max, lat_max = bbox
+    if lon_min > lon_max or lat_min > lat_max:
+        raise ValueError(f"Invalid bbox {bbox}: it must be lon_min lat_min lon_max lat_max")
+    
+    lat_slice = slice(lat_max, lat_min) if lat[0] > lat[-1] else slice(lat_min, lat_max)
+    lon_slice = slice(lon_max, lon_min) if lon[0] > lon[-1] else slice(lon_min, lon_max)
+    
+    return {"lat": lat_slice, "lon": lon_slice}
+
+
+def f_Download_bbox(s3, bucket, key, local_path, size, etag, bbox, limiter, progress, stats=None):
+    """
+    Reads only the bbox window of the variables of interest (config["bbox_variables"])
+    directly from the NC object in S3, through byte-range reads of the HDF5
+    chunks that intersect the window, and writes it to local_path. The whole
+    object is never downloaded.
+    """
+    f_Running(f_Download_bbox)
+    
+    # Optional dependencies, only needed in this mode
+    import xarray as xr
+    
+    route_to_part = Path(f"{local_path}.part")
+    
+    remote = S3RangeFile(s3, bucket, key, size, etag, limiter, progress, stats=stats)
+    with xr.open_dataset(remote, engine="h5netcdf", decode_cf=False, mask_and_scale=False) as raw_NC_ds:
+        variables = [name for name in config["bbox_variables"] if name in raw_NC_ds.variables]
+        subset = raw_NC_ds[variables].sel(f_Parse_bbox(bbox, raw_NC_ds["lat"].values, raw_NC_ds["lon"].values))
+        
+        if subset.sizes["lat"] == 0 or subset.sizes["lon"] == 0:
+            raise ValueError(f"The bbox {bbox} does not intersect {os.path.basename(local_path)}")
+        
+        subset = subset.load()
+        
+        # Keep the compression and the chunk layout of the original variables
+        encoding = {}
+        for name in variables:
+            chunksizes = raw_NC_ds[name].encoding.get("chunksizes")
+            encoding[name] = {"zlib": True, "complevel": 4}
+            if chunksizes:
+                encoding[name]["chunksizes"] = tuple(min(c, n) for c, n in zip(chunksizes, subset[name].shape))
+        
+        subset.attrs["bbox"] = list(bbox)
+        with netCDF_lock:
+            subset.to_netcdf(route_to_part, format="NETCDF4", engine="netcdf4", encoding=encoding)
+    
+    print(f"           - {remote.transferred} of {size} bytes read from {os.path.basename(key)}")
+    
+    os.replace(route_to_part, local_path)
+
+
+def download_file_s3(s3, bucket, key, local_path, failed, limiter=None, progress=None, transfer_config=None, bbox=None, stats=None):
+    f_Running(download_file_s3)
+    
+    if limiter is None:
+        limiter = QuotaLimiter(max_connections=1)
+    
+    if transfer_config is None:
+        transfer_config = f_Transfer_config()
+    
+    own_progress = progress is None
+    if own_progress:
+        progress = AggregateProgress(format_filename(os.path.basename(local_path)))
+    
+    try:
+        head = limiter.call_with_stats(stats, s3.head_object, Bucket=bucket, Key=key)
+        size = head["ContentLength"]
+        if own_progress:
+            progress.add_total(size)
+        
+        is_NC = local_path.endswith(".nc")
+        record = {"name": os.path.basename(local_path), "key": key, "size": size, "etag": head.get("ETag")}
+        
+        # Only the bbox window of the NC files is read, straight from S3
+        if bbox is not None and is_NC:
+            f_Download_bbox(s3, bucket, key, local_path, size, head.get("ETag"), bbox, limiter, progress, stats)
+            record["size"] = os.path.getsize(local_path)
+            if not f_Is_valid_NC(local_path, record["size"]):
+                os.remove(local_path)
+                raise IOError(f"{os.path.basename(local_path)} is not a valid NC file")
+            return record
+        
+        # The other objects of the product (small) are downloaded in full, so they
+        # are on disk with the size recorded in the manifest (see Manifest.is_complete)
+        if bbox is not None and not own_progress:
+            progress.add_total(size)
+        
+        # A complete file is never downloaded twice (e.g. files downloaded before the manifest existed)
+        if os.path.exists(local_path) and os.path.getsize(local_path) == size and (not is_NC or f_Is_valid_NC(local_path, size)):
+            progress.update(size)
+            return record
+        
+        f_Download_ranges(s3, bucket, key, local_path, size, head.get("ETag"), transfer_config, limiter, progress, stats=stats)
+        
+        # Verify the file before accepting it
+        if is_NC and not f_Is_valid_NC(local_path, size):
+            os.remove(local_path)
+            raise IOError(f"{os.path.basename(local_path)} is not a valid NC file")
+        
+        return record
+
+    except Exception as e:
+        failed.append(key)
+        print(f"Download failed: {key} ({e})")
+    
+    finally:
+        if own_progress:
+            progress.close()
+
+
+def f_List_product_objects(s3, s3_path, local_root, limiter, listed=None):
+    """
+    Returns
+    -------
+    objects : list
+        (bucket, key, local_path, size) of every object of the product stored in s3_path.
+        If listed ([(key, size), ...], listed before) is given, S3 is not listed again.
+    """
+    f_Running(f_List_product_objects)
+    bucket, prefix = s3_path.lstrip("/").split("/", 1)
+    
+    if listed is not None:
+        return [(bucket, key, os.path.join(local_root, os.path.relpath(key, prefix)), size) for key, size in listed]
+    
+    def list_objects():
+        objects = []
+        for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                rel = os.path.relpath(obj["Key"], prefix)
+                objects.append((bucket, obj["Key"], os.path.join(local_root, rel), obj["Size"]))
+        return objects
+    
+    return limiter.call(list_objects)
+
+
+def traverse_and_download_s3(s3_resource, bucket, prefix, local_root, failed, limiter=None, progress=None, transfer_config=None):
+    f_Running(traverse_and_download_s3)
+    bucket_obj = s3_resource.Bucket(bucket)
+
+    for obj in bucket_obj.objects.filter(Prefix=prefix):
+        rel = os.path.relpath(obj.key, prefix)
+        dest = os.path.join(local_root, rel)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+
+        download_file_s3(
+            s3_resource.meta.client,
+            bucket,
+            obj.key,
+            dest,
+            failed,
+            limiter,
+            progress,
+            transfer_config,
+        )
+
+
+
+def f_Downloader(session, eo_product_name, output_dir, s3_path=None, limiter=None, progress=None, transfer_config=None):
+    f_Running(f_Downloader)
+
+    if s3_path is None:
+        _, s3_path = get_eo_product_details(
+            session.config, session.headers, eo_product_name
+        )
+    bucket, prefix = s3_path.lstrip("/").split("/", 1)
+
+    s3_resource = session.s3_resource
+
+    # os.makedirs(eo_product_name, exist_ok=True)
+
+    failed = []
+    traverse_and_download_s3(
+        s3_resource,
+        bucket,
+        prefix,
+        # os.path.join(output_dir, eo_product_name),
+        output_dir,
+        failed,
+        limiter,
+        progress,
+        transfer_config,
+    )
+
+    if failed:
+        raise RuntimeError(
+            f"Download incomplete ({len(failed)} files failed)"
+        )
+
+
+def f_Download_concurrently(session, Bucket_list, S3_paths, output_dir, workers, limiter, transfer_config=None, manifest=None, on_product_done=None, bbox=None, objects=None, on_product_listed=None):
+    """
+    Downloads the products of Bucket_list with a pool of `workers` threads.
+    Several products, and several objects of each product, are downloaded at
+    once, always within the limits set by limiter. The progress of all the
+    downloads is shown in a single bar. Every product whose files were all
+    downloaded and verified is recorded in manifest, and passed to
+    on_product_done(eo_product_name, files) if given. If bbox is given,
+    only that window of the NC files is read (see f_Download_bbox). The
+    products in objects ({eo_product_name: [(key, size), ...]}) are not
+    listed again; every product listed is passed to
+    on_product_listed(eo_product_name, [(key, size), ...]) if given.
+
+    Returns
+    -------
+    failed : dict
+        {eo_product_name: [keys that could not be downloaded]} for the products that failed.
+    """
+    from tqdm import tqdm as tqdm
+    
+    f_Running(f_Download_concurrently)
+    
+    s3 = session.s3_client
+    failed = {name: [] for name in Bucket_list}
+    records = {name: [] for name in Bucket_list}
+    remaining = {}
+    counter = 0
+    # Transfer counters and start time of every product, for the metrics
+    stats = {name: TransferStats() for name in Bucket_list}
+    started = {name: time.perf_counter() for name in Bucket_list}
+    
+    def list_product(name):
+        if objects is not None and name in objects:
+            return f_List_product_objects(s3, S3_paths[name], output_dir, limiter, objects[name])
+        with metrics.stage("listing"):
+            listed = f_List_product_objects(s3, S3_paths[name], output_dir, limiter)
+        if listed and on_product_listed is not None:
+            on_product_listed(name, [(key, size) for bucket, key, dest, size in listed])
+        return listed
+    
+    progress = AggregateProgress()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as listing_pool, \
+             ThreadPoolExecutor(max_workers=workers) as download_pool:
+            
+            listings = {
+                listing_pool.submit(list_product, name): name
+                for name in Bucket_list
+            }
+            
+            downloads = {}
+            for future in as_completed(listings):
+                name = listings[future]
+                try:
+                    objects = future.result()
+                except Exception as e:
+                    failed[name].append(S3_paths[name])
+                    print(f"Listing failed: {name} ({e})")
+                    metrics.product(name, "failed", time.perf_counter() - started[name], stats[name])
+                    continue
+                
+                if not objects:
+                    failed[name].append(S3_paths[name])
+                    print(f"Listing failed: {name} (no objects found)")
+                    metrics.product(name, "failed", time.perf_counter() - started[name], stats[name])
+                    continue
+                
+                remaining[name] = len(objects)
+                for bucket, key, dest, size in objects:
+                    os.makedirs(os.path.dirname(dest), exist_ok=True)
+                    # With a bbox, the bar grows with the bytes actually read
+                    if bbox is None:
+                        progress.add_total(size)
+                    downloads[download_pool.submit(
+                        download_file_s3, s3, bucket, key, dest, failed[name], limiter, progress, transfer_config, bbox, stats[name]
+                    )] = (name, dest)
+            
+            for future in as_completed(downloads):
+                name, dest = downloads[future]
+                remaining[name] = remaining[name] - 1
+                if future.result() is not None:
+                    # Files are recorded by their route relative to the manifest
+                    records[name].append(dict(future.result(), name=Path(os.path.relpath(dest, output_dir)).as_posix()))
+                if remaining[name] == 0:
+                    if manifest is not None and not failed[name]:
+                        manifest.record(name, S3_paths[name], records[name], bbox)
+                    if on_product_done is not None and not failed[name]:
+                        on_product_done(name, records[name])
+                    counter = counter + 1
+                    status = "failed" if failed[name] else "downloaded"
+                    metrics.product(name, status, time.perf_counter() - started[name], stats[name])
+                    tqdm.write(f"           - {name} {status}. {counter} of {len(Bucket_list)} products done.")
+    finally:
+        progress.close()
+    
+    return {name: keys for name, keys in failed.items() if keys}
+        
+
+class JobQueue:
+    """
+    Persistent table of download jobs, kept in an SQLite database
+    (by default, Ancillary/download_jobs.sqlite). Every product goes through
+
+        pending → resolving → pending → downloading → verified
+
+    and a failed download goes back to pending, to be retried after an
+    exponential backoff (retry_delay * 2 ** (attempts - 1) seconds). After
+    max_attempts attempts it is moved to failed, the dead-letter list, and
+    is not retried unless requested (--retry-failed).
+
+    As the S3 path of every product, and the objects (key and size) listed in
+    it, are stored with its job, a run that restarts after a crash picks up
+    the unfinished jobs without resolving or listing anything again. The selection (--start, --end, --bbox) of the last run
+    that queued jobs is kept too (see selection).
+    """
+
+    STATES = ("pending", "resolving", "downloading", "verified", "failed")
+
+    def __init__(self, route_to_database, max_attempts=5, retry_delay=30.0):
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(route_to_database), check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                name TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                s3_path TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL DEFAULT 0,
+                last_error TEXT,
+                updated TEXT,
+                objects TEXT
+            )
+            """
+        )
+        # Tables created before the objects were stored with the jobs
+        if "objects" not in [row[1] for row in self._connection.execute("PRAGMA table_info(jobs)")]:
+            self._connection.execute("ALTER TABLE jobs ADD COLUMN objects TEXT")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS selection (id INTEGER PRIMARY KEY CHECK (id = 0), value TEXT NOT NULL)")
+
+    def _execute(self, query, parameters=()):
+        with self._lock:
+            return self._connection.execute(query, parameters).fetchall()
+
+    def _now(self):
+        return datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def enqueue(self, names):
+        """
+        Adds names as pending jobs. Jobs that were verified are queued again
+        (the manifest says their files are missing or corrupt); dead letters and
+        unfinished jobs are kept as they are, so queueing a name twice does nothing.
+        """
+        for name in names:
+            self._execute(
+                "INSERT INTO jobs (name, state, updated) VALUES (?, 'pending', ?) "
+                "ON CONFLICT(name) DO UPDATE SET state = 'pending', attempts = 0, next_attempt = 0, updated = excluded.updated "
+                "WHERE state = 'verified'",
+                (name, self._now()),
+            )
+
+    def selection(self):
+        """
+        Returns the selection (JSON) recorded by the last run that queued jobs, or None.
+        """
+        rows = self._execute("SELECT value FROM selection WHERE id = 0")
+        return rows[0][0] if rows else None
+
+    def set_selection(self, selection):
+        self._execute("INSERT OR REPLACE INTO selection (id, value) VALUES (0, ?)", (selection,))
+
+    def reset_interrupted(self):
+        """
+        Jobs left resolving or downloading by a run that did not finish go back to pending.
+        """
+        rows = self._execute("SELECT name FROM jobs WHERE state IN ('resolving', 'downloading')")
+        self._execute("UPDATE jobs SET state = 'pending', updated = ? WHERE state IN ('resolving', 'downloading')", (self._now(),))
+        return len(rows)
+
+    def retry_failed(self):
+        rows = self._execute("SELECT name FROM jobs WHERE state = 'failed'")
+        self._execute("UPDATE jobs SET state = 'pending', attempts = 0, next_attempt = 0, updated = ? WHERE state = 'failed'", (self._now(),))
+        return len(rows)
+
+    def set_state(self, names, state, s3_paths=None):
+        for name in names:
+            if s3_paths is not None and name in s3_paths:
+                self._execute("UPDATE jobs SET state = ?, s3_path = ?, updated = ? WHERE name = ?", (state, s3_paths[name], self._now(), name))
+            else:
+                self._execute("UPDATE jobs SET state = ?, updated = ? WHERE name = ?", (state, self._now(), name))
+
+    def set_objects(self, name, objects):
+        """
+        Stores the objects [(key, size), ...] listed in the S3 path of the job.
+        """
+        self._execute("UPDATE jobs SET objects = ? WHERE name = ?", (json.dumps(objects), name))
+
+    def objects(self, names):
+        """
+        Returns
+        -------
+        objects : dict
+            {name: [(key, size), ...]} of the jobs of names whose objects were listed.
+        """
+        names = set(names)
+        rows = self._execute("SELECT name, objects FROM jobs WHERE objects IS NOT NULL")
+        return {name: [tuple(obj) for obj in json.loads(objects)] for name, objects in rows if name in names}
+
+    def fail(self, name, error):
+        """
+        Records a failed attempt: the job is retried after a backoff, or moved
+        to the dead-letter list once it has used up its attempts.
+        """
+        attempts = self._execute("SELECT attempts FROM jobs WHERE name = ?", (name,))[0][0] + 1
+        if attempts >= self.max_attempts:
+            state, next_attempt = "failed", 0
+        else:
+            state, next_attempt = "pending", time.time() + self.retry_delay * 2 ** (attempts - 1)
+        self._execute(
+            "UPDATE jobs SET state = ?, attempts = ?, next_attempt = ?, last_error = ?, updated = ? WHERE name = ?",
+            (state, attempts, next_attempt, str(error), self._now(), name),
+        )
+        return state
+
+    def names(self, state):
+        return [row[0] for row in self._execute("SELECT name FROM jobs WHERE state = ? ORDER BY name", (state,))]
+
+    def due(self):
+        """
+        Returns
+        -------
+        S3_paths : dict
+            {name: s3_path} of the pending jobs whose backoff has expired, resolved
+            (s3_path) or not (None). These are the jobs next_retry waits for.
+        """
+        rows = self._execute("SELECT name, s3_path FROM jobs WHERE state = 'pending' AND next_attempt <= ? ORDER BY name", (time.time(),))
+        return dict(rows)
+
+    def unresolved(self):
+        return [name for name, s3_path in self.due().items() if s3_path is None]
+
+    def ready(self):
+        """
+        Returns
+        -------
+        S3_paths : dict
+            {name: s3_path} of the resolved pending jobs whose backoff has expired.
+        """
+        return {name: s3_path for name, s3_path in self.due().items() if s3_path is not None}
+
+    def next_retry(self):
+        """
+        Returns the time (time.time()) of the next pending retry, or None if there
+        are no pending jobs. Once it has passed, its job is due (see due()).
+        """
+        rows = self._execute("SELECT MIN(next_attempt) FROM jobs WHERE state = 'pending'")
+        return rows[0][0]
+
+    def dead_letters(self):
+        return self._execute("SELECT name, attempts, last_error FROM jobs WHERE state = 'failed' ORDER BY name")
+
+    def counts(self):
+        return dict(self._execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"))
+
+
+def f_Report_dead_letters(jobs):
+    f_Running(f_Report_dead_letters)
+    
+    Dead_letters = jobs.dead_letters()
+    for name, attempts, last_error in Dead_letters:
+        print(f"           - FAILED after {attempts} attempts: {name} ({last_error})")
+    if Dead_letters:
+        print("           - Run with --retry-failed to queue them again")
+    
+    return Dead_letters
+
+
+def f_Resolve_jobs(jobs, session, Directories):
+    """
+    Resolves the S3 path of the due jobs that are not resolved yet, all at
+    once. The paths are stored with the jobs, so they are never resolved
+    again. The products that can not be resolved count as a failed attempt.
+    """
+    unresolved = jobs.unresolved()
+    if not unresolved:
+        return
+    
+    f_Running(f_Resolve_jobs)
+    jobs.set_state(unresolved, "resolving")
+    errors = {}
+    try:
+        S3_paths = f_Resolve_S3_paths(session, unresolved, Directories, errors)
+    except Exception as e:
+        S3_paths = {}
+        errors = {name: e for name in unresolved}
+    
+    jobs.set_state(list(S3_paths), "pending", S3_paths)
+    for name in unresolved:
+        if name not in S3_paths:
+            state = jobs.fail(name, errors.get(name, "not found in the catalogue"))
+            if state == "failed":
+                print(f"           - {name} moved to the dead-letter list")
+
+
+def f_Run_jobs(jobs, session, Directories, args, limiter, transfer_config, manifest, on_product_done=None):
+    """
+    Resolves and downloads the pending jobs until none is left. Failed
+    products (resolution included) are retried after their backoff, until
+    they are verified or moved to the dead-letter list. Every verified
+    product is also passed to on_product_done(eo_product_name, files), if given.
+    """
+    f_Running(f_Run_jobs)
+    
+    def product_done(eo_product_name, files):
+        jobs.set_state([eo_product_name], "verified")
+        if on_product_done is not None:
+            on_product_done(eo_product_name, files)
+    
+    while True:
+        f_Resolve_jobs(jobs, session, Directories)
+        S3_paths = jobs.ready()
+        
+        if not S3_paths:
+            next_retry = jobs.next_retry()
+            if next_retry is None:
+                return
+            wait = max(0.0, next_retry - time.time())
+            print(f"           - Waiting {wait:.0f} seconds for the next retry")
+            time.sleep(wait)
+            continue
+        
+        Bucket_list = list(S3_paths)
+        jobs.set_state(Bucket_list, "downloading")
+        
+        failed = f_Download_concurrently(
+            session, Bucket_list, S3_paths, Directories["Outputs_downloaded"], args.workers, limiter, transfer_config, manifest,
+            on_product_done=product_done,
+            bbox=args.bbox,
+            objects=jobs.objects(Bucket_list),
+            on_product_listed=jobs.set_objects,
+        )
+        
+        for name, keys in failed.items():
+            state = jobs.fail(name, f"{len(keys)} files failed: {', '.join(keys)}")
+            if state == "failed":
+                print(f"           - {name} moved to the dead-letter list")
+        
+        print(f"           - {len(Bucket_list) - len(failed)} products downloaded. {len(failed)} products failed.")
+
+
+def f_Queue_jobs(args, Directories):
+    """
+    Returns
+    -------
+    jobs : JobQueue
+        Job table of Ancillary/download_jobs.sqlite, with the products pending to
+        download (--start, --end, --bbox) queued on top of the unfinished jobs.
+    """
+    f_Running(f_Queue_jobs)
+    
+    # Download the csv with all the available dates (note that this will be
+    # downloaded in the input folder, as it will be an input in a later process),
+    # compare the available dates with the currently downloaded ones and queue
+    # the files yet to download, on top of the jobs of a run that did not finish
+    jobs = JobQueue(Directories["Ancillary"] / "download_jobs.sqlite", args.max_attempts, config["job_retry_delay"])
+    
+    Number_of_interrupted_jobs = jobs.reset_interrupted()
+    if Number_of_interrupted_jobs:
+        print(f"           - {Number_of_interrupted_jobs} interrupted jobs resumed")
+    if args.retry_failed:
+        print(f"           - {jobs.retry_failed()} failed jobs queued again")
+    
+    selection = json.dumps({
+        "start": args.start.strftime("%Y-%m-%d") if args.start is not None else None,
+        "end": args.end.strftime("%Y-%m-%d") if args.end is not None else None,
+        "bbox": args.bbox,
+    }, sort_keys=True)
+    Number_of_unfinished_jobs = len(jobs.names("pending"))
+    if Number_of_unfinished_jobs:
+        print(f"           - Resuming {Number_of_unfinished_jobs} unfinished jobs")
+        # They are the products of this very selection: nothing to list again
+        if jobs.selection() == selection:
+            return jobs
+        if jobs.selection() is not None:
+            print(f"           - WARNING: The unfinished jobs were queued with another selection ({jobs.selection()}). They are downloaded too (with --bbox {args.bbox})")
+    
+    try:
+        jobs.enqueue(f_Bucket_list(Directories, args.start, args.end, args.bbox))
+    except Exception as e:
+        if not Number_of_unfinished_jobs:
+            raise
+        print(f"           - WARNING: The catalogue could not be listed ({e}). Only the unfinished jobs are downloaded")
+    else:
+        jobs.set_selection(selection)
+    
+    return jobs
+
+
+def f_Download(args, Directories):
+    """
+    Queues the products pending to download and downloads them (see main()).
+    """
+    f_Running(f_Download)
+    
+    # %% IMPORT THE CREDENTIALS
+    # Credentials to log in CDSE (https://dataspace.copernicus.eu/)
+    _username, _password = f_Import_credentials()
+    
+    # %% QUEUE THE BUCKET LIST
+    # The windows (--bbox) are kept in their own folder, apart from the products downloaded in full
+    Directories = f_Bbox_directories(Directories, args.bbox)
+    jobs = f_Queue_jobs(args, Directories)
+    
+    # Nothing to download: do not even log in
+    if not jobs.names("pending"):
+        f_Report_dead_letters(jobs)
+        return
+    
+    # %% DOWNLOAD THE PRODUCTS
+    # A single session (one login, one pair of S3 keys) serves the whole run.
+    # SIGTERM is turned into a normal exit so the S3 keys are also deleted
+    # when the run is killed (e.g. by a scheduler)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+    
+    with CDSESession(config, _username, _password) as session:
+        # Download several products and objects at once, within the CDSE quotas
+        limiter = QuotaLimiter(
+            max_connections=args.max_connections,
+            max_bandwidth=args.max_bandwidth * 1e6 if args.max_bandwidth > 0 else None,
+            renew_s3_keys=session.renew_s3_keys,
+        )
+        if args.workers > args.max_connections:
+            print(f"           - WARNING: {args.workers} workers share {args.max_connections} connections")
+        
+        # Every object is downloaded as byte ranges into a resumable .part file
+        transfer_config = f_Transfer_config(args.part_size, args.max_concurrency)
+        
+        # The verified products are recorded in the manifest of Outputs_downloaded
+        manifest = Manifest(Directories["Outputs_downloaded"] / "manifest.json")
+        
+        f_Run_jobs(jobs, session, Directories, args, limiter, transfer_config, manifest)
+    
+    Dead_letters = f_Report_dead_letters(jobs)
+    jobs.close()
+    
+    if Dead_letters:
+        raise RuntimeError(
+            f"Download incomplete ({len(Dead_letters)} products failed: {', '.join(name for name, _, _ in Dead_letters)})"
+        )
+
+
+# %% MAIN FUNCTION
+def main():
+    print(__doc__)
+    print("RUN THE SCRIPT:")
+    f_Running(main)
+    
+    # %% LOAD THE INPUTS
+    args = parse_arguments()
+    
+    # %% DEFINE THE DIRECTORIES
+    Directories = f_Define_the_directories()
+    
+    # %% START THE METRICS
+    # Timings of every stage and counters of every product, in Ancillary/download_metrics.jsonl
+    f_Open_metrics(args, Directories)
+    try:
+        f_Download(args, Directories)
+    finally:
+        f_Close_metrics(args)
+
+    # %% ENDSCRIPT
+    print()
+    print("         Endscript");
+    
+    
+# %% RING BELL
+if __name__ == "__main__":
+    main()
+
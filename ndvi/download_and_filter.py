@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+TRACKING:
+    https://doi.org/10.5281/zenodo.18620398
+    Product developped by LABIF-UCO ("https://labif.es/").
+    Version 20261017a (last modified by Juanan).
+
+OBJECTIVE:
+    To download and filter, in a single pipelined run, all the products pending to download of the "Normalised Difference Vegetation Index 2014-present (raster 300 m), global, 10-daily – version 3" (DOI: "https://doi.org/10.2909/905223f4-2c3d-4cb6-ad8c-d6d065707465") product of CLMS.
+
+INFORMATION:
+    https://land.copernicus.eu/en/products/vegetation/normalised-difference-vegetation-index-v3-0-300m
+    Generated using European Union's Copernicus Land Monitoring Service information; doi.org/10.2909/905223f4-2c3d-4cb6-ad8c-d6d065707465.
+
+    This script does as follows:
+
+    1) Queues the products pending to download, exactly as Launch_me_to_download_NDVI.py does.
+    2) Downloads them with the download workers. Every product that is downloaded and verified is handed, through a bounded queue, to the filter workers.
+    3) The filter workers filter every product as it lands, with the same uncertainty/NOBS/QFLAG logic as Launch_me_to_filter.py, while the next products are being downloaded.
+    4) Optionally, deletes the raw file once its filtered output exists.
+
+    Products that were already downloaded (and verified) but not filtered yet are filtered too.
+
+EXAMPLES:
+
+    run Launch_me_to_download_and_filter.py
+        Downloads and filters every pending product with the default parameters of both scripts.
+
+    run Launch_me_to_download_and_filter.py --workers 4 --filter-workers 2 --queue-size 4 --delete-raw --Thr_uncertainty 0.28 --Filter_by_NOBS_off
+        Downloads with 4 workers, filters with 2 workers, keeps at most 4 downloaded products waiting to be filtered, and deletes every raw file once filtered.
+
+WARNINGS:
+    Accepts every argument of Launch_me_to_download_NDVI.py and of Launch_me_to_filter.py.
+    The warnings of both scripts apply.
+"""
+
+# %% IMPORT THE LIBRARIES
+from pathlib import Path as Path
+
+import argparse as argparse
+import os as os
+import queue as queue
+import signal as signal
+import sys as sys
+import threading as threading
+import time as time
+
+from ndvi import download as downloader
+from ndvi import filter as NDVI_filter
+
+
+# %% PREVIOUS INFORMATION
+# This Script requires the following information to run smoothly:
+
+# %% ANCILLARY FUNCTIONS
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Download and filter the NDVI products pending to download, in a single pipelined run"
+    )
+
+    downloader.add_arguments(parser)
+    NDVI_filter.add_arguments(parser)
+    # The --bbox of the downloader also sets the region of the filter
+    NDVI_filter.add_region_arguments(parser, bbox=False)
+
+    # --- PIPELINE ---
+    parser.add_argument(
+        "--filter-workers",
+        type=int,
+        default=1,
+        help="Number of products filtered at once"
+    )
+
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=2,
+        help="Maximum number of downloaded products waiting to be filtered"
+    )
+
+    parser.add_argument(
+        "--delete-raw",
+        action="store_true",
+        help="Delete every raw file once its filtered output exists"
+    )
+
+    return parser.parse_args()
+
+
+def f_list_of_pending_to_filter(manifest, Directories, Parameters):
+    """
+    Returns
+    -------
+    pending : list
+        (eo_product_name, files) of the products recorded in the manifest whose raw files
+        are complete but have not been filtered yet, or whose filtered files are stale
+        (see NDVI_filter.f_Is_up_to_date).
+    """
+    downloader.f_Running(f_list_of_pending_to_filter)
+
+    pending = []
+    for eo_product_name, record in manifest.records.items():
+        if record.get("raw_deleted") or not manifest.is_complete(eo_product_name, record.get("bbox")):
+            continue
+        if any(
+            file["name"].endswith(".nc") and not NDVI_filter.f_Is_up_to_date(file["name"], Directories, Parameters)
+            for file in record["files"]
+        ):
+            pending.append((eo_product_name, record["files"]))
+
+    print(f"           - {len(pending)} downloaded products remain to be filtered")
+
+    return pending
+
+
+def f_Filter_worker(products_queue, Directories, Parameters, manifest, delete_raw, results):
+    """
+    Takes (eo_product_name, files) from products_queue and filters the NC
+    files of every product, until it gets None.
+    """
+    while True:
+        item = products_queue.get()
+        try:
+            if item is None:
+                return
+
+            eo_product_name, files = item
+            try:
+                routes_to_raw_NC = []
+                for file in files:
+                    if not file["name"].endswith(".nc"):
+                        continue
+
+                    route_to_output_NC = NDVI_filter.f_Filter_NC_file(file["name"], Directories, Parameters)
+                    if not downloader.f_Is_valid_NC(route_to_output_NC):
+                        raise IOError(f"{route_to_output_NC.name} is not a valid NC file")
+
+                    routes_to_raw_NC.append(Directories["Outputs_downloaded"] / file["name"])
+
+                # The raw files are only deleted once every filtered output exists
+                if delete_raw:
+                    for route_to_raw_NC in routes_to_raw_NC:
+                        route_to_raw_NC.unlink(missing_ok=True)
+                    manifest.mark_deleted(eo_product_name)
+
+                results["filtered"].append(eo_product_name)
+                print(f"           - {eo_product_name} filtered")
+
+            except Exception as e:
+                results["failed"].append(eo_product_name)
+                print(f"Filter failed: {eo_product_name} ({e})")
+
+        finally:
+            products_queue.task_done()
+
+
+def f_Download_and_filter(args, Directories, Parameters, start):
+    """
+    Downloads the pending products and filters them as they land (see main()).
+    """
+    downloader.f_Running(f_Download_and_filter)
+
+    # %% IMPORT THE CREDENTIALS
+    # Credentials to log in CDSE (https://dataspace.copernicus.eu/)
+    _username, _password = downloader.f_Import_credentials()
+
+    # %% QUEUE THE BUCKET LIST
+    # Products pending to download (queued in the job table, on top of the
+    # unfinished jobs), and products downloaded but not filtered yet. The windows
+    # (--bbox) are kept in their own folder, so they are also filtered from there
+    Directories = downloader.f_Bbox_directories(Directories, args.bbox)
+    jobs = downloader.f_Queue_jobs(args, Directories)
+    manifest = downloader.Manifest(Directories["Outputs_downloaded"] / "manifest.json")
+    Pending_to_filter = f_list_of_pending_to_filter(manifest, Directories, Parameters)
+    if args.start is not None or args.end is not None:
+        Selected = set(downloader.f_Select_dates([name for name, files in Pending_to_filter], args.start, args.end))
+        Pending_to_filter = [(name, files) for name, files in Pending_to_filter if name in Selected]
+
+    if not jobs.names("pending") and not Pending_to_filter:
+        downloader.f_Report_dead_letters(jobs)
+        jobs.close()
+        return
+
+    # %% START THE FILTER WORKERS
+    # The queue is bounded, so the downloads wait for the filters instead of piling raw files up on disk
+    products_queue = queue.Queue(maxsize=max(1, args.queue_size))
+    results = {"downloaded": [], "filtered": [], "failed": []}
+
+    filter_workers = [
+        threading.Thread(
+            target=f_Filter_worker,
+            args=(products_queue, Directories, Parameters, manifest, args.delete_raw, results),
+            daemon=True,
+        )
+        for _ in range(max(1, args.filter_workers))
+    ]
+    for worker in filter_workers:
+        worker.start()
+
+    try:
+        for item in Pending_to_filter:
+            products_queue.put(item)
+
+        # %% DOWNLOAD THE PRODUCTS
+        # The jobs are retried until verified or dead-lettered, and every verified
+        # product is marked in the job table and goes straight to the filter workers
+        if jobs.names("pending"):
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+
+            with downloader.CDSESession(downloader.config, _username, _password) as session:
+                limiter = downloader.QuotaLimiter(
+                    max_connections=args.max_connections,
+                    max_bandwidth=args.max_bandwidth * 1e6 if args.max_bandwidth > 0 else None,
+                    renew_s3_keys=session.renew_s3_keys,
+                )
+                transfer_config = downloader.f_Transfer_config(args.part_size, args.max_concurrency)
+
+                def on_product_done(eo_product_name, files):
+                    results["downloaded"].append(eo_product_name)
+                    products_queue.put((eo_product_name, files))
+
+                downloader.f_Run_jobs(jobs, session, Directories, args, limiter, transfer_config, manifest, on_product_done=on_product_done)
+
+    finally:
+        # %% STOP THE FILTER WORKERS
+        for _ in filter_workers:
+            products_queue.put(None)
+        for worker in filter_workers:
+            worker.join()
+
+    Dead_letters = downloader.f_Report_dead_letters(jobs)
+    jobs.close()
+
+    # %% SUMMARY
+    end = time.perf_counter()
+    print()
+    print(f"           - {len(results['downloaded'])} products downloaded. {len(Dead_letters)} products failed to download.")
+    print(f"           - {len(results['filtered'])} products filtered. {len(results['failed'])} products failed to filter.")
+    print(f"           - The process took {end - start:.2f} seconds")
+
+    if Dead_letters or results["failed"]:
+        raise RuntimeError(
+            f"Pipeline incomplete ({len(Dead_letters)} downloads and {len(results['failed'])} filters failed)"
+        )
+
+
+# %% MAIN FUNCTION
+def main():
+    print(__doc__)
+    print("RUN THE SCRIPT:")
+    downloader.f_Running(main)
+    start = time.perf_counter()
+
+    # %% LOAD THE INPUTS
+    args = parse_arguments()
+    Parameters = NDVI_filter.f_Filter_parameters(args)
+
+    # %% DEFINE THE DIRECTORIES
+    # The directories of the filter include those of the downloader
+    Directories = NDVI_filter.f_Define_the_directories()
+
+    # %% START THE METRICS
+    # Timings and counters of the downloads, in Ancillary/download_metrics.jsonl
+    downloader.f_Open_metrics(args, Directories)
+    try:
+        f_Download_and_filter(args, Directories, Parameters, start)
+    finally:
+        downloader.f_Close_metrics(args)
+
+    # %% ENDSCRIPT
+    print()
+    print("         Endscript");
+
+
+# %% RING BELL
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,597 @@
+# -*- coding: utf-8 -*-
+"""
+TRACKING:
+    https://doi.org/10.5281/zenodo.18620398
+    Product developped by LABIF-UCO ("https://labif.es/").
+    Version 20261017a (last modified by Juanan).
+
+OBJECTIVE:
+    To extract the NDVI time series of a batch of points (e.g. fire ignitions) or polygons (e.g. burn scars) from the filtered dekads (see Launch_me_to_filter.py) or from the time-series cube (see Launch_me_to_build_cube.py), reading every chunk of the NDVI only once, whatever the number of points.
+
+INFORMATION:
+    This script does as follows:
+
+    1) Reads the points (CSV with id, lon and lat) or the polygons (GeoJSON, with an id in their properties), and finds their pixels on the grid of the NDVI: the nearest pixel of every point, and the pixels whose centre is within every polygon (or the pixel of its centroid, if none).
+    2) Groups the pixels by the chunk of the NDVI they fall in.
+    3) Reads every chunk touched once (decoded on a thread pool, and kept in a cache of decoded chunks, least recently used first out), and takes the NDVI of all its pixels at once.
+    4) Saves a tidy table (CSV, one row per point or polygon and dekad): the NDVI of every point, or the number of pixels, the valid pixels and the mean, standard deviation, minimum and maximum NDVI of every polygon (physical values). The excluded pixels (NaN, or the _FillValue and the flags of the digital numbers) are left out.
+
+EXAMPLES:
+
+    run Launch_me_to_extract.py --points ../Inputs/ignitions.csv
+        Extracts the NDVI of every point of ignitions.csv (columns id, lon and lat) from every filtered dekad.
+
+    run Launch_me_to_extract.py --polygons ../Inputs/burn_scars.geojson --id-field fire_id --start 2019-01-01 --output burn_scars_NDVI.csv
+        Extracts the NDVI statistics of every burn scar (identified by its property fire_id) from 2019 on.
+
+    run Launch_me_to_extract.py --points ../Inputs/ignitions.csv --source cube --cache-size 1024
+        Extracts the NDVI of every point from the time-series cube, with a cache of 1024 MB of decoded chunks.
+
+WARNINGS:
+    The coordinates are in lon/lat (EPSG:4326). Points outside the grid are left out. Polygons from vector formats other than GeoJSON require geopandas.
+    Requires h5py to read the filtered dekads, and zarr to read the cube.
+"""
+
+# %% IMPORT THE LIBRARIES
+from pathlib import Path as Path
+
+import argparse as argparse
+import collections as collections
+from concurrent.futures import ThreadPoolExecutor as ThreadPoolExecutor
+import json as json
+import os as os
+import threading as threading
+import time as time
+
+import numpy as np
+
+from ndvi import download as downloader
+from ndvi import filter as NDVI_filter
+from ndvi import process as NDVI_process
+
+
+# %% PREVIOUS INFORMATION
+# This Script requires the following information to run smoothly:
+# Input 1: memory, in MB, of the cache of decoded chunks
+Cache_size = 256
+
+
+# %% ANCILLARY FUNCTIONS
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Extract the NDVI time series of a batch of points or polygons"
+    )
+
+    # --- LOCATIONS ---
+    locations = parser.add_mutually_exclusive_group(required=True)
+    locations.add_argument(
+        "--points",
+        type=Path,
+        help="CSV with the points (see --id-field, --lon-column and --lat-column), in lon/lat"
+    )
+
+    locations.add_argument(
+        "--polygons",
+        type=Path,
+        help="Vector file with the polygons (GeoJSON; other formats require geopandas), in lon/lat"
+    )
+
+    parser.add_argument(
+        "--id-field",
+        type=str,
+        default="id",
+        help="Column (points) or property (polygons) that identifies every location. By default, id (or the row number, if missing)"
+    )
+
+    parser.add_argument(
+        "--lon-column",
+        type=str,
+        default="lon",
+        help="Column of the longitude of the points"
+    )
+
+    parser.add_argument(
+        "--lat-column",
+        type=str,
+        default="lat",
+        help="Column of the latitude of the points"
+    )
+
+    # --- SOURCE ---
+    parser.add_argument(
+        "--source",
+        choices=["filtered", "cube"],
+        default="filtered",
+        help="Read the filtered dekads (Outputs_filtered), or the time-series cube (see Launch_me_to_build_cube.py)"
+    )
+
+    parser.add_argument(
+        "--cube",
+        type=Path,
+        default=None,
+        help="Route to the cube. By default, Outputs_cube/NDVI_cube.zarr"
+    )
+
+    # --- OUTPUT ---
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=None,
+        help="CSV where the table is saved. By default, Outputs_extracted/<points or polygons>_NDVI.csv"
+    )
+
+    # --- PERFORMANCE ---
+    parser.add_argument(
+        "--cache-size",
+        type=float,
+        default=Cache_size,
+        help="Memory, in MB, of the cache of decoded chunks"
+    )
+
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="Threads that decode the chunks. By default, as many as cores"
+    )
+
+    # Dates of the dekads extracted
+    NDVI_filter.add_selection_arguments(parser)
+
+    return parser.parse_args()
+
+
+class ChunkCache:
+    """
+    Cache of decoded chunks, up to max_bytes: the least recently used chunks are
+    dropped first. It is shared by the threads that decode the chunks.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.chunks = collections.OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, loader):
+        """
+        Returns the chunk of key, decoded by loader() if it is not in the cache.
+        """
+        with self.lock:
+            if key in self.chunks:
+                self.chunks.move_to_end(key)
+                self.hits += 1
+                return self.chunks[key]
+            self.misses += 1
+
+        chunk = loader()
+
+        with self.lock:
+            if key not in self.chunks and chunk.nbytes <= self.max_bytes:
+                self.chunks[key] = chunk
+                self.bytes += chunk.nbytes
+                while self.bytes > self.max_bytes:
+                    _, dropped = self.chunks.popitem(last=False)
+                    self.bytes -= dropped.nbytes
+        return chunk
+
+
+# Decoded chunks already read in this process (see ChunkCache)
+Chunk_cache = ChunkCache(Cache_size * 1e6)
+
+
+class NCChunks:
+    """
+    Chunks of the NDVI of a filtered NC file (one dekad), read along its native
+    chunk grid (see NDVI_filter.ChunkReader). The file is only opened when a
+    chunk is not in the cache.
+    """
+
+    def __init__(self, route_to_filtered_NC):
+        import xarray as xr
+
+        self.route = Path(route_to_filtered_NC)
+        # A file filtered again is another source
+        self.key = f"{self.route.resolve()}:{os.stat(self.route).st_mtime_ns}"
+        self.dates = [downloader.f_Date_of_product(self.route.name)]
+        self.keep = np.ones(1, dtype=bool)
+        with xr.open_dataset(self.route, decode_cf=False) as filtered_NC_ds:
+            NDVI = filtered_NC_ds["NDVI"]
+            self.NDVI_attrs = dict(NDVI.attrs)
+            self.lat, self.lon = filtered_NC_ds["lat"].values, filtered_NC_ds["lon"].values
+            self.shape = NDVI.shape[-2:]
+            self.chunks = tuple((NDVI.encoding.get("chunksizes") or NDVI.shape)[-2:])
+            self.dtype = NDVI.dtype
+        self.h5_file = None
+        self.reader = None
+        self.lock = threading.Lock()
+
+    def read(self, chunk):
+        """
+        Returns
+        -------
+        block : ndarray
+            Digital numbers (time, rows, columns) of the chunk (row, column of the chunk grid).
+        """
+        with self.lock:
+            if self.reader is None:
+                # Optional dependency, only needed to read the filtered dekads
+                import h5py as h5py
+
+                self.h5_file = h5py.File(self.route, "r")
+                self.reader = NDVI_filter.ChunkReader(self.h5_file["NDVI"])
+
+        dataset = self.reader.dataset
+        buffer = np.empty(dataset.chunks or dataset.shape, dtype=dataset.dtype)
+        offset = (0, chunk[0] * self.chunks[0], chunk[1] * self.chunks[1])
+        valid = NDVI_process.f_Read_block(self.reader, offset, (1, *self.chunks), buffer)
+        return buffer[valid]
+
+    def close(self):
+        if self.h5_file is not None:
+            self.h5_file.close()
+            self.h5_file = self.reader = None
+
+
+class ZarrChunks:
+    """
+    Chunks of one time chunk of the NDVI of the cube, or of its staging area (see
+    Launch_me_to_build_cube.py): every chunk read holds the history of its pixels
+    over the dekads of the time chunk.
+    """
+
+    def __init__(self, group, time_chunk, key):
+        NDVI = group["NDVI"]
+        time_size = NDVI.chunks[0]
+        days = group["time"][time_chunk * time_size:(time_chunk + 1) * time_size]
+        self.group = group
+        self.time_chunk = time_chunk
+        # The staging area, and the last time chunk of the cube, change as dekads are appended
+        self.key = f"{key}:{days[0] if days.size else ''}:{days.size}"
+        self.dates = [(np.datetime64("1970-01-01") + np.timedelta64(int(day), "D")).astype("datetime64[s]").item() for day in days]
+        # Dekads of the time chunk that are extracted (see f_Sources)
+        self.keep = np.ones(len(self.dates), dtype=bool)
+        self.NDVI_attrs = {**{k: v for k, v in NDVI.attrs.items() if k != "_ARRAY_DIMENSIONS"}, "_FillValue": NDVI.fill_value}
+        self.lat, self.lon = group["lat"][:], group["lon"][:]
+        self.shape = NDVI.shape[-2:]
+        self.chunks = NDVI.chunks[-2:]
+        self.dtype = NDVI.dtype
+
+    def read(self, chunk):
+        return self.group["NDVI"].blocks[self.time_chunk, chunk[0], chunk[1]]
+
+    def close(self):
+        pass
+
+
+def f_Sources(args, Directories):
+    """
+    Returns
+    -------
+    sources : list
+        Chunked sources of the NDVI, with the dekads within args.start and args.end:
+        a NCChunks per filtered NC file, or a ZarrChunks per time chunk of the cube.
+    """
+    print(f"         Running: {f_Sources.__name__}()")
+
+    def selected(date):
+        return date is not None and (args.start is None or date >= args.start) and (args.end is None or date <= args.end)
+
+    if args.source == "filtered":
+        names = [name for name in NDVI_filter.f_list_of_processed_NC_files(Directories) if selected(downloader.f_Date_of_product(name))]
+        sources = [NCChunks(Directories["Outputs_filtered"] / name) for name in sorted(names, key=downloader.f_Date_of_product)]
+
+    else:
+        # Optional dependency, only needed to read the cube
+        import zarr as zarr
+
+        route_to_cube = args.cube if args.cube is not None else Directories["General"] / "Outputs_cube" / "NDVI_cube.zarr"
+        root = zarr.open_group(str(route_to_cube), mode="r")
+        sources = []
+        for name, group in (("cube", root), ("staging", root["staging"])):
+            time_size = group["NDVI"].chunks[0]
+            for time_chunk in range(-(-group["NDVI"].shape[0] // time_size)):
+                source = ZarrChunks(group, time_chunk, f"{Path(route_to_cube).resolve()}/{name}/{time_chunk}")
+                source.keep = np.array([selected(date) for date in source.dates], dtype=bool)
+                if source.keep.any():
+                    sources.append(source)
+
+    print(f"           - {sum(int(source.keep.sum()) for source in sources)} dekads in {len(sources)} sources")
+    return sources
+
+
+def f_Nearest_pixels(lat, lon, points_lat, points_lon):
+    """
+    Returns
+    -------
+    rows, columns : ndarray
+        Indices of the nearest pixel of every point, or -1 if the point is more than
+        half a pixel away from the grid.
+    """
+    indices = []
+    for coordinate, values in ((lat, points_lat), (lon, points_lon)):
+        descending = coordinate.size > 1 and coordinate[0] > coordinate[-1]
+        ordered = coordinate[::-1] if descending else coordinate
+        position = np.clip(np.searchsorted(ordered, values), 1, max(ordered.size - 1, 1))
+        nearest = np.where(np.abs(values - ordered[position - 1]) <= np.abs(values - ordered[np.minimum(position, ordered.size - 1)]), position - 1, position)
+        nearest = np.minimum(nearest, ordered.size - 1)
+        half = np.abs(np.diff(ordered)).max() / 2 if ordered.size > 1 else np.inf
+        nearest = np.where(np.abs(values - ordered[nearest]) <= half, nearest, -1)
+        indices.append(np.where((nearest >= 0) & descending, ordered.size - 1 - nearest, nearest))
+    outside = (indices[0] < 0) | (indices[1] < 0)
+    return np.where(outside, -1, indices[0]), np.where(outside, -1, indices[1])
+
+
+def f_Read_points(route_to_points, id_field="id", lon_column="lon", lat_column="lat"):
+    """
+    Returns
+    -------
+    locations : DataFrame
+        id, lon and lat of every point of the CSV file.
+    """
+    import pandas as pd
+
+    points = pd.read_csv(route_to_points)
+    ids = points[id_field] if id_field in points else pd.Series(range(len(points)))
+    return pd.DataFrame({"id": ids.values, "lon": points[lon_column].astype(float).values, "lat": points[lat_column].astype(float).values})
+
+
+def f_Read_polygons(route_to_polygons, id_field="id"):
+    """
+    Returns
+    -------
+    ids : list
+        id of every polygon (its property id_field, or its number).
+    geometries : list
+        shapely geometry of every polygon, in lon/lat.
+    """
+    # Optional dependency, only needed to extract polygons
+    import shapely as shapely
+
+    route_to_polygons = Path(route_to_polygons)
+    if route_to_polygons.suffix.lower() in (".geojson", ".json"):
+        content = json.loads(route_to_polygons.read_text(encoding="utf-8"))
+        features = [feature for feature in content.get("features", [content]) if feature.get("geometry")]
+        ids = [feature.get("properties", {}).get(id_field, number) for number, feature in enumerate(features)]
+        geometries = [shapely.geometry.shape(feature["geometry"]) for feature in features]
+    else:
+        import geopandas as geopandas
+
+        vector = geopandas.read_file(route_to_polygons)
+        if vector.crs is not None:
+            vector = vector.to_crs(4326)
+        vector = vector[vector.geometry.notna()]
+        ids = list(vector[id_field]) if id_field in vector else list(range(len(vector)))
+        geometries = list(vector.geometry)
+
+    return ids, geometries
+
+
+def f_Polygon_pixels(geometries, lat, lon):
+    """
+    Returns
+    -------
+    owners, rows, columns : ndarray
+        The pixels of every polygon (its index in geometries): those whose centre is
+        within it, or the pixel of its centroid if none is (polygons smaller than a pixel).
+    """
+    owners, rows, columns = [], [], []
+    for owner, geometry in enumerate(geometries):
+        try:
+            window = NDVI_filter.f_Region_window(geometry.bounds, lat, lon)
+            inside = NDVI_filter.f_Rasterise_region(geometry, lat[window["lat"]], lon[window["lon"]])
+            row, column = np.nonzero(inside)
+            row, column = row + window["lat"].start, column + window["lon"].start
+        except ValueError:
+            row = column = np.empty(0, dtype=int)
+        if row.size == 0:
+            centroid = geometry.centroid
+            row, column = f_Nearest_pixels(lat, lon, np.array([centroid.y]), np.array([centroid.x]))
+            row, column = row[row >= 0], column[column >= 0]
+        owners.append(np.full(row.size, owner))
+        rows.append(row)
+        columns.append(column)
+
+    return np.concatenate(owners), np.concatenate(rows), np.concatenate(columns)
+
+
+def f_Extract(sources, owners, rows, columns, number_of_owners, cache=None, threads=None):
+    """
+    Extracts the NDVI of the pixels (rows, columns) from every source, and reduces
+    it by owner (a point, or a polygon). The pixels are grouped by the chunk they
+    fall in, and every chunk touched is read once (see ChunkCache), so the time
+    depends on the chunks touched, not on the number of pixels.
+
+    Returns
+    -------
+    dates : list
+        Dekads of the sources.
+    statistics : dict
+        {name: ndarray (dekads, owners)}: pixels, valid pixels, sum, sum of squares,
+        minimum and maximum of the valid NDVI (physical values).
+    """
+    print(f"         Running: {f_Extract.__name__}()")
+    start = time.perf_counter()
+
+    cache = cache if cache is not None else Chunk_cache
+    threads = threads or os.cpu_count() or 1
+    dates = sorted({date for source in sources for date, keep in zip(source.dates, source.keep) if keep})
+    index_of_date = {date: index for index, date in enumerate(dates)}
+    size = len(dates) * number_of_owners
+
+    statistics = {
+        "pixels": np.bincount(owners, minlength=number_of_owners),
+        "valid": np.zeros(size, dtype=np.int64),
+        "sum": np.zeros(size, dtype=np.float64),
+        "squares": np.zeros(size, dtype=np.float64),
+        "min": np.full(size, np.inf),
+        "max": np.full(size, -np.inf),
+    }
+
+    # Pixels grouped by chunk, for every chunk grid of the sources
+    groups_by_grid = {}
+    reads = 0
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for source in sources:
+            grid = (source.shape, source.chunks)
+            if grid not in groups_by_grid:
+                if groups_by_grid and source.shape != sources[0].shape:
+                    raise ValueError(f"The sources are on different grids ({source.shape} and {sources[0].shape})")
+                keys = (rows // source.chunks[0]) * (-(-source.shape[1] // source.chunks[1])) + columns // source.chunks[1]
+                order = np.argsort(keys, kind="stable")
+                unique, first = np.unique(keys[order], return_index=True)
+                groups_by_grid[grid] = [
+                    (divmod(int(key), -(-source.shape[1] // source.chunks[1])), order[begin:end])
+                    for key, begin, end in zip(unique, first, [*first[1:], order.size])
+                ]
+            groups = groups_by_grid[grid]
+
+            # Every chunk touched, decoded on the thread pool (or taken from the cache)
+            blocks = pool.map(lambda group: cache.get((source.key, group[0]), lambda: source.read(group[0])), groups)
+            time_indices = np.array([index_of_date[date] for date, keep in zip(source.dates, source.keep) if keep])
+            for (chunk, pixels), block in zip(groups, blocks):
+                reads += 1
+                values, valid = NDVI_process.f_Valid(block[source.keep][:, rows[pixels] - chunk[0] * source.chunks[0], columns[pixels] - chunk[1] * source.chunks[1]], source.NDVI_attrs)
+                values = values * float(source.NDVI_attrs.get("scale_factor", 1.0)) + float(source.NDVI_attrs.get("add_offset", 0.0))
+
+                # Every (dekad, owner) is a position of the flattened statistics: reduce the
+                # positions of this chunk only, so the cost does not depend on the number of owners
+                positions, inverse = np.unique((time_indices[:, np.newaxis] * number_of_owners + owners[pixels][np.newaxis, :])[valid], return_inverse=True)
+                values = values[valid]
+                statistics["valid"][positions] += np.bincount(inverse, minlength=positions.size)
+                statistics["sum"][positions] += np.bincount(inverse, weights=values, minlength=positions.size)
+                statistics["squares"][positions] += np.bincount(inverse, weights=values ** 2, minlength=positions.size)
+                np.minimum.at(statistics["min"], positions[inverse], values)
+                np.maximum.at(statistics["max"], positions[inverse], values)
+            source.close()
+
+    statistics.update({name: statistics[name].reshape(len(dates), number_of_owners) for name in ("valid", "sum", "squares", "min", "max")})
+
+    end = time.perf_counter()
+    print(f"           - {rows.size} pixels, {len(sources)} sources: {reads} chunks touched ({cache.hits} cache hits, {cache.misses} decoded). The process took {end - start:.2f} seconds")
+    return dates, statistics
+
+
+def f_Extract_points(points, sources, cache=None, threads=None):
+    """
+    Parameters
+    ----------
+    points : DataFrame
+        id, lon and lat of every point (see f_Read_points).
+    sources : list
+        Chunked sources of the NDVI (see f_Sources).
+
+    Returns
+    -------
+    table : DataFrame
+        Tidy table: id, lon, lat, date and NDVI (physical value; NaN if excluded) of
+        every point within the grid and every dekad.
+    """
+    import pandas as pd
+
+    rows, columns = f_Nearest_pixels(sources[0].lat, sources[0].lon, points["lat"].values, points["lon"].values)
+    inside = rows >= 0
+    if not inside.all():
+        print(f"           - WARNING: {int((~inside).sum())} points outside the grid are left out")
+    points = points[inside].reset_index(drop=True)
+
+    dates, statistics = f_Extract(sources, np.arange(len(points)), rows[inside], columns[inside], len(points), cache, threads)
+    NDVI = np.where(statistics["valid"] > 0, statistics["sum"], np.nan)
+
+    return pd.DataFrame({
+        "id": np.tile(points["id"].values, len(dates)),
+        "lon": np.tile(points["lon"].values, len(dates)),
+        "lat": np.tile(points["lat"].values, len(dates)),
+        "date": np.repeat(pd.to_datetime(dates), len(points)),
+        "NDVI": NDVI.reshape(-1).astype(np.float32),
+    })
+
+
+def f_Extract_polygons(ids, geometries, sources, cache=None, threads=None):
+    """
+    Parameters
+    ----------
+    ids, geometries : list
+        id and shapely geometry of every polygon (see f_Read_polygons).
+    sources : list
+        Chunked sources of the NDVI (see f_Sources).
+
+    Returns
+    -------
+    table : DataFrame
+        Tidy table: id, date, pixels, valid pixels, and mean, standard deviation,
+        minimum and maximum of the valid NDVI (physical values) of every polygon and
+        every dekad.
+    """
+    import pandas as pd
+
+    owners, rows, columns = f_Polygon_pixels(geometries, sources[0].lat, sources[0].lon)
+    dates, statistics = f_Extract(sources, owners, rows, columns, len(ids), cache, threads)
+
+    valid = statistics["valid"]
+    mean = np.divide(statistics["sum"], valid, out=np.full(valid.shape, np.nan), where=valid > 0)
+    variance = np.divide(statistics["squares"] - valid * mean ** 2, valid - 1, out=np.full(valid.shape, np.nan), where=valid > 1)
+
+    return pd.DataFrame({
+        "id": np.tile(np.asarray(ids, dtype=object), len(dates)),
+        "date": np.repeat(pd.to_datetime(dates), len(ids)),
+        "pixels": np.tile(statistics["pixels"], len(dates)),
+        "valid_pixels": valid.reshape(-1),
+        "NDVI_mean": mean.reshape(-1).astype(np.float32),
+        "NDVI_std": np.sqrt(np.maximum(variance, 0)).reshape(-1).astype(np.float32),
+        "NDVI_min": np.where(valid > 0, statistics["min"], np.nan).reshape(-1).astype(np.float32),
+        "NDVI_max": np.where(valid > 0, statistics["max"], np.nan).reshape(-1).astype(np.float32),
+    })
+
+
+# %% MAIN FUNCTION
+def main():
+    print(__doc__)
+    print("RUN THE SCRIPT:")
+    print(f"         Running: {main.__name__}()")
+    start = time.perf_counter()
+
+    # %% LOAD THE INPUTS
+    args = parse_arguments()
+    Chunk_cache.max_bytes = args.cache_size * 1e6
+
+    # %% DEFINE THE DIRECTORIES
+    Directories = NDVI_filter.f_Define_the_directories()
+    Directories["Outputs_extracted"] = Directories["General"] / "Outputs_extracted"
+    Directories["Outputs_extracted"].mkdir(parents=True, exist_ok=True)
+
+    # %% LIST THE SOURCES
+    sources = f_Sources(args, Directories)
+    if not sources:
+        print("           - WARNING: There are no dekads to extract from")
+        return
+
+    # %% EXTRACT
+    if args.points is not None:
+        points = f_Read_points(args.points, args.id_field, args.lon_column, args.lat_column)
+        print(f"           - {len(points)} points")
+        table = f_Extract_points(points, sources, threads=args.threads)
+        route_to_output = args.output or Directories["Outputs_extracted"] / f"{args.points.stem}_NDVI.csv"
+    else:
+        ids, geometries = f_Read_polygons(args.polygons, args.id_field)
+        print(f"           - {len(ids)} polygons")
+        table = f_Extract_polygons(ids, geometries, sources, threads=args.threads)
+        route_to_output = args.output or Directories["Outputs_extracted"] / f"{args.polygons.stem}_NDVI.csv"
+
+    # %% SAVE THE TABLE
+    table.to_csv(route_to_output, index=False, date_format="%Y-%m-%d")
+
+    end = time.perf_counter()
+    print(f"           - {len(table)} rows saved in {route_to_output}. The process took {end - start:.2f} seconds")
+
+    # %% ENDSCRIPT
+    print()
+    print("         Endscript");
+
+
+# %% RING BELL
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1980 @@
+# -*- coding: utf-8 -*-
+"""
+TRACKING:
+    https://doi.org/10.5281/zenodo.18620398
+    Product developped by LABIF-UCO ("https://labif.es/").
+    Version 20261017a (last modified by Juanan).
+    
+OBJECTIVE:
+    To filter all the products pending to filter of the "Normalised Difference Vegetation Index 2014-present (raster 300 m), global, 10-daily – version 3" (DOI: "https://doi.org/10.2909/905223f4-2c3d-4cb6-ad8c-d6d065707465") product of CLMS, excluding all pixels with:
+        - An uncertainty greater than desired
+        - A number of observations smaller than desired
+        - Selected flags (See table 7 in the user manual)
+    
+INFORMATION:
+    https://land.copernicus.eu/en/products/vegetation/normalised-difference-vegetation-index-v3-0-300m 
+    Generated using European Union's Copernicus Land Monitoring Service information; doi.org/10.2909/905223f4-2c3d-4cb6-ad8c-d6d065707465.
+
+    This script does as follows:
+
+    1) Looks for the NC files (by default, in the Section_DOWNLOAD\Outputs_downloaded) that have not been processed yet, or whose output in Section_PROCESSING\Outputs_filtered is stale (i.e. it was filtered with other parameters, by another version or code of this script, or from another input). Take these NC files and:
+    2) Filter the pixels of the main variable that have an Uncertainty greater or equal than a threshold (by default, this filter is enabled and set to 0.15)
+    3) Filter the pixels of the main variable that have a Number of Observations lower than a threshold (by default, this filter is enabled and set to 2)
+    4) Filter the pixels that have some flags (by default, all flags are filtered out)
+    5) Save the final product in Section_PROCESSING\Outputs_filtered (through a temporary file, renamed once complete). This final product contains only the main variable, filtered, and its provenance in the global attributes (parameters, version and checksum of the input).
+
+EXAMPLES:
+    
+    run Launch_me_to_filter.py --Filter_by_uncertainty_off --Filter_by_NOBS_off --Filter_bits
+        This example runs the script will all filters deactivated (i.e. the saved NC file will be equal to the original)
+    
+    run Launch_me_to_filter.py
+    run Launch_me_to_filter.py --Thr_uncertainty 0.15 --Thr_NOBS 2 --Filter_bits 0 1 2 3 4 5 6 7
+    run Launch_me_to_filter.py --Filter_by_uncertainty_on --Thr_uncertainty 0.15 --Filter_by_NOBS_on --Thr_NOBS 2 --Filter_bits 0 1 2 3 4 5 6 7
+        These three examples do exactly the same, they as correspond with the default input values
+    
+    run Launch_me_to_filter.py --Thr_uncertainty 0.28 --Filter_by_NOBS_off --Filter_bits 0 2 4 7
+        This example sets the threshold for uncertainty to 0.28 (i.e. all pixels with uncertainties equal or greater than 0.28 will be excluded), deactivates the filter for the Number of Observations and only excludes those pixels with flags in the bits 0, 2, 4 and 7.
+    
+    run Launch_me_to_filter.py --Output_encoding uint8
+        This example saves the native uint8 digital numbers (with the original scale_factor, add_offset and _FillValue) instead of float32, with the missing value (255) in the excluded pixels.
+    
+    run Launch_me_to_filter.py --jobs 4 --memory-budget 16
+        This example filters 4 NC files at once, in worker processes, while their estimated peak memory fits in 16 GB.
+    
+    run Launch_me_to_filter.py --max-memory 512
+        This example filters every NC file chunk by chunk, along the chunks stored in the file, with at most 512 MB of buffers.
+    
+    run Launch_me_to_filter.py --codec zstd --complevel 3
+        This example compresses the filtered NDVI with zstd (level 3) instead of zlib (level 4). See Launch_me_to_benchmark_codecs.py.
+    
+    run Launch_me_to_filter.py --bbox -10 35 5 44
+        This example only reads, filters and saves the window of NDVI within 10ºW-5ºE and 35ºN-44ºN.
+    
+    run Launch_me_to_filter.py --mask-file ../Inputs/Spain.geojson
+        This example only reads, filters and saves the window of the polygons in Spain.geojson, and excludes the pixels outside them. The rasterised mask is cached in Ancillary.
+    
+    run Launch_me_to_filter.py --quality-index --Thr_uncertainty 0.28
+        This example filters from the quality index of every NC file (built once, in Ancillary\Quality_index): the chunks where every pixel is excluded are not read, and those where every pixel is kept only read NDVI.
+    
+WARNINGS:
+    Excessively long processing times (>10 mins) could indicate an unsuitable chunk of the file for your computer. Use --max-memory to filter along the chunks stored in the file, within a fixed memory.
+    Changing any parameter of the filters, or editing this script, makes every filtered NC file stale, so they are all filtered again.
+"""
+
+# %% IMPORT THE LIBRARIES
+# xarray and dask are imported by the functions that need them, so this module
+# (e.g. f_Filter_by_QFLAGS, or the workers of f_Filter_in_parallel) imports fast
+from pathlib import Path as Path
+
+import argparse as argparse
+import contextlib as contextlib
+from concurrent.futures import ProcessPoolExecutor as ProcessPoolExecutor, ThreadPoolExecutor as ThreadPoolExecutor, wait as wait, FIRST_COMPLETED as FIRST_COMPLETED
+import datetime as datetime
+import functools as functools
+import hashlib as hashlib
+import itertools as itertools
+import json as json
+import numpy as np
+import os as os
+import queue as queue
+import sys as sys
+import tempfile as tempfile
+import threading as threading
+import time as time
+import zlib as zlib
+
+import ndvi as ndvi
+from ndvi import download as downloader
+
+# %% PREVIOUS INFORMATION
+# This Script requires the following information to run smoothly:
+# Default values for the filters:
+
+# If "Filter_uncertainty=True", then pixels with an uncertainty equal or greater than Thr_uncertainty will be filtered out.
+# Thr_uncertainty must be in the range [0-1]
+Filter_uncertainty = True
+Thr_uncertainty = 0.15 
+
+# If "Filter_NOBS=True", then pixels with a nomber of observations smaller than Thr_NOBS will be filtered out.
+# Thr_NOBS must be in the range [0-32]      
+Filter_NOBS = True
+Thr_NOBS = 2 # If "Filter_NOBS=True", then pixels with a Number of OBServations lower than Thr_NOBS will be filtered out.
+
+Filter_bitwise = {
+    0: True, # bit 0 = 1: No observations found in the compositing window in, at least, one of the red or NIR bands. Set as True to exclude these pixels.
+    1: True, # bit 1 = 1: At least one of the observations in the compositing window is flagged as ‘snow’. Set as True to exclude these pixels.
+    2: True, # bit 2 = 1: At least one TOC-r input band for red has quality ‘warning’. Set as True to exclude these pixels.
+    3: True, # bit 3 = 1: At least one TOC-r input band for red has quality ‘extreme warning’. Set as True to exclude these pixels.
+    4: True, # bit 4 = 1: At least one TOC-r input band for NIR has quality ‘warning’. Set as True to exclude these pixels.
+    5: True, # bit 5 = 1: At least one TOC-r input band for NIR has quality ‘extreme warning’. Set as True to exclude these pixels.
+    6: True, # bit 6 = 1: TOC-r out of range (TOC-r < 0 | TOC-r > 1) for at least one band. Set as True to exclude these pixels.
+    7: True, # bit 7 = 1: The BRDF MCD43P priors are gap filled. Set as True to exclude these pixels.
+} # Pixels with at least a bit set as True will be filtered out. Pixels with all bits set as False will remain.
+
+# Encoding of the filtered NDVI:
+#   "float32": digital numbers as float32, with NaN for the excluded pixels.
+#   "uint8": the native digital numbers (uint8), with the scale_factor, add_offset and _FillValue of the original
+#            product, and the reserved missing value (_FillValue) for the excluded pixels. About 4 times smaller.
+Output_encoding = "float32"
+
+# Compression of the filtered NDVI. Codec is one of CODECS ("none" for scratch runs). zstd, bzip2 and blosc_*
+# need the HDF5 filter plugins of netCDF4 (they are checked before filtering). Complevel: 1 (fastest) to 9 (smallest).
+Codec = "zlib"
+Complevel = 4
+Shuffle = True # Byte shuffle before compressing (for blosc_*, the shuffle of blosc)
+CODECS = ["none", "zlib", "zstd", "bzip2", "blosc_lz", "blosc_lz4", "blosc_lz4hc", "blosc_zlib", "blosc_zstd"]
+
+# Memory (MB) of the streaming engine when --quality-index is given without --max-memory.
+Streaming_memory = 512
+
+# Region of interest. Only the pixels within it are read, filtered and saved (None for the whole globe):
+#   Bbox: [lon_min, lat_min, lon_max, lat_max] (West, South, East, North), in degrees.
+#   Mask_file: vector (GeoJSON; other formats with geopandas) or raster (NetCDF with lat/lon) region, in lon/lat (EPSG:4326).
+#              The pixels outside of it are excluded. It is rasterised once per grid, and cached in Ancillary.
+Bbox = None
+Mask_file = None
+
+
+
+# %% ANCILLARY FUNCTIONS
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Filter NDVI products with configurable thresholds"
+    )
+    
+    add_arguments(parser)
+    add_selection_arguments(parser)
+    add_region_arguments(parser)
+    add_parallel_arguments(parser)
+
+    return parser.parse_args()
+
+
+def add_arguments(parser):
+    """
+    Adds the arguments of the filter to parser, so other scripts (e.g.
+    Launch_me_to_download_and_filter.py) can offer the same options.
+    """
+
+    # --- UNCERTAINTY FILTER ---
+    parser.add_argument(
+        "--Filter_by_uncertainty_on",
+        dest="Filter_uncertainty",
+        action="store_true",
+        help="Enable filtering by uncertainty"
+    )
+
+    parser.add_argument(
+        "--Filter_by_uncertainty_off",
+        dest="Filter_uncertainty",
+        action="store_false",
+        help="Disable filtering by uncertainty"
+    )
+
+    parser.set_defaults(Filter_uncertainty=Filter_uncertainty)
+
+    parser.add_argument(
+        "--Thr_uncertainty",
+        type=float,
+        default=Thr_uncertainty,
+        help="Uncertainty threshold (0–1)"
+    )
+
+    # --- NOBS FILTER ---
+    parser.add_argument(
+        "--Filter_by_NOBS_on",
+        dest="Filter_NOBS",
+        action="store_true",
+        help="Enable filtering by number of observations"
+    )
+
+    parser.add_argument(
+        "--Filter_by_NOBS_off",
+        dest="Filter_NOBS",
+        action="store_false",
+        help="Disable filtering by number of observations"
+    )
+
+    parser.set_defaults(Filter_NOBS=Filter_NOBS)
+
+    parser.add_argument(
+        "--Thr_NOBS",
+        type=int,
+        default=Thr_NOBS,
+        help="Minimum number of observations required"
+    )
+
+    # --- QFLAG BITS ---
+    parser.add_argument(
+        "--Filter_bits",
+        type=int,
+        nargs="*",
+        default=[bit for bit, val in Filter_bitwise.items() if val],
+        help="Bits to exclude (e.g. --Filter_bits 0 1 3). If omitted, defaults are used."
+    )
+
+    add_output_arguments(parser)
+
+    # --- ENGINE ---
+    parser.add_argument(
+        "--max-memory",
+        type=float,
+        default=None,
+        help="Filter every NC file chunk by chunk, along its native chunk grid, within this memory (MB). Requires h5py"
+    )
+
+    parser.add_argument(
+        "--quality-index",
+        action="store_true",
+        help="Filter from a quality index (NDVI_unc, NOBS and QFLAG with per-chunk summaries, built once per NC file in Ancillary), skipping the chunks where every pixel passes or fails. Requires h5py"
+    )
+
+    return parser
+
+
+def add_output_arguments(parser):
+    """
+    Adds the encoding and the compression of the filtered NDVI, so other
+    scripts (e.g. Launch_me_to_sweep_filters.py) can save it the same way.
+    """
+
+    # --- OUTPUT ---
+    parser.add_argument(
+        "--Output_encoding",
+        choices=["float32", "uint8"],
+        default=Output_encoding,
+        help="Encoding of the filtered NDVI: float32 (NaN for excluded pixels) or uint8 (native digital numbers, _FillValue for excluded pixels)"
+    )
+
+    # --- COMPRESSION ---
+    parser.add_argument(
+        "--codec",
+        choices=CODECS,
+        default=Codec,
+        help="Compression of the filtered NDVI (none for scratch runs)"
+    )
+
+    parser.add_argument(
+        "--complevel",
+        type=int,
+        default=Complevel,
+        help="Compression level (1 fastest - 9 smallest)"
+    )
+
+    parser.add_argument(
+        "--no-shuffle",
+        dest="shuffle",
+        action="store_false",
+        help="Do not shuffle the bytes before compressing"
+    )
+
+    parser.set_defaults(shuffle=Shuffle)
+
+    return parser
+
+
+def add_selection_arguments(parser):
+    """
+    Adds the date selection of the filter. Kept apart from add_arguments
+    because the downloader offers its own --start/--end.
+    """
+    
+    # --- SELECTION ---
+    parser.add_argument(
+        "--start",
+        type=downloader.f_Parse_date,
+        default=None,
+        help="First date to filter (YYYY-MM-DD)"
+    )
+
+    parser.add_argument(
+        "--end",
+        type=downloader.f_Parse_date,
+        default=None,
+        help="Last date to filter (YYYY-MM-DD)"
+    )
+
+    return parser
+
+
+def add_region_arguments(parser, bbox=True):
+    """
+    Adds the region of interest of the filter. Kept apart from add_arguments
+    because the downloader offers its own --bbox (set bbox=False to skip it).
+    """
+    
+    # --- REGION OF INTEREST ---
+    if bbox:
+        parser.add_argument(
+            "--bbox",
+            type=float,
+            nargs=4,
+            default=Bbox,
+            metavar=("LON_MIN", "LAT_MIN", "LON_MAX", "LAT_MAX"),
+            help="Filter and save only this window of NDVI"
+        )
+
+    parser.add_argument(
+        "--mask-file",
+        type=Path,
+        default=Mask_file,
+        help="Vector (GeoJSON) or raster (NetCDF) region: only its window is filtered and saved, and the pixels outside of it are excluded"
+    )
+
+    return parser
+
+
+def add_parallel_arguments(parser):
+    """
+    Adds the options to filter several NC files at once, in worker processes.
+    """
+    
+    # --- PARALLELISM ---
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of NC files filtered at once, each in its own process"
+    )
+
+    parser.add_argument(
+        "--memory-budget",
+        type=float,
+        default=None,
+        help="Memory (GB) shared by the files in flight. A file only starts when its estimated peak fits in the budget"
+    )
+
+    return parser
+
+
+def f_Filter_parameters(args):
+    """
+    Returns
+    -------
+    Parameters : dict
+        Dictionary with the parameters of the filters, taken from the parsed arguments.
+    """
+    if not f_Codec_is_available(args.codec):
+        raise ValueError(
+            f"The codec {args.codec} is not available in this installation of netCDF4/HDF5 "
+            f"(available: {', '.join(codec for codec in CODECS if f_Codec_is_available(codec))})"
+        )
+    
+    return {
+        "Filter_uncertainty": args.Filter_uncertainty,
+        "Thr_uncertainty": args.Thr_uncertainty,
+        "Filter_NOBS": args.Filter_NOBS,
+        "Thr_NOBS": args.Thr_NOBS,
+        "Filter_bitwise": {bit: (bit in args.Filter_bits) for bit in range(8)},
+        "Output_encoding": args.Output_encoding,
+        "Compression": f_Codec_encoding(args.codec, args.complevel, args.shuffle),
+        "Max_memory": args.max_memory * 1e6 if args.max_memory is not None else (Streaming_memory * 1e6 if getattr(args, "quality_index", False) else None),
+        "Quality_index": getattr(args, "quality_index", False),
+        # Region of interest (see add_region_arguments), if the script offers it
+        "Bbox": getattr(args, "bbox", None),
+        "Mask_file": getattr(args, "mask_file", None),
+    }
+
+
+def f_Define_the_directories():
+    """
+    Returns
+    -------
+    Directories : dict
+        Dictionary with the routes to the defined directories.
+    """
+    print(f"         Running: {f_Define_the_directories.__name__}()")
+    
+    Directory_general = ndvi.f_Directory_general()
+
+    Directories = {
+        "General": Directory_general,
+        "Ancillary": Directory_general / "Ancillary",
+        "Inputs": Directory_general / "Inputs",
+        "Outputs_downloaded": Directory_general / "Outputs_downloaded",
+        "Outputs_filtered": Directory_general / "Outputs_filtered",
+        "Scripts": Directory_general / "Scripts",
+    }  # Add new lines if nedded
+    
+    # Make sure that these directories exist. If not, create them.
+    for directory_name, directory_path in Directories.items():
+        if not directory_path.exists():
+            directory_path.mkdir(parents=True)
+            print(f"           - Created directory: {directory_name} → {directory_path}")
+
+    return Directories
+
+
+def f_Input_directories(Directories, Bbox=None):
+    """
+    Returns
+    -------
+    Directories : dict
+        Directories whose Outputs_downloaded is the folder of the windows downloaded
+        with the same bbox (see downloader.f_Bbox_folder), if there is one, so the
+        windows are filtered instead of the products downloaded in full.
+    """
+    route_to_bbox_folder = downloader.f_Bbox_folder(Directories["Outputs_downloaded"], Bbox)
+    if Bbox is None or not route_to_bbox_folder.exists():
+        return Directories
+    
+    print(f"           - Reading the windows downloaded with --bbox {' '.join(f'{value:g}' for value in Bbox)} ({route_to_bbox_folder})")
+    return downloader.f_Bbox_directories(Directories, Bbox)
+
+
+def f_list_of_verified_NC_files(Input_NC_folder):
+    """
+    Parameters
+    ----------
+    Input_NC_folder : WindowsPath
+        Folder with the downloaded NC files and the manifest written by Launch_me_to_download_NDVI.py.
+
+    Returns
+    -------
+    list_of_verified_NC_files : list or None
+        Names of the NC files recorded in the manifest that are complete and valid.
+        None if the folder has no manifest.
+    """
+    print(f"         Running: {f_list_of_verified_NC_files.__name__}()")
+    
+    route_to_manifest = Input_NC_folder / "manifest.json"
+    if not route_to_manifest.exists():
+        return None
+    
+    manifest = json.loads(route_to_manifest.read_text())
+    
+    list_of_verified_NC_files = []
+    for eo_product_name, record in manifest.items():
+        # Raw files deleted on purpose once filtered
+        if record.get("raw_deleted"):
+            continue
+        for file in record["files"]:
+            if not file["name"].endswith(".nc"):
+                continue
+            if downloader.f_Is_valid_NC(Input_NC_folder / file["name"], file["size"]):
+                list_of_verified_NC_files.append(file["name"])
+            else:
+                print(f"           - WARNING: {file['name']} is missing or corrupt. Run Launch_me_to_download_NDVI.py to download it again")
+    
+    return list_of_verified_NC_files
+
+
+def f_list_of_available_NC_files(Input_NC_folder):
+    print(f"         Running: {f_list_of_available_NC_files.__name__}()")
+    
+    try:
+        # Transform from string to a windows Path
+        Input_NC_folder = Path(Input_NC_folder)
+           
+        # List of NC files verified by the downloader
+        list_of_available_NC_files = f_list_of_verified_NC_files(Input_NC_folder)
+        
+        # Folders downloaded before the manifest existed: check the header of every NC file in the input folder
+        if list_of_available_NC_files is None:
+            print(f"           - WARNING: No manifest found in {Input_NC_folder}. Checking the header of every NC file")
+            list_of_available_NC_files = [f.name for f in Input_NC_folder.glob("*.nc") if downloader.f_Is_valid_NC(f)]
+        
+        # Check if the folder contains any NC file
+        if not list_of_available_NC_files:
+            raise FileNotFoundError(f"           - WARNING: No NC files found in: {Input_NC_folder}. Check if the directory is the correct one.")
+        
+        # Print the number of available NC files
+        Number_of_NC_files = len(list_of_available_NC_files)
+        print(f"           - {Number_of_NC_files} NC files available")
+        
+        return list_of_available_NC_files
+    
+    except FileNotFoundError as e:
+        print(f"{e}")
+        sys.exit(1) 
+
+
+def f_list_of_processed_NC_files(Directories, Parameters=None):
+    """
+    Returns
+    -------
+    list_of_processed_NC_files : list
+        Names of the NC files in Directories["Outputs_filtered"]. If Parameters is given,
+        only those up to date for them (see f_Is_up_to_date): the stale ones are filtered again.
+    """
+    print(f"         Running: {f_list_of_processed_NC_files.__name__}()")
+    
+    # List of NC files in the output folder
+    list_of_processed_NC_files = [f.name for f in Directories["Outputs_filtered"].glob("*.nc")]
+    
+    # Print the number of processed NC files
+    Number_of_NC_files = len(list_of_processed_NC_files)
+    print(f"           - {Number_of_NC_files} NC files processed")
+    
+    if Parameters is not None:
+        list_of_processed_NC_files = [x for x in list_of_processed_NC_files if f_Is_up_to_date(x, Directories, Parameters)]
+        print(f"           - {Number_of_NC_files - len(list_of_processed_NC_files)} of them are stale (other parameters, version, code or input)")
+    
+    return list_of_processed_NC_files
+
+
+@functools.lru_cache(maxsize=4)
+def f_Manifest_records(route_to_manifest, mtime_ns):
+    """
+    Records of the manifest of the downloader (read again only if it changed, see mtime_ns).
+    """
+    return json.loads(Path(route_to_manifest).read_text())
+
+
+def f_Checksum(route_to_file, Directories):
+    """
+    Returns
+    -------
+    checksum : str
+        "sha256:<hex>" of the file. Every file is only hashed once: the checksums are
+        cached in Ancillary/checksums.json, with the size and the modification time of the file.
+    """
+    route_to_file = Path(route_to_file)
+    route_to_cache = Path(Directories["Ancillary"]) / "checksums.json"
+    stat = route_to_file.stat()
+    key = str(route_to_file.resolve())
+    
+    try:
+        cache = json.loads(route_to_cache.read_text())
+    except (OSError, ValueError):
+        cache = {}
+    
+    record = cache.get(key)
+    if record is not None and record["size"] == stat.st_size and record["mtime_ns"] == stat.st_mtime_ns:
+        return record["checksum"]
+    
+    sha256 = hashlib.sha256()
+    with open(route_to_file, "rb") as file:
+        for block in iter(lambda: file.read(16 * 2**20), b""):
+            sha256.update(block)
+    checksum = f"sha256:{sha256.hexdigest()}"
+    
+    # Read again and merged, as other processes may be filling the cache too
+    try:
+        cache = json.loads(route_to_cache.read_text())
+    except (OSError, ValueError):
+        cache = {}
+    cache[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "checksum": checksum}
+    route_to_tmp = route_to_cache.with_name(f"{route_to_cache.name}.{os.getpid()}.tmp")
+    route_to_tmp.write_text(json.dumps(cache, indent=1, sort_keys=True))
+    os.replace(route_to_tmp, route_to_cache)
+    
+    return checksum
+
+
+def f_Input_checksum(every_NC_file, Directories):
+    """
+    Returns
+    -------
+    checksum : str
+        Checksum of the raw NC file: the ETag recorded by the downloader (see the
+        manifest in Outputs_downloaded), with its window if only a bbox was
+        downloaded, so the file does not have to be read. Otherwise, its sha256
+        (see f_Checksum).
+    """
+    route_to_input_NC = Path(Directories["Outputs_downloaded"]) / every_NC_file
+    route_to_manifest = Path(Directories["Outputs_downloaded"]) / "manifest.json"
+    
+    if route_to_manifest.exists():
+        try:
+            records = f_Manifest_records(route_to_manifest, route_to_manifest.stat().st_mtime_ns)
+        except ValueError:
+            records = {}
+        for record in records.values():
+            for file in record.get("files", []):
+                if file["name"] == every_NC_file and file.get("etag") and file.get("size") == route_to_input_NC.stat().st_size:
+                    return f"etag:{file['etag'].strip(chr(34))}" + (f";bbox:{record['bbox']}" if record.get("bbox") is not None else "")
+    
+    return f_Checksum(route_to_input_NC, Directories)
+
+
+def f_Filter_configuration(Parameters, Directories):
+    """
+    Returns
+    -------
+    configuration : dict
+        The parameters that set the content of a filtered NC file (not the engine,
+        the memory, the quality index or the storage encoding, see f_Storage_encoding),
+        with the thresholds of the disabled filters left out, and the mask file by its
+        checksum (not by its name).
+    """
+    return {
+        "Filter_uncertainty": bool(Parameters["Filter_uncertainty"]),
+        "Thr_uncertainty": float(Parameters["Thr_uncertainty"]) if Parameters["Filter_uncertainty"] else None,
+        "Filter_NOBS": bool(Parameters["Filter_NOBS"]),
+        "Thr_NOBS": int(Parameters["Thr_NOBS"]) if Parameters["Filter_NOBS"] else None,
+        "Filter_bits": sorted(int(bit) for bit, reject in Parameters["Filter_bitwise"].items() if reject),
+        "Bbox": [float(value) for value in Parameters["Bbox"]] if Parameters.get("Bbox") is not None else None,
+        "Mask_file": f_Checksum(Parameters["Mask_file"], Directories) if Parameters.get("Mask_file") is not None else None,
+    }
+
+
+def f_Storage_encoding(Parameters):
+    """
+    Returns
+    -------
+    encoding : dict
+        How the filtered NDVI is stored (dtype and compression). Both encodings hold
+        the same digital numbers, so it is recorded apart from f_Filter_configuration:
+        switching --Output_encoding or --codec only applies to the NC files filtered
+        from then on, and never makes the archive stale.
+    """
+    return {
+        "Output_encoding": Parameters["Output_encoding"],
+        "Compression": Parameters.get("Compression") or f_Codec_encoding(),
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def f_Filter_code_sha1():
+    """
+    Returns
+    -------
+    sha1 : str
+        SHA-1 of this script, so any edit of the filter code makes its outputs stale.
+    """
+    return hashlib.sha1(Path(__file__).read_bytes()).hexdigest()
+
+
+def f_Provenance(every_NC_file, Directories, Parameters):
+    """
+    Returns
+    -------
+    attrs : dict
+        Global attributes of the filtered NC file: the parameters and the storage
+        encoding (JSON), the version and the checksum of this script, and the name
+        and the checksum of the input.
+    """
+    return {
+        "filter_parameters": json.dumps(f_Filter_configuration(Parameters, Directories), sort_keys=True),
+        "filter_encoding": json.dumps(f_Storage_encoding(Parameters), sort_keys=True),
+        "filter_version": ndvi.Version,
+        "filter_code_sha1": f_Filter_code_sha1(),
+        "input_file": every_NC_file,
+        "input_checksum": f_Input_checksum(every_NC_file, Directories),
+        "date_created": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+    }
+
+
+def f_Is_up_to_date(every_NC_file, Directories, Parameters):
+    """
+    Returns True if the filtered NC file exists and its provenance (see f_Provenance)
+    matches the current parameters, the version and the code of the filter, and the
+    raw NC file.
+    Outputs without provenance (written by older versions) are stale.
+    """
+    import xarray as xr
+    
+    route_to_output_NC = Path(Directories["Outputs_filtered"]) / every_NC_file
+    if not route_to_output_NC.exists():
+        return False
+    
+    try:
+        with xr.open_dataset(route_to_output_NC, decode_cf=False) as output_NC_ds:
+            attrs = dict(output_NC_ds.attrs)
+    except (OSError, ValueError):
+        return False
+    
+    if attrs.get("filter_version") != ndvi.Version or attrs.get("filter_code_sha1") != f_Filter_code_sha1():
+        return False
+    if attrs.get("filter_parameters") != json.dumps(f_Filter_configuration(Parameters, Directories), sort_keys=True):
+        return False
+    
+    # The input is only checked last (it may have to be hashed), and only if it is still there
+    route_to_input_NC = Path(Directories["Outputs_downloaded"]) / every_NC_file
+    return not route_to_input_NC.exists() or attrs.get("input_checksum") == f_Input_checksum(every_NC_file, Directories)
+
+
+class AllFilesProcessed(Exception):
+    """Raised when there are no NC files left to process."""
+    pass
+
+
+def f_Bucket_list(list_of_available_NC_files, list_of_processed_NC_files, start=None, end=None):
+    print(f"         Running: {f_Bucket_list.__name__}()")
+    
+    try:
+        
+        # Keep only the NC files within the requested dates (taken from their name)
+        if start is not None or end is not None:
+            list_of_available_NC_files = [
+                x for x in list_of_available_NC_files
+                if downloader.f_Date_of_product(x) is not None
+                and (start is None or downloader.f_Date_of_product(x) >= start)
+                and (end is None or downloader.f_Date_of_product(x) <= end)
+            ]
+        
+        # Compare both lists, and get a new list with the name of the files yet to download
+        bucket_list = [x for x in list_of_available_NC_files if x not in list_of_processed_NC_files]
+  
+        # Print the number of NC files to process
+        print(f"           - {len(bucket_list)} NC files to process")
+        
+        # Check if all the NC files have been processed
+        if not bucket_list:
+            raise AllFilesProcessed("           - WARNING: There are no new NC files left to process.")
+        
+        return bucket_list
+    
+    except AllFilesProcessed as e:
+        print(f"{e}")
+        sys.exit(1)
+
+
+def f_Region_window(bbox, lat, lon):
+    """
+    Parameters
+    ----------
+    bbox : list
+        [lon_min, lat_min, lon_max, lat_max] (West, South, East, North), in degrees.
+    lat, lon : array
+        Coordinates of the grid (ascending or descending).
+
+    Returns
+    -------
+    window : dict
+        {"lat": slice, "lon": slice} of the indices (to pass to .isel()) of the pixels whose centre is within bbox.
+    """
+    lon_min, lat_min, lon_max, lat_max = bbox
+    if lon_min > lon_max or lat_min > lat_max:
+        raise ValueError(f"Invalid bbox {list(bbox)}: it must be lon_min lat_min lon_max lat_max")
+    
+    rows = np.flatnonzero((lat >= lat_min) & (lat <= lat_max))
+    columns = np.flatnonzero((lon >= lon_min) & (lon <= lon_max))
+    if rows.size == 0 or columns.size == 0:
+        raise ValueError(f"The region {[float(value) for value in bbox]} does not intersect the grid of the NC file")
+    
+    return {"lat": slice(int(rows[0]), int(rows[-1]) + 1), "lon": slice(int(columns[0]), int(columns[-1]) + 1)}
+
+
+def f_Read_mask_file(route_to_mask_file):
+    """
+    Parameters
+    ----------
+    route_to_mask_file : WindowsPath
+        Vector region (GeoJSON; any other format readable by geopandas, if installed)
+        or raster region (NetCDF with lat/lon coordinates, non-zero inside), in lon/lat.
+
+    Returns
+    -------
+    region : shapely geometry or DataArray
+        Union of the polygons of the vector file, or the boolean raster (lat, lon).
+    """
+    import xarray as xr
+    
+    route_to_mask_file = Path(route_to_mask_file)
+    
+    if route_to_mask_file.suffix.lower() in (".nc", ".nc4", ".cdf"):
+        with xr.open_dataset(route_to_mask_file) as mask_ds:
+            raster = next(variable for variable in mask_ds.data_vars.values() if {"lat", "lon"} <= set(variable.dims))
+            # Extra dimensions (e.g. time or band) are merged: inside if inside in any of them
+            raster = (raster.fillna(0) != 0).any([dim for dim in raster.dims if dim not in ("lat", "lon")])
+            return raster.transpose("lat", "lon").load()
+    
+    # Optional dependency, only needed in this mode
+    import shapely as shapely
+    
+    if route_to_mask_file.suffix.lower() in (".geojson", ".json"):
+        content = json.loads(route_to_mask_file.read_text(encoding="utf-8"))
+        features = content.get("features", [content]) if content.get("type") == "FeatureCollection" or "geometry" in content else [{"geometry": content}]
+        geometries = [shapely.geometry.shape(feature["geometry"]) for feature in features if feature.get("geometry")]
+    else:
+        import geopandas as geopandas
+        
+        vector = geopandas.read_file(route_to_mask_file)
+        if vector.crs is not None:
+            vector = vector.to_crs(4326)
+        geometries = list(vector.geometry.dropna())
+    
+    if not geometries:
+        raise ValueError(f"There are no geometries in {route_to_mask_file}")
+    return shapely.union_all(geometries)
+
+
+def f_Rasterise_region(region, lat, lon, rows_per_block=512):
+    """
+    Parameters
+    ----------
+    region : shapely geometry or DataArray
+        Region of interest (see f_Read_mask_file).
+    lat, lon : array
+        Coordinates of the grid.
+
+    Returns
+    -------
+    mask : ndarray
+        Booleans (lat, lon), True for the pixels whose centre is within region.
+    """
+    import xarray as xr
+    
+    if isinstance(region, xr.DataArray):
+        # Nearest cell of the raster, within one of its cells
+        step = max(float(np.abs(np.diff(region[dim].values)).max()) if region.sizes[dim] > 1 else 0.0 for dim in ("lat", "lon"))
+        resampled = region.astype(np.uint8).reindex(lat=lat, lon=lon, method="nearest", tolerance=step or None, fill_value=0)
+        return resampled.values.astype(bool)
+    
+    import shapely as shapely
+    
+    shapely.prepare(region)
+    mask = np.empty((lat.size, lon.size), dtype=bool)
+    # By blocks of rows, so the coordinates of the grid are never held at once
+    for first_row in range(0, lat.size, rows_per_block):
+        lat_block = lat[first_row:first_row + rows_per_block]
+        mask[first_row:first_row + lat_block.size] = shapely.contains_xy(region, lon[np.newaxis, :], lat_block[:, np.newaxis])
+    return mask
+
+
+def f_Region_bounds(region):
+    """
+    Returns
+    -------
+    bbox : list
+        [lon_min, lat_min, lon_max, lat_max] of region (see f_Read_mask_file).
+    """
+    import xarray as xr
+    
+    if isinstance(region, xr.DataArray):
+        inside = region.values
+        if not inside.any():
+            raise ValueError("The raster region is empty")
+        # Half a cell around the cells that are inside
+        lat = region["lat"].values[inside.any(axis=1)]
+        lon = region["lon"].values[inside.any(axis=0)]
+        half = [float(np.abs(np.diff(region[dim].values)).max()) / 2 if region.sizes[dim] > 1 else 0.0 for dim in ("lat", "lon")]
+        return [lon.min() - half[1], lat.min() - half[0], lon.max() + half[1], lat.max() + half[0]]
+    
+    return list(region.bounds)
+
+
+# Regions of interest already resolved in this process: {key: (window, mask)}
+Regions_of_interest = {}
+
+
+def f_Region_of_interest(raw_NC_ds, Parameters, Directories):
+    """
+    Resolves the region of interest (Parameters["Bbox"] and/or Parameters["Mask_file"])
+    on the grid of raw_NC_ds. The rasterised mask only depends on the grid and on
+    the region, so it is computed once and cached in Directories["Ancillary"]
+    (region_<key>.npz), and reused for every NC file on the same grid.
+
+    Returns
+    -------
+    window : dict or None
+        {"lat": slice, "lon": slice} (see f_Region_window), or None for the whole grid.
+    mask : ndarray or None
+        Booleans (lat, lon) within window, True for the pixels inside Parameters["Mask_file"],
+        or None if there is no mask file.
+    """
+    Bbox = Parameters.get("Bbox")
+    Mask_file = Parameters.get("Mask_file")
+    if Bbox is None and Mask_file is None:
+        return None, None
+    
+    print(f"         Running: {f_Region_of_interest.__name__}()")
+    
+    lat = raw_NC_ds["lat"].values
+    lon = raw_NC_ds["lon"].values
+    
+    # The key identifies the grid and the region (the content of the mask file, not only its name)
+    key = hashlib.sha1()
+    for values in (lat, lon, np.asarray(Bbox if Bbox is not None else [], dtype=np.float64)):
+        key.update(np.ascontiguousarray(values).tobytes())
+    if Mask_file is not None:
+        key.update(Path(Mask_file).read_bytes())
+    key = key.hexdigest()[:16]
+    
+    if key in Regions_of_interest:
+        return Regions_of_interest[key]
+    
+    route_to_cache = Path(Directories["Ancillary"]) / f"region_{key}.npz"
+    if route_to_cache.exists():
+        with np.load(route_to_cache) as cache:
+            window = {dim: slice(int(start), int(stop)) for dim, (start, stop) in zip(("lat", "lon"), cache["window"])}
+            mask = cache["mask"] if cache["mask"].ndim == 2 else None
+        print(f"           - Region of interest read from {route_to_cache.name}")
+    
+    else:
+        start = time.perf_counter()
+        
+        bbox = list(Bbox) if Bbox is not None else [-np.inf, -np.inf, np.inf, np.inf]
+        region = None
+        if Mask_file is not None:
+            region = f_Read_mask_file(Mask_file)
+            # Only the window of the mask (within the bbox, if any) is read
+            bounds = f_Region_bounds(region)
+            bbox = [max(bbox[0], bounds[0]), max(bbox[1], bounds[1]), min(bbox[2], bounds[2]), min(bbox[3], bounds[3])]
+        
+        window = f_Region_window(bbox, lat, lon)
+        mask = f_Rasterise_region(region, lat[window["lat"]], lon[window["lon"]]) if region is not None else None
+        
+        # Written aside and renamed, so other processes never read half a cache
+        route_to_tmp = route_to_cache.with_name(f"{route_to_cache.stem}.{os.getpid()}.tmp.npz")
+        np.savez_compressed(
+            route_to_tmp,
+            window=np.array([[window[dim].start, window[dim].stop] for dim in ("lat", "lon")]),
+            mask=mask if mask is not None else np.zeros(0, dtype=bool),
+        )
+        os.replace(route_to_tmp, route_to_cache)
+        
+        end = time.perf_counter()
+        print(f"           - Region of interest rasterised and cached in {route_to_cache.name}. The process took {end - start:.2f} seconds")
+    
+    pixels = (window["lat"].stop - window["lat"].start) * (window["lon"].stop - window["lon"].start)
+    print(f"           - Window of {pixels} pixels ({pixels / (lat.size * lon.size):.2%} of the grid)" + (f", {int(mask.sum())} inside the mask" if mask is not None else ""))
+    
+    Regions_of_interest[key] = (window, mask)
+    return window, mask
+
+
+def f_Apply_region_mask(NDVI_variable, raw_NC_ds, mask):
+    """
+    Excludes the pixels of NDVI_variable outside mask (see f_Region_of_interest):
+    NaN, or the _FillValue of NDVI for integer digital numbers.
+    """
+    import xarray as xr
+    
+    if mask is None:
+        return NDVI_variable
+    
+    fill_value = np.nan if np.issubdtype(NDVI_variable.dtype, np.floating) else raw_NC_ds["NDVI"].attrs.get("_FillValue", 255)
+    inside = xr.DataArray(mask, dims=("lat", "lon"))
+    if NDVI_variable.chunks is not None:
+        inside = inside.chunk({dim: NDVI_variable.chunksizes[dim] for dim in ("lat", "lon")})
+    
+    return NDVI_variable.where(inside, np.array(fill_value).astype(NDVI_variable.dtype)).transpose(*NDVI_variable.dims)
+
+
+def f_Filter_by_uncertainty(NDVI_variable, raw_NC_ds, Filter_uncertainty, Thr_uncertainty):
+    print(f"         Running: {f_Filter_by_uncertainty.__name__}()")
+    
+    # If the Filter by uncertainty is disabled, return the NDVI with no change
+    if not Filter_uncertainty:
+        print("           - WARNING: Filter by uncertainty disabled. Set it as 'True' to enable")
+        return NDVI_variable
+    
+    # If the Filter by uncertainty is enabled, keep only the pixels where uncertainty is lower than equal or lower than Thr_uncertainty
+    start = time.perf_counter()
+    # Show the current Threshold
+    print(f"           - Exclude pixels with uncertainty ≥ {Thr_uncertainty}")
+    # To make sure the threshold is properly scaled, it is multiplied by the range in the original NC
+    Thr_uncertainty = Thr_uncertainty*raw_NC_ds["NDVI_unc"].attrs.get("valid_range")[1]
+    # Just pixels with uncertainties equal or lower than Thr_uncertainty will remain
+    NDVI_variable = NDVI_variable.where(raw_NC_ds["NDVI_unc"] <= Thr_uncertainty, NDVI_variable.encoding.get("_FillValue"))
+    
+    end = time.perf_counter()
+    print(f"           - The process took {end - start:.2f} seconds")
+    
+    return NDVI_variable
+
+
+def f_Filter_by_NOBS(NDVI_variable, NOBS_variable, Filter_NOBS, Thr_NOBS):
+    print(f"         Running: {f_Filter_by_NOBS.__name__}()")
+    
+    # If the Filter by NOBS is disabled, return the NDVI with no change
+    if not Filter_NOBS:
+        print("           - WARNING: Filter by NOBS disabled. Set it as 'True' to enable")
+        return NDVI_variable
+    
+    # If the Filter by NOBS is enabled, transform the pixels with values smaller than Thr_NOBS into the value that NDVI reserves for missing pixels. Keep the rest of pixels untouched.
+    start = time.perf_counter()
+    # Show the current Threshold
+    print(f"           - Exclude pixels with NOBS < {Thr_NOBS}")
+    NDVI_variable = NDVI_variable.where(NOBS_variable >= Thr_NOBS, NDVI_variable.encoding.get("_FillValue"))
+    end = time.perf_counter()
+    print(f"           - The process took {end - start:.2f} seconds")
+    return NDVI_variable
+
+
+def f_Filter_by_QFLAGS(NDVI_variable, QFLAG_variable, Filter_bitwise):
+    """
+    Parameters
+    ----------
+    NDVI_variable: DataArray
+        This is the NDVI    
+    QFLAG_variable: DataArray
+        This is the variable within the NC file that contains QFLAG, filled with bitwise pixels.
+        Refer to the product user manual (Table 7) for further information.
+    Filter_bitwise : dict
+        This is a dict with True/False values. Bits set as True will be filtered out..
+
+    Returns
+    -------
+    NDVI_variable: DataArray
+        If Filter_bitwise contains any 'True', NDVI_variable will exclude the pixels were Mask_QFLAG is 'True'.
+        If Filter_bitwise does not contain any 'True', NDVI_variable will be identical than the input.
+    """
+    print(f"         Running: {f_Filter_by_QFLAGS.__name__}()")
+    
+    # If all bits are False, return the NDVI with no change
+    if all(not v for v in Filter_bitwise.values()):
+        print("           - WARNING: Filter by QFLAGS disabled. Set bits as 'True' to enable")
+        return NDVI_variable
+    
+    # If, at least, one of the bits is True. Create a mask to exclude these pixels.
+    start = time.perf_counter()
+    # Show the enabled filters
+    print("           - Exclude pixels with the next flags:")
+    for k, v in Filter_bitwise.items():
+        print(f"               bit {k} set as {v}")
+
+    # Create the mask
+    reject_mask = sum(1 << bit for bit, reject in Filter_bitwise.items() if reject)
+    Q = QFLAG_variable.fillna(0).astype(np.uint8, copy=False)
+    Mask_QFLAG = (Q & reject_mask) == 0  
+    
+    # Then, transform the pixels where the mask is True into the value that NDVI reserves for missing pixels. Keep the rest of pixels untouched.
+    # NDVI_variable = NDVI_variable.where(~Mask_QFLAG, NDVI_variable.encoding.get("_FillValue"))
+    NDVI_variable = NDVI_variable.where(Mask_QFLAG, NDVI_variable.encoding.get("_FillValue"))
+
+    end = time.perf_counter()
+    print(f"           - The process took {end - start:.2f} seconds")
+    
+    return NDVI_variable
+    
+
+def f_Mask_LUTs(raw_NC_ds, Parameters, verbose=True):
+    """
+    Parameters
+    ----------
+    raw_NC_ds : Dataset
+        Raw NC file, opened without decoding (i.e. in digital numbers).
+    Parameters : dict
+        Parameters of the filters (see f_Filter_parameters).
+    verbose : bool, optional
+        Print the filters applied (e.g. False to build the tables of many parameter sets).
+
+    Returns
+    -------
+    NDVI_LUT : ndarray
+        256 values, indexed by the digital number of NDVI: the digital number itself,
+        or fill_value for the intrinsic flags (flag_values). float32 or uint8, as
+        Parameters["Output_encoding"].
+    keep_LUTs : dict
+        {layer: 256 booleans} for every enabled filter ("NDVI_unc", "NOBS" and/or "QFLAG"),
+        indexed by the digital number of the layer. True for the pixels that are kept.
+    fill_value : float32 or uint8
+        Value of the excluded pixels: NaN, or the _FillValue of NDVI (uint8 encoding).
+    """
+    log = print if verbose else (lambda *args, **kwargs: None)
+    log(f"         Running: {f_Mask_LUTs.__name__}()")
+    
+    DN = np.arange(256)
+    
+    if Parameters["Output_encoding"] == "uint8":
+        fill_value = np.uint8(raw_NC_ds["NDVI"].attrs.get("_FillValue", 255))
+    else:
+        fill_value = np.float32(np.nan)
+    
+    # Exclude the pixels with intrinsic flags
+    NDVI_LUT = DN.astype(fill_value.dtype)
+    NDVI_LUT[np.isin(DN, raw_NC_ds["NDVI"].attrs.get("flag_values", []))] = fill_value
+    
+    keep_LUTs = {}
+    
+    if Parameters["Filter_uncertainty"]:
+        log(f"           - Exclude pixels with uncertainty ≥ {Parameters['Thr_uncertainty']}")
+        # To make sure the threshold is properly scaled, it is multiplied by the range in the original NC
+        keep_LUTs["NDVI_unc"] = DN <= Parameters["Thr_uncertainty"]*raw_NC_ds["NDVI_unc"].attrs.get("valid_range")[1]
+    else:
+        log("           - WARNING: Filter by uncertainty disabled. Set it as 'True' to enable")
+    
+    if Parameters["Filter_NOBS"]:
+        log(f"           - Exclude pixels with NOBS < {Parameters['Thr_NOBS']}")
+        keep_LUTs["NOBS"] = DN >= Parameters["Thr_NOBS"]
+    else:
+        log("           - WARNING: Filter by NOBS disabled. Set it as 'True' to enable")
+    
+    reject_mask = sum(1 << bit for bit, reject in Parameters["Filter_bitwise"].items() if reject)
+    if reject_mask:
+        log("           - Exclude pixels with the next flags:")
+        for k, v in Parameters["Filter_bitwise"].items():
+            log(f"               bit {k} set as {v}")
+        keep_LUTs["QFLAG"] = (DN & reject_mask) == 0
+    else:
+        log("           - WARNING: Filter by QFLAGS disabled. Set bits as 'True' to enable")
+    
+    return NDVI_LUT, keep_LUTs, fill_value
+
+
+def f_Fused_mask_kernel(NDVI, *layers, NDVI_LUT, keep_LUTs, fill_value, out=None, keep=None, scratch=None):
+    """
+    Filters a block in a single pass: every layer is read once, and indexes
+    its lookup table. The kept pixels keep their digital number (with the
+    dtype of NDVI_LUT); the rest are set to fill_value.
+
+    Parameters
+    ----------
+    NDVI : ndarray
+        Block of NDVI (uint8 digital numbers).
+    *layers : ndarray
+        Blocks of the filtered layers (uint8), in the same order as keep_LUTs.
+    NDVI_LUT, keep_LUTs, fill_value :
+        Lookup tables and value of the excluded pixels (see f_Mask_LUTs). keep_LUTs is a sequence here.
+    out, keep, scratch : ndarray, optional
+        Preallocated buffers (shape of NDVI) for the output and the keep-mask (bool),
+        so a block iterator can reuse them (see f_Filter_NC_file_streaming).
+    """
+    NDVI_filtered = np.take(NDVI_LUT, NDVI, out=out)
+    
+    for index, (layer, LUT) in enumerate(zip(layers, keep_LUTs)):
+        if index == 0:
+            keep = np.take(LUT, layer, out=keep)
+        else:
+            keep &= np.take(LUT, layer, out=scratch)
+    
+    if keep_LUTs:
+        np.copyto(NDVI_filtered, fill_value, where=np.logical_not(keep, out=keep))
+    
+    return NDVI_filtered
+
+
+def f_Filter_fused(raw_NC_ds, Parameters):
+    """
+    Applies the intrinsic flags and the filters by uncertainty, NOBS and
+    QFLAG at once, on the raw digital numbers (see f_Fused_mask_kernel). Every
+    chunk of the four layers is read once and NDVI is written in one pass,
+    instead of chaining a full-array .where() per filter.
+
+    Returns
+    -------
+    NDVI_variable : DataArray
+        Filtered NDVI: float32 digital numbers with NaN for the excluded pixels, or
+        uint8 digital numbers with _FillValue for them (see Output_encoding).
+    """
+    import xarray as xr
+    
+    print(f"         Running: {f_Filter_fused.__name__}()")
+    start = time.perf_counter()
+    
+    NDVI_LUT, keep_LUTs, fill_value = f_Mask_LUTs(raw_NC_ds, Parameters)
+    
+    NDVI_variable = xr.apply_ufunc(
+        f_Fused_mask_kernel,
+        raw_NC_ds["NDVI"],
+        *[raw_NC_ds[name] for name in keep_LUTs],
+        kwargs={"NDVI_LUT": NDVI_LUT, "keep_LUTs": list(keep_LUTs.values()), "fill_value": fill_value},
+        dask="parallelized",
+        output_dtypes=[NDVI_LUT.dtype],
+        keep_attrs=True,
+    )
+    
+    end = time.perf_counter()
+    print(f"           - The process took {end - start:.2f} seconds")
+    
+    return NDVI_variable
+
+
+def f_Codec_encoding(Codec=Codec, Complevel=Complevel, Shuffle=Shuffle):
+    """
+    Returns
+    -------
+    compression : dict
+        Compression settings of a NetCDF4 variable, valid both as xarray encoding
+        and as keyword arguments of netCDF4.Dataset.createVariable.
+    """
+    if Codec == "none":
+        return {"zlib": False, "shuffle": False}
+    if Codec == "zlib":
+        return {"zlib": True, "complevel": Complevel, "shuffle": Shuffle}
+    if Codec.startswith("blosc_"):
+        # Blosc shuffles by itself
+        return {"compression": Codec, "complevel": Complevel, "shuffle": False, "blosc_shuffle": 1 if Shuffle else 0}
+    return {"compression": Codec, "complevel": Complevel, "shuffle": Shuffle}
+
+
+@functools.lru_cache(maxsize=None)
+def f_Codec_is_available(Codec):
+    """
+    Returns True if a small NC file can be written and read back with Codec.
+    The codecs other than zlib depend on the HDF5 filter plugins found by netCDF4.
+    """
+    if Codec in ("none", "zlib"):
+        return True
+    
+    try:
+        import netCDF4 as netCDF4
+        
+        # Compressible values: some plugins (e.g. blosc) fail on incompressible buffers
+        values = np.repeat(np.arange(16, dtype=np.uint8), 256)
+        with tempfile.TemporaryDirectory() as route_to_tmp:
+            route_to_NC = Path(route_to_tmp) / "codec.nc"
+            with netCDF4.Dataset(route_to_NC, "w", format="NETCDF4") as output_NC:
+                output_NC.createDimension("x", values.size)
+                output_NC.createVariable("x", values.dtype, ("x",), **f_Codec_encoding(Codec))[:] = values
+            with netCDF4.Dataset(route_to_NC) as input_NC:
+                return bool(np.array_equal(input_NC["x"][:], values))
+    
+    except Exception:
+        return False
+
+
+def f_NDVI_encoding(raw_NC_ds, Output_encoding="float32", Compression=None):
+    """
+    Returns
+    -------
+    encoding : dict
+        Encoding of the filtered NDVI: compression (see f_Codec_encoding; by default,
+        zlib at level 4), dtype and the chunks of the original NDVI (within its shape,
+        if only a region is saved).
+    """
+    chunksizes = raw_NC_ds["NDVI"].encoding.get("chunksizes")
+    
+    return {
+        **(Compression if Compression is not None else f_Codec_encoding()),
+        "dtype": Output_encoding,
+        # "_FillValue": -9999.0,
+        "chunksizes": tuple(min(size, length) for size, length in zip(chunksizes, raw_NC_ds["NDVI"].shape)) if chunksizes else None
+    }
+
+
+def f_Save_the_NC(NDVI_variable, raw_NC_ds, filename, Directories, Output_encoding="float32", Compression=None, compute=True, attrs=None):
+    """
+    Saves NDVI_variable in Directories["Outputs_filtered"], with the global
+    attributes attrs (see f_Provenance), through a temporary file that is
+    renamed once complete. With compute=False, nothing is computed yet: the
+    delayed write is returned (see dask.compute), so several outputs can
+    share the reads of the same NC file.
+    """
+    import dask as dask
+    
+    print(f"         Running: {f_Save_the_NC.__name__}()")
+    print("           - This process may take a few minutes")    
+    start = time.perf_counter() 
+    
+    route_to_output_NC = Path(Directories["Outputs_filtered"]) / Path(filename)
+    
+    # Native digital numbers: the excluded pixels take the reserved missing value.
+    # The scale_factor, add_offset and _FillValue of the original NDVI are kept
+    # in the attributes, so the file remains CF-decodable
+    if Output_encoding == "uint8" and NDVI_variable.dtype != np.uint8:
+        Fill_value = raw_NC_ds["NDVI"].attrs.get("_FillValue", 255)
+        NDVI_variable = NDVI_variable.fillna(Fill_value).astype(np.uint8)
+    
+    encoding = {"NDVI": f_NDVI_encoding(raw_NC_ds, Output_encoding, Compression)}
+    
+    NDVI_ds = NDVI_variable.to_dataset(name="NDVI")
+    NDVI_ds["NDVI"].attrs = raw_NC_ds["NDVI"].attrs
+    NDVI_ds.attrs = attrs or {}
+    
+    # A half-written file never takes the place of the output
+    route_to_tmp = route_to_output_NC.with_name(f"{route_to_output_NC.name}.{os.getpid()}.tmp")
+    try:
+        delayed_write = NDVI_ds.to_netcdf(
+            route_to_tmp,
+            format="NETCDF4",
+            engine="netcdf4",
+            encoding=encoding,
+            compute=compute
+        )
+    except BaseException:
+        route_to_tmp.unlink(missing_ok=True)
+        raise
+    
+    if not compute:
+        return dask.delayed(lambda written: os.replace(route_to_tmp, route_to_output_NC))(delayed_write)
+    os.replace(route_to_tmp, route_to_output_NC)
+    
+    end = time.perf_counter()
+    print(f"           - The process took {end - start:.2f} seconds")
+    
+    
+class ChunkReader:
+    """
+    Reads the chunks of an HDF5 (NetCDF4) variable along its native chunk grid.
+
+    When the filters of the variable are only deflate, shuffle and/or
+    fletcher32, the chunks are read raw (read_direct_chunk) and decoded here:
+    zlib releases the GIL, so several chunks are decompressed at once on a
+    thread pool. Otherwise (other filters, unallocated chunks), the chunk is
+    read through HDF5 (read_direct).
+    """
+
+    SUPPORTED_FILTERS = {1: "deflate", 2: "shuffle", 3: "fletcher32"}
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.lock = threading.Lock()
+        
+        create_plist = dataset.id.get_create_plist()
+        self.filters = [create_plist.get_filter(index)[0] for index in range(create_plist.get_nfilters())]
+        self.raw = dataset.chunks is not None and all(code in self.SUPPORTED_FILTERS for code in self.filters)
+
+    def read(self, offset, buffer):
+        """
+        Reads the chunk that starts at offset into buffer (shape of a full chunk).
+        """
+        selection = tuple(slice(start, min(start + size, length)) for start, size, length in zip(offset, self.dataset.chunks, self.dataset.shape))
+        valid = tuple(slice(0, s.stop - s.start) for s in selection)
+        
+        if self.raw:
+            try:
+                # h5py is not thread-safe: only the raw read is serialised, the decoding is not
+                with self.lock:
+                    filter_mask, data = self.dataset.id.read_direct_chunk(offset)
+                self._decode(data, filter_mask, buffer)
+                return valid
+            except (KeyError, OSError, RuntimeError, ValueError):
+                # e.g. chunks that were never written (their storage is not allocated)
+                pass
+        
+        with self.lock:
+            self.dataset.read_direct(buffer, source_sel=selection, dest_sel=valid)
+        return valid
+
+    def _decode(self, data, filter_mask, buffer):
+        # The filters are undone in the reverse order of the pipeline. Filters skipped for this chunk have their bit set in filter_mask
+        for index in reversed(range(len(self.filters))):
+            if filter_mask & (1 << index):
+                continue
+            if self.filters[index] == 1:
+                data = zlib.decompress(data)
+            elif self.filters[index] == 3:
+                data = data[:-4]
+            elif self.filters[index] == 2 and buffer.dtype.itemsize > 1:
+                # Shuffle stores the first byte of every value, then the second byte...
+                shuffled = np.frombuffer(data, np.uint8).reshape(buffer.dtype.itemsize, buffer.size)
+                np.copyto(buffer.reshape(-1).view(np.uint8).reshape(buffer.size, buffer.dtype.itemsize), shuffled.T)
+                return
+        
+        np.copyto(buffer.reshape(-1), np.frombuffer(data, buffer.dtype, count=buffer.size))
+
+
+def f_Copy_coordinates(output_NC, raw_NC_ds, dims):
+    """
+    Creates the dimensions dims in output_NC (a netCDF4.Dataset), with the
+    lengths and the coordinates (values and attributes) of raw_NC_ds.
+    """
+    for dimension in dims:
+        output_NC.createDimension(dimension, raw_NC_ds.sizes[dimension])
+        if dimension in raw_NC_ds.variables:
+            coordinate = raw_NC_ds[dimension]
+            variable = output_NC.createVariable(dimension, coordinate.dtype, (dimension,), fill_value=coordinate.attrs.get("_FillValue"))
+            variable.setncatts({k: v for k, v in coordinate.attrs.items() if k != "_FillValue"})
+            variable.set_auto_maskandscale(False)
+            variable[:] = coordinate.values
+
+
+# Layers of the quality index, and the summary of every chunk of each of them:
+# min/max of the digital numbers, and OR/AND of the bits of QFLAG
+QUALITY_LAYERS = ["NDVI_unc", "NOBS", "QFLAG"]
+QUALITY_SUMMARIES = {"NDVI": ("min", "max"), "NDVI_unc": ("min", "max"), "NOBS": ("min", "max"), "QFLAG": ("or", "and")}
+
+
+def f_Build_quality_index(route_to_input_NC, route_to_index, threads=None):
+    """
+    Builds the quality index of an NC file: NDVI_unc, NOBS and QFLAG, compressed,
+    with the chunks of the NC file, and the summaries of every chunk (see
+    QUALITY_SUMMARIES), so a filter can tell the chunks where every pixel passes
+    or fails without reading them (see f_Chunk_decisions).
+    """
+    print(f"         Running: {f_Build_quality_index.__name__}()")
+    start = time.perf_counter()
+    
+    # Optional dependencies, only needed in this mode
+    import dask as dask
+    import h5py as h5py
+    import netCDF4 as netCDF4
+    import xarray as xr
+    
+    route_to_tmp = route_to_index.with_name(f"{route_to_index.name}.{os.getpid()}.tmp")
+    
+    with h5py.File(route_to_input_NC, "r") as h5_file, xr.open_dataset(route_to_input_NC, decode_cf=False) as raw_NC_ds:
+        readers = {name: ChunkReader(h5_file[name]) for name in QUALITY_SUMMARIES}
+        NDVI_h5 = h5_file["NDVI"]
+        chunks = NDVI_h5.chunks or NDVI_h5.shape
+        dims = raw_NC_ds["NDVI"].dims
+        grid = [-(-length // size) for length, size in zip(NDVI_h5.shape, chunks)]
+        
+        summaries = {(name, summary): np.zeros(grid, dtype=np.uint8) for name, kinds in QUALITY_SUMMARIES.items() for summary in kinds}
+        threads = threads or dask.config.get("num_workers", None) or os.cpu_count() or 1
+        
+        def read_block(offset):
+            buffers = {name: np.empty(chunks, dtype=np.uint8) for name in readers}
+            valid = None
+            for name, reader in readers.items():
+                valid = reader.read(offset, buffers[name])
+            return offset, valid, buffers
+        
+        with netCDF4.Dataset(route_to_tmp, "w", format="NETCDF4") as index_NC:
+            f_Copy_coordinates(index_NC, raw_NC_ds, dims)
+            
+            layers = {}
+            for name in QUALITY_LAYERS:
+                layers[name] = index_NC.createVariable(
+                    name, np.uint8, dims, chunksizes=chunks,
+                    fill_value=raw_NC_ds[name].attrs.get("_FillValue"), **f_Codec_encoding(),
+                )
+                layers[name].setncatts({k: v for k, v in raw_NC_ds[name].attrs.items() if k != "_FillValue"})
+                layers[name].set_auto_maskandscale(False)
+            
+            # A few blocks per thread at once, so the memory stays bounded
+            offsets = itertools.product(*[range(0, length, size) for length, size in zip(NDVI_h5.shape, chunks)])
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                while True:
+                    batch = list(itertools.islice(offsets, 4 * threads))
+                    if not batch:
+                        break
+                    for offset, valid, buffers in pool.map(read_block, batch):
+                        chunk = tuple(origin // size for origin, size in zip(offset, chunks))
+                        for name, kinds in QUALITY_SUMMARIES.items():
+                            values = buffers[name][valid]
+                            for summary in kinds:
+                                if summary == "min":
+                                    summaries[(name, summary)][chunk] = values.min()
+                                elif summary == "max":
+                                    summaries[(name, summary)][chunk] = values.max()
+                                elif summary == "or":
+                                    summaries[(name, summary)][chunk] = np.bitwise_or.reduce(values, axis=None)
+                                else:
+                                    summaries[(name, summary)][chunk] = np.bitwise_and.reduce(values, axis=None)
+                        target = tuple(slice(origin, origin + s.stop) for origin, s in zip(offset, valid))
+                        for name in QUALITY_LAYERS:
+                            layers[name][target] = buffers[name][valid]
+            
+            # %% SUMMARIES OF THE CHUNKS
+            for dimension, length in zip(dims, grid):
+                index_NC.createDimension(f"{dimension}_chunk", length)
+            for (name, summary), values in summaries.items():
+                variable = index_NC.createVariable(f"{name}_{summary}", np.uint8, tuple(f"{dimension}_chunk" for dimension in dims), fill_value=False)
+                variable.set_auto_maskandscale(False)
+                variable[:] = values
+            
+            # The source, to tell when the index is stale
+            index_NC.setncatts({
+                "source": Path(route_to_input_NC).name,
+                "source_size": os.path.getsize(route_to_input_NC),
+                "source_mtime_ns": str(os.stat(route_to_input_NC).st_mtime_ns),
+                "chunks": list(chunks),
+            })
+    
+    os.replace(route_to_tmp, route_to_index)
+    
+    end = time.perf_counter()
+    print(f"           - Quality index of {int(np.prod(grid))} chunks saved in {route_to_index.name}. The process took {end - start:.2f} seconds")
+
+
+def f_Quality_index(route_to_input_NC, Directories):
+    """
+    Returns
+    -------
+    route_to_index : WindowsPath
+        Route to the quality index of the NC file (in Ancillary/Quality_index), built
+        now if it does not exist yet, or if the NC file changed since it was built.
+    """
+    import xarray as xr
+    
+    route_to_index = Path(Directories["Ancillary"]) / "Quality_index" / Path(route_to_input_NC).name
+    
+    if route_to_index.exists():
+        try:
+            with xr.open_dataset(route_to_index, decode_cf=False) as index_ds:
+                source = (int(index_ds.attrs["source_size"]), str(index_ds.attrs["source_mtime_ns"]))
+            if source == (os.path.getsize(route_to_input_NC), str(os.stat(route_to_input_NC).st_mtime_ns)):
+                return route_to_index
+        except (OSError, KeyError, ValueError):
+            pass
+        print(f"           - The quality index of {route_to_index.name} is stale: it is rebuilt")
+    
+    route_to_index.parent.mkdir(parents=True, exist_ok=True)
+    f_Build_quality_index(route_to_input_NC, route_to_index)
+    return route_to_index
+
+
+def f_Chunk_decisions(index_file, NDVI_LUT, keep_LUTs, fill_value, Parameters):
+    """
+    Parameters
+    ----------
+    index_file : h5py.File
+        Quality index (see f_Build_quality_index).
+    NDVI_LUT, keep_LUTs, fill_value :
+        Lookup tables of the filters and value of the excluded pixels (see f_Mask_LUTs).
+    Parameters : dict
+        Parameters of the filters (see f_Filter_parameters).
+
+    Returns
+    -------
+    all_fail : ndarray
+        Booleans per chunk: every pixel is excluded (nothing has to be read).
+    all_pass : ndarray
+        Booleans per chunk: every pixel passes the filters of NDVI_unc, NOBS and QFLAG
+        (only NDVI has to be read).
+    """
+    summary = {name: index_file[name][()] for name in index_file if name.endswith(("_min", "_max", "_or", "_and"))}
+    
+    def all_kept(LUT, low, high):
+        # Every digital number from low to high is kept (cumulative count of the excluded ones)
+        excluded = np.concatenate([[0], np.cumsum(~LUT)])
+        return excluded[high.astype(int) + 1] == excluded[low.astype(int)]
+    
+    def none_kept(LUT, low, high):
+        kept = np.concatenate([[0], np.cumsum(LUT)])
+        return kept[high.astype(int) + 1] == kept[low.astype(int)]
+    
+    # The intrinsic flags of NDVI: the digital numbers whose output is fill_value
+    NDVI_kept = ~np.isnan(NDVI_LUT) if np.isnan(fill_value) else NDVI_LUT != fill_value
+    all_fail = none_kept(NDVI_kept, summary["NDVI_min"], summary["NDVI_max"])
+    all_pass = np.ones_like(all_fail)
+    
+    for name, LUT in keep_LUTs.items():
+        if name == "QFLAG":
+            reject_mask = sum(1 << bit for bit, reject in Parameters["Filter_bitwise"].items() if reject)
+            all_fail |= (summary["QFLAG_and"] & reject_mask) != 0
+            all_pass &= (summary["QFLAG_or"] & reject_mask) == 0
+        else:
+            all_fail |= none_kept(LUT, summary[f"{name}_min"], summary[f"{name}_max"])
+            all_pass &= all_kept(LUT, summary[f"{name}_min"], summary[f"{name}_max"])
+    
+    return all_fail, all_pass & ~all_fail
+
+
+def f_Filter_NC_file_streaming(route_to_input_NC, route_to_output_NC, raw_NC_ds, Parameters, Max_memory, threads=None, window=None, mask=None, route_to_index=None, attrs=None):
+    """
+    Streaming engine of the filter: the NC file is read along the native chunk
+    grid of NDVI, every block (one chunk of the four layers) is decoded and
+    filtered on a thread pool into preallocated buffers that are reused, and
+    every output chunk is written as soon as it is ready.
+
+    Parameters
+    ----------
+    route_to_input_NC, route_to_output_NC : WindowsPath
+        Routes to the raw and to the filtered NC files.
+    raw_NC_ds : Dataset
+        Raw NC file opened without decoding, within window (only its attributes and coordinates are used).
+    Parameters : dict
+        Parameters of the filters (see f_Filter_parameters).
+    Max_memory : float
+        Memory, in bytes, for the buffers. It sets how many blocks are in flight.
+    threads : int, optional
+        Threads that decode and filter the blocks. By default, as many as the dask threads.
+    window : dict, optional
+        Region of interest (see f_Region_of_interest): only the chunks that intersect it are read.
+    mask : ndarray, optional
+        Booleans (lat, lon) within window: the pixels outside of it are excluded.
+    route_to_index : WindowsPath, optional
+        Quality index of the NC file (see f_Quality_index). The layers are read from it,
+        and the chunks where every pixel passes or fails are skipped (see f_Chunk_decisions).
+    attrs : dict, optional
+        Global attributes of the output (see f_Provenance).
+    """
+    print(f"         Running: {f_Filter_NC_file_streaming.__name__}()")
+    start = time.perf_counter()
+    
+    # Optional dependencies, only needed in this mode
+    import dask as dask
+    import h5py as h5py
+    import netCDF4 as netCDF4
+    
+    NDVI_LUT, keep_LUTs, fill_value = f_Mask_LUTs(raw_NC_ds, Parameters)
+    encoding = f_NDVI_encoding(raw_NC_ds, Parameters["Output_encoding"], Parameters["Compression"])
+    
+    # The output is written aside, and renamed once complete
+    route_to_tmp = Path(route_to_output_NC).with_name(f"{Path(route_to_output_NC).name}.{os.getpid()}.tmp")
+    try:
+        with h5py.File(route_to_input_NC, "r") as h5_file, (h5py.File(route_to_index, "r") if route_to_index is not None else contextlib.nullcontext()) as index_file:
+            layers_file = index_file if index_file is not None else h5_file
+            readers = {"NDVI": ChunkReader(h5_file["NDVI"]), **{name: ChunkReader(layers_file[name]) for name in keep_LUTs}}
+            NDVI_h5 = h5_file["NDVI"]
+            chunks = NDVI_h5.chunks or NDVI_h5.shape
+            dims = raw_NC_ds["NDVI"].dims
+        
+            # Chunks that are skipped: nothing is read (all_fail), or only NDVI (all_pass)
+            all_fail = all_pass = None
+            if index_file is not None:
+                all_fail, all_pass = f_Chunk_decisions(index_file, NDVI_LUT, keep_LUTs, fill_value, Parameters)
+            # The chunks left unwritten already read as the _FillValue of the output
+            output_fill_value = np.array(raw_NC_ds["NDVI"].attrs.get("_FillValue", fill_value)).astype(NDVI_LUT.dtype)
+            skip_fill = bool(output_fill_value == fill_value)
+            counts = {"mixed": 0, "pass": 0, "fail": 0}
+        
+            # Only the chunks that intersect the region of interest (by default, the whole grid)
+            bounds = [(window or {}).get(dim, slice(0, length)) for dim, length in zip(dims, NDVI_h5.shape)]
+            ranges = [range(bound.start // size * size, bound.stop, size) for bound, size in zip(bounds, chunks)]
+            offsets = itertools.product(*ranges)
+            number_of_blocks = int(np.prod([len(axis) for axis in ranges]))
+        
+            # Buffers of a block: the layers, the output, the keep-mask and its scratch.
+            # More than a few blocks per thread would only hold memory
+            threads = threads or dask.config.get("num_workers", None) or os.cpu_count() or 1
+            pixels = int(np.prod(chunks))
+            bytes_per_block = pixels * (len(readers) + NDVI_LUT.dtype.itemsize + 2)
+            blocks_in_flight = max(1, min(int(Max_memory // bytes_per_block), 4 * threads, number_of_blocks))
+            threads = max(1, min(threads, blocks_in_flight))
+            print(f"           - Chunks of {chunks}: {blocks_in_flight} blocks of {bytes_per_block / 1e6:.1f} MB in flight, {threads} threads")
+        
+            free_buffers = queue.Queue()
+            for _ in range(blocks_in_flight):
+                free_buffers.put({
+                    "layers": {name: np.empty(chunks, dtype=reader.dataset.dtype) for name, reader in readers.items()},
+                    "out": np.empty(chunks, dtype=NDVI_LUT.dtype),
+                    "keep": np.empty(chunks, dtype=bool),
+                    "scratch": np.empty(chunks, dtype=bool),
+                })
+        
+            def filter_block(offset, buffers):
+                chunk = tuple(origin // size for origin, size in zip(offset, chunks))
+                decision = "mixed" if all_fail is None else "fail" if all_fail[chunk] else "pass" if all_pass[chunk] else "mixed"
+            
+                if decision == "fail":
+                    valid = tuple(slice(0, min(size, length - origin)) for origin, size, length in zip(offset, chunks, NDVI_h5.shape))
+                    buffers["out"].fill(fill_value)
+                elif decision == "pass":
+                    valid = readers["NDVI"].read(offset, buffers["layers"]["NDVI"])
+                    np.take(NDVI_LUT, buffers["layers"]["NDVI"], out=buffers["out"])
+                else:
+                    valid = None
+                    for name, reader in readers.items():
+                        valid = reader.read(offset, buffers["layers"][name])
+                    f_Fused_mask_kernel(
+                        buffers["layers"]["NDVI"], *[buffers["layers"][name] for name in keep_LUTs],
+                        NDVI_LUT=NDVI_LUT, keep_LUTs=list(keep_LUTs.values()), fill_value=fill_value,
+                        out=buffers["out"], keep=buffers["keep"], scratch=buffers["scratch"],
+                    )
+            
+                # Part of the chunk within the region (source) and its place in the output (target)
+                source = tuple(slice(max(bound.start - origin, 0), min(bound.stop - origin, s.stop)) for origin, s, bound in zip(offset, valid, bounds))
+                target = tuple(slice(origin + s.start - bound.start, origin + s.stop - bound.start) for origin, s, bound in zip(offset, source, bounds))
+            
+                if mask is not None:
+                    inside = mask[target[dims.index("lat")], target[dims.index("lon")]]
+                    inside = inside.reshape([inside.shape[["lat", "lon"].index(dim)] if dim in ("lat", "lon") else 1 for dim in dims])
+                    np.copyto(buffers["out"][source], fill_value, where=~inside)
+            
+                return source, target, buffers, decision
+        
+            # %% CREATE THE OUTPUT FILE
+            with netCDF4.Dataset(route_to_tmp, "w", format="NETCDF4") as output_NC:
+                output_NC.setncatts(attrs or {})
+                NDVI = raw_NC_ds["NDVI"]
+                f_Copy_coordinates(output_NC, raw_NC_ds, NDVI.dims)
+            
+                compression = {k: v for k, v in encoding.items() if k not in ("dtype", "chunksizes")}
+                output_chunks = encoding["chunksizes"] or tuple(min(size, length) for size, length in zip(chunks, NDVI.shape))
+                NDVI_output = output_NC.createVariable(
+                    "NDVI", NDVI_LUT.dtype, NDVI.dims,
+                    chunksizes=output_chunks,
+                    fill_value=output_fill_value,
+                    **compression,
+                )
+                NDVI_output.setncatts({k: v for k, v in NDVI.attrs.items() if k != "_FillValue"})
+                # The digital numbers are written as they are (no packing with scale_factor/add_offset)
+                NDVI_output.set_auto_maskandscale(False)
+            
+                # Within a region, the chunks of the output straddle the chunks of the input: keep
+                # two rows of output chunks in cache, so every one is only compressed once
+                if window is not None:
+                    chunks_per_row = int(np.prod([-(-length // size) for length, size in zip(NDVI.shape[-1:], output_chunks[-1:])]))
+                    slots = 2 * chunks_per_row + 1
+                    NDVI_output.set_var_chunk_cache(size=slots * int(np.prod(output_chunks)) * NDVI_LUT.dtype.itemsize, nelems=max(slots, 521), preemption=0.75)
+            
+                # %% STREAM THE BLOCKS
+                with ThreadPoolExecutor(max_workers=threads) as pool:
+                    in_flight = set()
+                    for offset in itertools.chain(offsets, [None]):
+                        # Submit blocks while there are free buffers; write the blocks that are ready
+                        while in_flight and (offset is None or free_buffers.empty()):
+                            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                source, target, buffers, decision = future.result()
+                                counts[decision] += 1
+                                if not (decision == "fail" and skip_fill):
+                                    NDVI_output[target] = buffers["out"][source]
+                                free_buffers.put(buffers)
+                    
+                        if offset is not None:
+                            in_flight.add(pool.submit(filter_block, offset, free_buffers.get()))
+    
+    except BaseException:
+        route_to_tmp.unlink(missing_ok=True)
+        raise
+    os.replace(route_to_tmp, route_to_output_NC)
+    
+    end = time.perf_counter()
+    print(f"           - {number_of_blocks} blocks filtered. The process took {end - start:.2f} seconds")
+    if route_to_index is not None:
+        print(f"           - Quality index: {counts['fail']} blocks skipped (every pixel excluded), {counts['pass']} blocks from NDVI alone (every pixel kept), {counts['mixed']} blocks filtered")
+
+
+def f_Filter_NC_file(every_NC_file, Directories, Parameters):
+    """
+    Parameters
+    ----------
+    every_NC_file : str
+        Name of the NC file to filter, in Directories["Outputs_downloaded"].
+    Directories : dict
+        Dictionary with, at least, the Outputs_downloaded and Outputs_filtered directories.
+    Parameters : dict
+        Parameters of the filters (see f_Filter_parameters).
+
+    Returns
+    -------
+    route_to_output_NC : WindowsPath
+        Route to the filtered NC file, in Directories["Outputs_filtered"].
+    """
+    import xarray as xr
+    
+    print(f"         Running: {f_Filter_NC_file.__name__}()")
+    
+    raw_NC_ds = None
+    NDVI = None
+    try:
+    
+        # %% OPEN THE NC FILE
+        print(f"         Opening the file from {f_Filter_NC_file.__name__}()")
+        # Create the route to the NC file
+        route_to_input_NC = Directories["Outputs_downloaded"] / Path(every_NC_file)
+        # Open the input NC file (with chunks)
+        # It is key to not to decode. Decoding opens it directly in PV, so 
+        # values in DV (like the imtrinsic flags) are not properly detected
+        raw_NC_ds = xr.open_dataset(route_to_input_NC, decode_cf=False)
+        
+        # Only the window of the region of interest is read (lazily), filtered and saved
+        window, mask = f_Region_of_interest(raw_NC_ds, Parameters, Directories)
+        if window is not None:
+            raw_NC_ds = raw_NC_ds.isel(window)
+        raw_NC_ds = raw_NC_ds.chunk("auto")
+        
+        # Provenance of the output: parameters, version and checksum of the input
+        attrs = f_Provenance(every_NC_file, Directories, Parameters)
+        
+        
+        # %% FILTER 
+        # The layers of CLMS are uint8 digital numbers: filter them in a
+        # single pass, with lookup tables (see f_Filter_fused)
+        is_uint8 = all(raw_NC_ds[name].dtype == np.uint8 for name in ("NDVI", "NDVI_unc", "NOBS", "QFLAG"))
+        
+        # Within a memory budget, stream the file chunk by chunk and write it straight away
+        if is_uint8 and Parameters["Max_memory"] is not None and raw_NC_ds["NDVI"].encoding.get("chunksizes"):
+            route_to_output_NC = Path(Directories["Outputs_filtered"]) / Path(every_NC_file)
+            route_to_index = f_Quality_index(route_to_input_NC, Directories) if Parameters.get("Quality_index") else None
+            f_Filter_NC_file_streaming(route_to_input_NC, route_to_output_NC, raw_NC_ds, Parameters, Parameters["Max_memory"], window=window, mask=mask, route_to_index=route_to_index, attrs=attrs)
+            return route_to_output_NC
+        
+        if is_uint8:
+            NDVI = f_Filter_fused(raw_NC_ds, Parameters)
+        
+        else:
+            # Create the new file
+            NDVI = raw_NC_ds["NDVI"]
+            # Exclude the pixels with intrinsic flags
+            # 'flag_values': array([252, 253, 254, 255], dtype=uint8),
+            # 'flag_meanings': 'Unknown Snow Water Missing'}
+            invalid = NDVI.isin(NDVI.attrs.get("flag_values"))
+            NDVI = NDVI.where(~invalid)
+            
+            # Filter by uncertainty
+            NDVI = f_Filter_by_uncertainty(NDVI, raw_NC_ds, Parameters["Filter_uncertainty"], Parameters["Thr_uncertainty"])
+            
+            # Filter by number of observations
+            NDVI = f_Filter_by_NOBS(NDVI, raw_NC_ds["NOBS"], Parameters["Filter_NOBS"], Parameters["Thr_NOBS"])
+            
+            # Filter by Quality Flags
+            # bits set as True in Filter_bitwise will be filtered out
+            NDVI = f_Filter_by_QFLAGS(NDVI, raw_NC_ds["QFLAG"], Parameters["Filter_bitwise"])
+        
+        # Exclude the pixels outside the mask of the region of interest
+        NDVI = f_Apply_region_mask(NDVI, raw_NC_ds, mask)
+                  
+        # %% SAVE THE PROCESSED NC FILE
+        f_Save_the_NC(NDVI, raw_NC_ds, every_NC_file, Directories, Parameters["Output_encoding"], Parameters["Compression"], attrs=attrs)
+        
+        # NOTES:
+            # raw_NC_ds["NDVI"].encoding muestra cómo se ha abierto la variebl (por ejeplo, si se le ha aplicado el paso a PV)
+        
+    finally:
+        # Close the open NC files
+        if raw_NC_ds is not None:
+            raw_NC_ds.close()
+        if NDVI is not None:
+            NDVI.close()
+    
+    return Path(Directories["Outputs_filtered"]) / Path(every_NC_file)
+
+
+def f_Memory_estimate(route_to_input_NC, Parameters, threads):
+    """
+    Parameters
+    ----------
+    route_to_input_NC : WindowsPath
+        Route to the NC file to filter.
+    Parameters : dict
+        Parameters of the filters (see f_Filter_parameters).
+    threads : int
+        Threads used to filter the file.
+
+    Returns
+    -------
+    memory : int
+        Estimated peak memory, in bytes, to filter the file: every thread holds one
+        chunk (as chunked by f_Filter_NC_file) of the four layers, the keep-mask and
+        the output, capped by the size of the whole file in memory.
+    """
+    import xarray as xr
+    
+    # The streaming engine keeps to its own budget
+    if Parameters["Max_memory"] is not None:
+        return int(Parameters["Max_memory"])
+    
+    with xr.open_dataset(route_to_input_NC, decode_cf=False) as raw_NC_ds:
+        NDVI = raw_NC_ds["NDVI"].chunk("auto")
+        output_itemsize = np.dtype(Parameters["Output_encoding"]).itemsize
+        bytes_per_pixel = sum(raw_NC_ds[name].dtype.itemsize for name in ("NDVI", "NDVI_unc", "NOBS", "QFLAG") if name in raw_NC_ds) + 1 + output_itemsize
+        
+        pixels_per_chunk = int(np.prod(NDVI.data.chunksize))
+        return int(min(NDVI.size, threads * pixels_per_chunk) * bytes_per_pixel)
+
+
+def f_Filter_NC_file_in_worker(every_NC_file, Directories, Parameters, threads):
+    """
+    Filters every_NC_file in a worker process (see f_Filter_in_parallel), with
+    `threads` threads, so the processes do not compete for the same cores.
+
+    Returns
+    -------
+    result : dict
+        Name, seconds, and size in bytes of the input and the output NC files.
+    """
+    import dask as dask
+    
+    start = time.perf_counter()
+    
+    with dask.config.set(scheduler="threads", num_workers=threads):
+        route_to_output_NC = f_Filter_NC_file(every_NC_file, Directories, Parameters)
+    
+    return {
+        "name": every_NC_file,
+        "seconds": time.perf_counter() - start,
+        "input_bytes": os.path.getsize(Directories["Outputs_downloaded"] / every_NC_file),
+        "output_bytes": os.path.getsize(route_to_output_NC),
+    }
+
+
+def f_Filter_in_parallel(bucket_list, Directories, Parameters, jobs, memory_budget=None):
+    """
+    Filters the NC files of bucket_list with a pool of `jobs` processes. If
+    memory_budget (bytes) is given, a file only starts when its estimated peak
+    memory (see f_Memory_estimate) fits in the budget left by the files in
+    flight (a single file always starts). A file that fails is reported, and
+    does not stop the batch.
+
+    Returns
+    -------
+    results : list
+        Results of the files filtered (see f_Filter_NC_file_in_worker).
+    failed : dict
+        {NC file: error} of the files that failed.
+    """
+    print(f"         Running: {f_Filter_in_parallel.__name__}()")
+    start = time.perf_counter()
+    
+    # The cores are shared between the processes
+    threads = max(1, (os.cpu_count() or 1) // jobs)
+    
+    results = []
+    failed = {}
+    in_flight = {}
+    
+    # Files that can not even be opened are reported as failed straight away
+    estimates = {}
+    for every_NC_file in bucket_list:
+        try:
+            estimates[every_NC_file] = f_Memory_estimate(Directories["Outputs_downloaded"] / every_NC_file, Parameters, threads)
+        except Exception as e:
+            failed[every_NC_file] = f"{type(e).__name__}: {e}"
+    pending = list(estimates)
+    
+    if memory_budget is not None and estimates:
+        print(f"           - Memory budget of {memory_budget / 1e9:.1f} GB. Estimated peak per file: up to {max(estimates.values()) / 1e9:.2f} GB")
+    
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        while pending or in_flight:
+            
+            # Start as many files as the number of jobs and the memory budget allow
+            while pending and len(in_flight) < jobs:
+                every_NC_file = pending[0]
+                memory_in_use = sum(estimates[name] for name in in_flight.values())
+                if in_flight and memory_budget is not None and memory_in_use + estimates[every_NC_file] > memory_budget:
+                    break
+                pending.pop(0)
+                in_flight[pool.submit(f_Filter_NC_file_in_worker, every_NC_file, Directories, Parameters, threads)] = every_NC_file
+            
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                every_NC_file = in_flight.pop(future)
+                try:
+                    results.append(future.result())
+                    print(f"           - {every_NC_file} filtered. {len(results) + len(failed)} of {len(bucket_list)} NC files done.")
+                except Exception as e:
+                    failed[every_NC_file] = f"{type(e).__name__}: {e}"
+                    print(f"           - {every_NC_file} failed ({failed[every_NC_file]}). {len(results) + len(failed)} of {len(bucket_list)} NC files done.")
+    
+    # %% SUMMARY
+    end = time.perf_counter()
+    input_bytes = sum(result["input_bytes"] for result in results)
+    output_bytes = sum(result["output_bytes"] for result in results)
+    print()
+    print(f"           - {len(results)} NC files filtered. {len(failed)} NC files failed.")
+    print(f"           - {input_bytes / 1e6:.1f} MB read, {output_bytes / 1e6:.1f} MB written")
+    print(f"           - The process took {end - start:.2f} seconds ({len(results) / (end - start) * 3600:.1f} files/hour, {input_bytes / (end - start) / 1e6:.2f} MB/s)")
+    
+    for every_NC_file, error in failed.items():
+        print(f"           - FAILED: {every_NC_file} ({error})")
+    
+    return results, failed
+    
+    
+# %% MAIN FUNCTION
+def main():
+    print(__doc__)
+    print("RUN THE SCRIPT:")
+    print(f"         Running: {main.__name__}()")
+    
+    # %% LOAD THE INPUTS
+    # The defaults above are never modified: the parameters of the run travel in Parameters
+    args = parse_arguments()
+    Parameters = f_Filter_parameters(args)
+    
+    # %% DEFINE THE DIRECTORIES
+    Directories = f_Define_the_directories()
+    # The windows downloaded with the same --bbox, if any, are read instead of the global files
+    Directories = f_Input_directories(Directories, Parameters["Bbox"])
+    
+    # %% LIST ALL NC FILES THAT REMAIN UNPROCESSED
+    # List all available NC files
+    list_of_available_NC_files = f_list_of_available_NC_files(Directories["Outputs_downloaded"])
+    # List all processed NC files.
+    list_of_processed_NC_files = f_list_of_processed_NC_files(Directories, Parameters)
+    # Compare both lists to get the NC files that remain unprocessed
+    bucket_list = f_Bucket_list(list_of_available_NC_files, list_of_processed_NC_files, args.start, args.end)
+    
+    # %% START THE LOOP
+    # To process every NC file that remains unprocessed
+    
+    # Several NC files at once, in worker processes
+    if args.jobs > 1:
+        memory_budget = args.memory_budget * 1e9 if args.memory_budget is not None else None
+        results, failed = f_Filter_in_parallel(bucket_list, Directories, Parameters, args.jobs, memory_budget)
+        if failed:
+            raise RuntimeError(
+                f"Filter incomplete ({len(failed)} NC files failed: {', '.join(failed)})"
+            )
+    
+    else:
+        counter = 0
+        for every_NC_file in bucket_list:
+            counter = counter+1
+            print()
+            print(f"       **Processing NC {counter} of {len(bucket_list)} ({every_NC_file})")
+            
+            f_Filter_NC_file(every_NC_file, Directories, Parameters)
+    
+    # %% ENDSCRIPT
+    print()
+    print("         Endscript");
+       
+
+# %% RING BELL
+if __name__ == "__main__":
+    main()
+
@@ -0,0 +1,658 @@
+# -*- coding: utf-8 -*-
+"""
+TRACKING:
+    https://doi.org/10.5281/zenodo.18620398
+    Product developped by LABIF-UCO ("https://labif.es/").
+    Version 20261017a (last modified by Juanan).
+
+OBJECTIVE:
+    To process the filtered dekads (see Launch_me_to_filter.py) into monthly maximum-value composites, per-dekad climatologies and anomalies, out of core, so the whole archive (2014-present, global) is processed within a fixed memory.
+
+INFORMATION:
+    This script does as follows:
+
+    1) Takes the filtered NC files (in Section_PROCESSING\\Outputs_filtered), and groups them: by month (composites), by dekad of the year (climatologies, within the reference period) and one by one (anomalies).
+    2) Streams every group along the native chunk grid of the filtered NDVI: every block (one chunk of every NC file of the group, read one after the other) is decoded and reduced on a thread pool, and written as soon as it is ready. The excluded pixels (NaN, or the _FillValue and the flags of the digital numbers) are left out of every reduction.
+    3) Saves, in Section_PROCESSING\\Outputs_processed:
+        - Monthly_MVC: the maximum NDVI of the dekads of every month (digital numbers, encoded as the filtered NC files), and the number of dekads with a valid NDVI.
+        - Climatology: the mean, the standard deviation and the number of years with a valid NDVI, for every dekad of the year (physical values).
+        - Anomalies: the difference between the NDVI of every dekad and the mean of its climatology, and the standardised anomaly (physical values).
+    4) Every output records its sources (the filtered NC files, and when they were filtered) in its global attributes, and it is only processed again when they change (e.g. a new dekad of the month, a new year in the climatology, or a dekad filtered again).
+
+EXAMPLES:
+
+    run Launch_me_to_process.py
+        Processes the monthly composites, the climatologies and the anomalies of every filtered dekad.
+
+    run Launch_me_to_process.py --products mvc --start 2020-01-01 --end 2020-12-31
+        Only processes the monthly composites of 2020.
+
+    run Launch_me_to_process.py --reference-start 2015-01-01 --reference-end 2024-12-31 --min-years 5 --jobs 4 --max-memory 1024
+        Computes the climatologies on 2015-2024 (only the pixels with at least 5 valid years), 4 outputs at once, each within 1024 MB.
+
+WARNINGS:
+    The anomalies of a dekad need the climatology of its dekad of the year: the climatologies are processed first. Adding a year to the reference period changes every climatology, and thus every anomaly.
+    Requires h5py and netCDF4.
+"""
+
+# %% IMPORT THE LIBRARIES
+from pathlib import Path as Path
+
+import argparse as argparse
+from concurrent.futures import ProcessPoolExecutor as ProcessPoolExecutor, ThreadPoolExecutor as ThreadPoolExecutor, wait as wait, FIRST_COMPLETED as FIRST_COMPLETED
+import hashlib as hashlib
+import itertools as itertools
+import json as json
+import os as os
+import time as time
+
+import numpy as np
+
+import ndvi as ndvi
+from ndvi import download as downloader
+from ndvi import filter as NDVI_filter
+
+
+# %% PREVIOUS INFORMATION
+# This Script requires the following information to run smoothly:
+# Input 1: products processed by default
+Products = ["mvc", "climatology", "anomalies"]
+
+# Input 2: years with a valid NDVI needed for the climatology of a pixel
+Min_years = 3
+
+# Input 3: memory, in MB, for the blocks in flight of every output
+Max_memory = 512
+
+
+# %% ANCILLARY FUNCTIONS
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Process the filtered NDVI into monthly composites, climatologies and anomalies"
+    )
+
+    # --- PRODUCTS ---
+    parser.add_argument(
+        "--products",
+        nargs="+",
+        choices=Products,
+        default=Products,
+        help="Products to process"
+    )
+
+    parser.add_argument(
+        "--reference-start",
+        type=downloader.f_Parse_date,
+        default=None,
+        help="First date of the reference period of the climatologies (YYYY-MM-DD). By default, the first filtered dekad"
+    )
+
+    parser.add_argument(
+        "--reference-end",
+        type=downloader.f_Parse_date,
+        default=None,
+        help="Last date of the reference period of the climatologies (YYYY-MM-DD). By default, the last filtered dekad"
+    )
+
+    parser.add_argument(
+        "--min-years",
+        type=int,
+        default=Min_years,
+        help="Years with a valid NDVI needed for the climatology of a pixel (otherwise, NaN)"
+    )
+
+    # --- PERFORMANCE ---
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Outputs processed at once, in worker processes (the threads are shared between them)"
+    )
+
+    parser.add_argument(
+        "--max-memory",
+        type=float,
+        default=Max_memory,
+        help="Memory, in MB, for the blocks in flight of every output"
+    )
+
+    # Dates of the dekads processed (composites and anomalies)
+    NDVI_filter.add_selection_arguments(parser)
+
+    return parser.parse_args()
+
+
+def f_Define_the_directories():
+    """
+    Returns
+    -------
+    Directories : dict
+        Directories of the filter (see NDVI_filter.f_Define_the_directories), and
+        Outputs_processed, with a folder for every product.
+    """
+    Directories = NDVI_filter.f_Define_the_directories()
+    Directories["Outputs_processed"] = Directories["General"] / "Outputs_processed"
+    for folder in ("Monthly_MVC", "Climatology", "Anomalies"):
+        (Directories["Outputs_processed"] / folder).mkdir(parents=True, exist_ok=True)
+
+    return Directories
+
+
+def f_Dekad_of_year(date):
+    """
+    Returns
+    -------
+    dekad : int
+        Dekad of the year of date, from 1 (1-10 January) to 36 (21-31 December).
+    """
+    return (date.month - 1) * 3 + min((date.day - 1) // 10, 2) + 1
+
+
+def f_Source_record(route_to_filtered_NC):
+    """
+    Returns
+    -------
+    record : dict
+        Name, date (from the name), date of filtering and filter parameters of a
+        filtered NC file (see NDVI_filter.f_Provenance).
+    """
+    import xarray as xr
+
+    with xr.open_dataset(route_to_filtered_NC, decode_cf=False) as filtered_NC_ds:
+        attrs = filtered_NC_ds.attrs
+
+    return {
+        "name": route_to_filtered_NC.name,
+        "date": downloader.f_Date_of_product(route_to_filtered_NC.name),
+        "date_created": attrs.get("date_created"),
+        "filter_parameters": attrs.get("filter_parameters"),
+    }
+
+
+def f_Sources_attr(records, extra=None):
+    """
+    Returns
+    -------
+    sources : str
+        JSON of the sources of an output (name and date of filtering of every
+        filtered NC file, and extra), to tell when it is stale.
+    """
+    return json.dumps({
+        "version": ndvi.Version,
+        "files": [[record["name"], record["date_created"]] for record in records],
+        **(extra or {}),
+    }, sort_keys=True)
+
+
+def f_Is_up_to_date(route_to_output_NC, sources):
+    import xarray as xr
+
+    if not route_to_output_NC.exists():
+        return False
+    try:
+        with xr.open_dataset(route_to_output_NC, decode_cf=False) as output_NC_ds:
+            return output_NC_ds.attrs.get("sources") == sources
+    except (OSError, ValueError):
+        return False
+
+
+def f_Valid(block, NDVI_attrs):
+    """
+    Returns
+    -------
+    values : ndarray
+        Digital numbers of block, as float64.
+    valid : ndarray
+        Booleans: True for the pixels with a valid NDVI, i.e. not NaN (float32 filtered
+        NC files), nor the _FillValue or a flag (uint8 filtered NC files), within valid_range.
+    """
+    values = block.astype(np.float64)
+    valid = np.isfinite(values)
+    if "_FillValue" in NDVI_attrs:
+        valid &= values != float(NDVI_attrs["_FillValue"])
+    if "valid_range" in NDVI_attrs:
+        low, high = np.asarray(NDVI_attrs["valid_range"], dtype=np.float64)
+        valid &= (values >= low) & (values <= high)
+    return values, valid
+
+
+# %% REDUCTIONS
+# Every reduction takes the blocks of the filtered NC files of a group (one
+# after the other, so the memory does not depend on the size of the group) and
+# returns the blocks of its output variables
+
+class MaximumValueComposite:
+    """
+    Monthly maximum-value composite: the maximum digital number of the dekads of
+    the month, encoded as the filtered NC files, and the number of valid dekads.
+    """
+
+    def __init__(self, NDVI_attrs, dtype):
+        self.NDVI_attrs = NDVI_attrs
+        self.dtype = np.dtype(dtype)
+        self.fill_value = NDVI_attrs.get("_FillValue", np.nan)
+        self.variables = {
+            "NDVI": {"dtype": self.dtype, "fill_value": self.fill_value, "attrs": {k: v for k, v in NDVI_attrs.items() if k != "_FillValue"}, "space_only": False},
+            "NDVI_count": {"dtype": np.dtype(np.uint8), "fill_value": False, "attrs": {"long_name": "Number of dekads with a valid NDVI"}, "space_only": False},
+        }
+
+    def reduce(self, blocks, extras=None):
+        maximum = count = None
+        for block in blocks:
+            values, valid = f_Valid(block, self.NDVI_attrs)
+            values[~valid] = -np.inf
+            maximum = values if maximum is None else np.maximum(maximum, values)
+            count = valid.astype(np.uint8) if count is None else count + valid
+        maximum[count == 0] = self.fill_value
+        return {"NDVI": maximum.astype(self.dtype), "NDVI_count": count}
+
+
+class Climatology:
+    """
+    Climatology of a dekad of the year: the mean and the standard deviation
+    (physical values) of the valid NDVI of the years, and their number. Pixels with
+    fewer than min_years valid years are NaN.
+    """
+
+    def __init__(self, NDVI_attrs, min_years=Min_years):
+        self.NDVI_attrs = NDVI_attrs
+        self.min_years = min_years
+        self.scale_factor = float(NDVI_attrs.get("scale_factor", 1.0))
+        self.add_offset = float(NDVI_attrs.get("add_offset", 0.0))
+        self.variables = {
+            "NDVI_mean": {"dtype": np.dtype(np.float32), "fill_value": np.float32(np.nan), "attrs": {"long_name": "Mean of the valid NDVI of the years"}, "space_only": True},
+            "NDVI_std": {"dtype": np.dtype(np.float32), "fill_value": np.float32(np.nan), "attrs": {"long_name": "Standard deviation of the valid NDVI of the years"}, "space_only": True},
+            "NDVI_count": {"dtype": np.dtype(np.uint16), "fill_value": False, "attrs": {"long_name": "Number of years with a valid NDVI"}, "space_only": True},
+        }
+
+    def reduce(self, blocks, extras=None):
+        # Sums of the digital numbers, in float64 (exact for the 2014-present archive)
+        count = total = squares = None
+        for block in blocks:
+            values, valid = f_Valid(block, self.NDVI_attrs)
+            values[~valid] = 0
+            if count is None:
+                count, total, squares = valid.astype(np.uint16), values, values ** 2
+            else:
+                count += valid
+                total += values
+                squares += values ** 2
+
+        enough = count >= max(self.min_years, 1)
+        mean = np.divide(total, count, out=np.full(total.shape, np.nan), where=enough)
+        variance = np.divide(squares - count * mean ** 2, count - 1, out=np.full(total.shape, np.nan), where=enough & (count > 1))
+        std = np.sqrt(np.maximum(variance, 0))
+        return {
+            "NDVI_mean": (mean * self.scale_factor + self.add_offset).astype(np.float32),
+            "NDVI_std": (std * abs(self.scale_factor)).astype(np.float32),
+            "NDVI_count": count,
+        }
+
+
+class Anomaly:
+    """
+    Anomaly of a dekad: the difference between its NDVI and the mean of the
+    climatology of its dekad of the year, and the same difference divided by the
+    standard deviation (physical values).
+    """
+
+    def __init__(self, NDVI_attrs):
+        self.NDVI_attrs = NDVI_attrs
+        self.scale_factor = float(NDVI_attrs.get("scale_factor", 1.0))
+        self.add_offset = float(NDVI_attrs.get("add_offset", 0.0))
+        self.variables = {
+            "NDVI_anomaly": {"dtype": np.dtype(np.float32), "fill_value": np.float32(np.nan), "attrs": {"long_name": "NDVI minus the mean of its climatology"}, "space_only": False},
+            "NDVI_zscore": {"dtype": np.dtype(np.float32), "fill_value": np.float32(np.nan), "attrs": {"long_name": "NDVI anomaly divided by the standard deviation of its climatology"}, "space_only": False},
+        }
+
+    def reduce(self, blocks, extras=None):
+        values, valid = f_Valid(next(iter(blocks)), self.NDVI_attrs)
+        NDVI = np.where(valid, values * self.scale_factor + self.add_offset, np.nan)
+        anomaly = NDVI - extras["NDVI_mean"]
+        zscore = np.divide(anomaly, extras["NDVI_std"], out=np.full(anomaly.shape, np.nan), where=extras["NDVI_std"] > 0)
+        return {"NDVI_anomaly": anomaly.astype(np.float32), "NDVI_zscore": zscore.astype(np.float32)}
+
+
+# %% STREAMING ENGINE
+
+def f_Read_block(reader, offset, chunks, buffer):
+    """
+    Reads the block at offset (chunks of the first NC file of the group) into
+    buffer: along the native chunks when they are the same (see
+    NDVI_filter.ChunkReader), or through HDF5 otherwise. NC files saved with
+    another --Output_encoding than buffer are converted (the digital numbers are
+    the same, and the excluded pixels are NaN as float32, or the _FillValue as uint8).
+
+    Returns
+    -------
+    valid : tuple
+        Slices of buffer within the grid.
+    """
+    dataset = reader.dataset
+    if dataset.dtype != buffer.dtype:
+        scratch = np.empty(buffer.shape, dtype=dataset.dtype)
+        valid = f_Read_block(reader, offset, chunks, scratch)
+        if np.issubdtype(buffer.dtype, np.integer) and np.issubdtype(dataset.dtype, np.floating):
+            scratch[valid] = np.where(np.isnan(scratch[valid]), dataset.attrs.get("_FillValue", 255), scratch[valid])
+        buffer[valid] = scratch[valid]
+        return valid
+
+    # The climatologies have no time dimension
+    offset, chunks = offset[-dataset.ndim:], chunks[-dataset.ndim:]
+    if dataset.chunks == tuple(chunks):
+        return reader.read(offset, buffer)
+
+    selection = tuple(slice(start, min(start + size, length)) for start, size, length in zip(offset, chunks, dataset.shape))
+    valid = tuple(slice(0, s.stop - s.start) for s in selection)
+    with reader.lock:
+        dataset.read_direct(buffer, source_sel=selection, dest_sel=valid)
+    return valid
+
+
+def f_Reduce_in_blocks(routes_to_inputs, route_to_output_NC, reduction, attrs, Max_memory, threads=None, routes_to_extras=None):
+    """
+    Streaming engine of the processing: the NDVI of routes_to_inputs (filtered NC
+    files on the same grid) is read along the native chunk grid of the first of
+    them. Every block is read from every NC file, one after the other, and
+    reduced (see MaximumValueComposite, Climatology and Anomaly) on a thread
+    pool, and every output block is written as soon as it is ready.
+
+    Parameters
+    ----------
+    routes_to_inputs : list
+        Routes to the filtered NC files of the group.
+    route_to_output_NC : WindowsPath
+        Route to the output. It is written aside, and renamed once complete.
+    reduction : object
+        Reduction of the blocks (reduce) and variables of the output.
+    attrs : dict
+        Global attributes of the output (see f_Sources_attr).
+    Max_memory : float
+        Memory, in bytes, for the blocks in flight.
+    threads : int, optional
+        Threads that read and reduce the blocks. By default, as many as cores.
+    routes_to_extras : dict, optional
+        {variable: route to an NC file} read block by block (space only) and passed to
+        the reduction (e.g. the climatology of an anomaly).
+    """
+    print(f"         Running: {f_Reduce_in_blocks.__name__}()")
+    start = time.perf_counter()
+
+    # Optional dependencies, only needed to process
+    import h5py as h5py
+    import netCDF4 as netCDF4
+    import xarray as xr
+
+    routes_to_extras = routes_to_extras or {}
+    route_to_tmp = route_to_output_NC.with_name(f"{route_to_output_NC.name}.{os.getpid()}.tmp")
+    h5_files = []
+    try:
+        h5_files = [h5py.File(route, "r") for route in routes_to_inputs]
+        readers = [NDVI_filter.ChunkReader(h5_file["NDVI"]) for h5_file in h5_files]
+        extra_files = {name: h5py.File(route, "r") for name, route in routes_to_extras.items()}
+        h5_files += list(extra_files.values())
+        extra_readers = {name: NDVI_filter.ChunkReader(h5_file[name]) for name, h5_file in extra_files.items()}
+
+        NDVI_h5 = h5_files[0]["NDVI"]
+        shape, dtype = NDVI_h5.shape, NDVI_h5.dtype
+        chunks = NDVI_h5.chunks or shape
+        for route, reader in zip(routes_to_inputs, readers):
+            if reader.dataset.shape != shape:
+                raise ValueError(f"{Path(route).name} is on another grid ({reader.dataset.shape} instead of {shape})")
+
+        # Blocks in flight: the input buffer, the float64 scratch of the reduction and the outputs
+        threads = threads or os.cpu_count() or 1
+        pixels = int(np.prod(chunks))
+        bytes_per_block = pixels * (dtype.itemsize + 4 * 8 + sum(variable["dtype"].itemsize for variable in reduction.variables.values()))
+        ranges = [range(0, length, size) for length, size in zip(shape, chunks)]
+        number_of_blocks = int(np.prod([len(axis) for axis in ranges]))
+        blocks_in_flight = max(1, min(int(Max_memory // bytes_per_block), 2 * threads, number_of_blocks))
+        threads = max(1, min(threads, blocks_in_flight))
+        print(f"           - {len(readers)} NC files, chunks of {chunks}: {blocks_in_flight} blocks of {bytes_per_block / 1e6:.1f} MB in flight, {threads} threads")
+
+        def reduce_block(offset):
+            buffer = np.empty(chunks, dtype=dtype)
+            valid = {}
+
+            def blocks():
+                for reader in readers:
+                    valid["slices"] = f_Read_block(reader, offset, chunks, buffer)
+                    yield buffer[valid["slices"]]
+
+            extras = {}
+            for name, reader in extra_readers.items():
+                extra = np.empty(chunks[-reader.dataset.ndim:], dtype=reader.dataset.dtype)
+                extras[name] = extra[f_Read_block(reader, offset, chunks, extra)]
+
+            outputs = reduction.reduce(blocks(), extras)
+            target = tuple(slice(origin, origin + s.stop) for origin, s in zip(offset, valid["slices"]))
+            return target, outputs
+
+        # %% CREATE THE OUTPUT FILE
+        with xr.open_dataset(routes_to_inputs[0], decode_cf=False) as filtered_NC_ds, netCDF4.Dataset(route_to_tmp, "w", format="NETCDF4") as output_NC:
+            output_NC.setncatts(attrs)
+            dims = filtered_NC_ds["NDVI"].dims
+            space_only = all(variable["space_only"] for variable in reduction.variables.values())
+            NDVI_filter.f_Copy_coordinates(output_NC, filtered_NC_ds, dims[1:] if space_only else dims)
+
+            variables = {}
+            for name, variable in reduction.variables.items():
+                variable_dims = dims[1:] if variable["space_only"] else dims
+                variables[name] = output_NC.createVariable(
+                    name, variable["dtype"], variable_dims, chunksizes=chunks[-len(variable_dims):],
+                    fill_value=variable["fill_value"], **NDVI_filter.f_Codec_encoding(),
+                )
+                variables[name].setncatts(variable["attrs"])
+                variables[name].set_auto_maskandscale(False)
+
+            # %% STREAM THE BLOCKS
+            offsets = itertools.product(*ranges)
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                in_flight = set()
+                for offset in itertools.chain(offsets, [None]):
+                    while in_flight and (offset is None or len(in_flight) >= blocks_in_flight):
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            target, outputs = future.result()
+                            for name, values in outputs.items():
+                                if reduction.variables[name]["space_only"]:
+                                    variables[name][target[1:]] = values.reshape(values.shape[-2:])
+                                else:
+                                    variables[name][target] = values
+
+                    if offset is not None:
+                        in_flight.add(pool.submit(reduce_block, offset))
+
+        os.replace(route_to_tmp, route_to_output_NC)
+
+    except BaseException:
+        route_to_tmp.unlink(missing_ok=True)
+        raise
+
+    finally:
+        for h5_file in h5_files:
+            h5_file.close()
+
+    end = time.perf_counter()
+    print(f"           - {route_to_output_NC.name}: {number_of_blocks} blocks processed. The process took {end - start:.2f} seconds")
+
+
+# %% TASKS
+
+def f_Tasks(records, Directories, args):
+    """
+    Returns
+    -------
+    tasks : dict
+        {product: list of tasks}. Every task is a dict with the routes to its inputs,
+        to its output, its sources (see f_Sources_attr) and its reduction.
+    """
+    print(f"         Running: {f_Tasks.__name__}()")
+
+    selected = [
+        record for record in records
+        if (args.start is None or record["date"] >= args.start) and (args.end is None or record["date"] <= args.end)
+    ]
+    reference = [
+        record for record in records
+        if (args.reference_start is None or record["date"] >= args.reference_start) and (args.reference_end is None or record["date"] <= args.reference_end)
+    ]
+
+    def task(group, route_to_output_NC, reduction, extra=None, routes_to_extras=None):
+        return {
+            "inputs": [Directories["Outputs_filtered"] / record["name"] for record in group],
+            "output": route_to_output_NC,
+            "sources": f_Sources_attr(group, extra),
+            "reduction": reduction,
+            "extras": routes_to_extras,
+        }
+
+    tasks = {product: [] for product in Products}
+
+    # Monthly composites of the months of the selected dekads
+    months = sorted({(record["date"].year, record["date"].month) for record in selected})
+    for year, month in months:
+        group = [record for record in records if (record["date"].year, record["date"].month) == (year, month)]
+        tasks["mvc"].append(task(group, Directories["Outputs_processed"] / "Monthly_MVC" / f"NDVI_MVC_{year}{month:02d}.nc", ("mvc",)))
+
+    # Climatologies of every dekad of the year, within the reference period
+    climatologies = {}
+    for dekad in range(1, 37):
+        group = [record for record in reference if f_Dekad_of_year(record["date"]) == dekad]
+        if not group:
+            continue
+        extra = {"min_years": args.min_years, "reference": [str(args.reference_start), str(args.reference_end)]}
+        climatologies[dekad] = task(group, Directories["Outputs_processed"] / "Climatology" / f"NDVI_climatology_D{dekad:02d}.nc", ("climatology", args.min_years), extra)
+        tasks["climatology"].append(climatologies[dekad])
+
+    # Anomalies of the selected dekads, against the climatology of their dekad of the year
+    for record in selected:
+        climatology = climatologies.get(f_Dekad_of_year(record["date"]))
+        if climatology is None:
+            continue
+        extra = {"climatology": hashlib.sha1(climatology["sources"].encode()).hexdigest()}
+        routes_to_extras = {"NDVI_mean": climatology["output"], "NDVI_std": climatology["output"]}
+        tasks["anomalies"].append(task([record], Directories["Outputs_processed"] / "Anomalies" / f"NDVI_anomaly_{record['date']:%Y%m%d}.nc", ("anomaly",), extra, routes_to_extras))
+
+    return tasks
+
+
+def f_Run_task(task, Max_memory, threads=None):
+    """
+    Processes a task (see f_Tasks), in a worker process or not.
+
+    Returns
+    -------
+    name : str
+        Name of the output.
+    """
+    import xarray as xr
+
+    with xr.open_dataset(task["inputs"][0], decode_cf=False) as filtered_NC_ds:
+        NDVI_attrs = dict(filtered_NC_ds["NDVI"].attrs)
+        dtype = filtered_NC_ds["NDVI"].dtype
+
+    kind, *options = task["reduction"]
+    if kind == "mvc":
+        reduction = MaximumValueComposite(NDVI_attrs, dtype)
+    elif kind == "climatology":
+        reduction = Climatology(NDVI_attrs, *options)
+    else:
+        reduction = Anomaly(NDVI_attrs)
+
+    attrs = {"sources": task["sources"], "process_version": ndvi.Version, "date_created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+    f_Reduce_in_blocks(task["inputs"], task["output"], reduction, attrs, Max_memory, threads, task["extras"])
+
+    return task["output"].name
+
+
+def f_Run_tasks(tasks, Max_memory, jobs=1):
+    """
+    Processes the tasks that are not up to date (see f_Is_up_to_date): one after
+    the other, or `jobs` at once in worker processes, sharing the cores. A task that
+    fails is reported, and does not stop the others.
+
+    Returns
+    -------
+    failed : dict
+        {output: error} of the tasks that failed.
+    """
+    print(f"         Running: {f_Run_tasks.__name__}()")
+
+    pending = [task for task in tasks if not f_Is_up_to_date(task["output"], task["sources"])]
+    print(f"           - {len(pending)} of {len(tasks)} outputs to process ({len(tasks) - len(pending)} up to date)")
+
+    failed = {}
+    if jobs > 1 and len(pending) > 1:
+        threads = max(1, (os.cpu_count() or 1) // jobs)
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {pool.submit(f_Run_task, task, Max_memory, threads): task for task in pending}
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    failed[futures[future]["output"].name] = f"{type(e).__name__}: {e}"
+    else:
+        for counter, task in enumerate(pending, start=1):
+            print(f"       **Processing {counter} of {len(pending)} ({task['output'].name})")
+            try:
+                f_Run_task(task, Max_memory)
+            except Exception as e:
+                failed[task["output"].name] = f"{type(e).__name__}: {e}"
+
+    for name, error in failed.items():
+        print(f"           - FAILED: {name} ({error})")
+
+    return failed
+
+
+# %% MAIN FUNCTION
+def main():
+    print(__doc__)
+    print("RUN THE SCRIPT:")
+    print(f"         Running: {main.__name__}()")
+    start = time.perf_counter()
+
+    # %% LOAD THE INPUTS
+    args = parse_arguments()
+    Max_memory = args.max_memory * 1e6
+
+    # %% DEFINE THE DIRECTORIES
+    Directories = f_Define_the_directories()
+
+    # %% LIST THE FILTERED DEKADS
+    list_of_filtered_NC_files = [name for name in NDVI_filter.f_list_of_processed_NC_files(Directories) if downloader.f_Date_of_product(name) is not None]
+    records = sorted((f_Source_record(Directories["Outputs_filtered"] / name) for name in list_of_filtered_NC_files), key=lambda record: record["date"])
+    if not records:
+        print("           - WARNING: There are no filtered NC files to process")
+        return
+
+    if len({record["filter_parameters"] for record in records}) > 1:
+        print("           - WARNING: The filtered NC files were filtered with different parameters. Run Launch_me_to_filter.py to filter them again")
+
+    # %% PROCESS THE PRODUCTS
+    # The climatologies go before the anomalies, which read them
+    tasks = f_Tasks(records, Directories, args)
+    failed = {}
+    for product in Products:
+        if product in args.products:
+            print()
+            print(f"       **Product: {product}")
+            failed.update(f_Run_tasks(tasks[product], Max_memory, args.jobs))
+
+    # %% SUMMARY
+    end = time.perf_counter()
+    print()
+    print(f"           - {len(records)} filtered dekads. {len(failed)} outputs failed. The process took {end - start:.2f} seconds")
+    if failed:
+        raise RuntimeError(f"Processing incomplete ({len(failed)} outputs failed: {', '.join(failed)})")
+
+    # %% ENDSCRIPT
+    print()
+    print("         Endscript");
+
+
+# %% RING BELL
+if __name__ == "__main__":
+    main()
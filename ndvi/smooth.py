@@ -0,0 +1,541 @@
+# -*- coding: utf-8 -*-
+"""
+TRACKING:
+    https://doi.org/10.5281/zenodo.18620398
+    Product developped by LABIF-UCO ("https://labif.es/").
+    Version 20261017a (last modified by Juanan).
+
+OBJECTIVE:
+    To fill the gaps left by the filters (see Launch_me_to_filter.py) in the NDVI time series, and to smooth them, on whole blocks of pixels at once (no loop over the pixels).
+
+INFORMATION:
+    This script does as follows:
+
+    1) Takes the filtered NC files (in Section_PROCESSING\\Outputs_filtered), in order of date, as a time series.
+    2) Reads the series block by block, along the native chunk grid of the filtered NDVI: every block holds the whole series of its pixels (time, lat, lon).
+    3) Fills the gaps (excluded pixels) of up to --max-gap dekads in a row, by linear interpolation in time between the valid dekads around them.
+    4) Smooths the series with a Savitzky-Golay filter (--window dekads, polynomial of --order). Where the window is not complete (gaps that were not filled), the value is not smoothed.
+    5) Saves the smoothed NDVI of every dekad in Section_PROCESSING\\Outputs_smoothed, with the name and the encoding of its filtered NC file, and a quality layer (NDVI_interpolated): 0 for observed pixels, 1 for interpolated pixels, 255 for pixels still missing.
+    6) Every smoothed NC file records its sources (the filtered NC files within its reach) in its global attributes, and it is only processed again when they change (e.g. a new dekad within --max-gap + --window / 2 dekads).
+
+EXAMPLES:
+
+    run Launch_me_to_smooth.py
+        Fills the gaps of up to 3 dekads, and smooths with a window of 7 dekads and a polynomial of order 2.
+
+    run Launch_me_to_smooth.py --max-gap 6 --window 0
+        Only fills the gaps of up to 6 dekads (no smoothing).
+
+    run Launch_me_to_smooth.py --max-gap 0 --window 5 --order 3 --start 2019-01-01
+        Only smooths (no gap filling), from 2019 on.
+
+WARNINGS:
+    The whole time series of a block is held in memory: the blocks in flight are bounded by --max-memory (the chunks are split into slabs of rows when the series of a chunk does not fit, and the run stops if not even a row fits).
+    Requires h5py and netCDF4.
+"""
+
+# %% IMPORT THE LIBRARIES
+from pathlib import Path as Path
+
+import argparse as argparse
+from concurrent.futures import ThreadPoolExecutor as ThreadPoolExecutor, wait as wait, FIRST_COMPLETED as FIRST_COMPLETED
+import itertools as itertools
+import json as json
+import os as os
+import time as time
+
+import numpy as np
+
+import ndvi as ndvi
+from ndvi import download as downloader
+from ndvi import filter as NDVI_filter
+from ndvi import process as NDVI_process
+
+
+# %% PREVIOUS INFORMATION
+# This Script requires the following information to run smoothly:
+# Input 1: longest gap filled, in dekads (0 disables the gap filling)
+Max_gap = 3
+
+# Input 2: Savitzky-Golay filter: window, in dekads (odd; 0 disables the smoothing), and order of the polynomial
+Window = 7
+Order = 2
+
+# Input 3: memory, in MB, for the blocks in flight
+Max_memory = 512
+
+# Input 4: pixels of the slabs the kernels run on (see f_Smooth_block)
+Slab_pixels = 4096
+
+# Input 5: memory, in MB, of every dekad besides its blocks: its filtered NC file and its
+# smoothed NC file open (HDF5 metadata and chunk caches), counted against --max-memory
+File_memory = 2
+
+# Input 6: values of the quality layer
+INTERPOLATED_FLAGS = {"observed": 0, "interpolated": 1, "missing": 255}
+
+
+# %% ANCILLARY FUNCTIONS
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Fill the gaps of the filtered NDVI time series and smooth them"
+    )
+
+    # --- GAP FILLING AND SMOOTHING ---
+    parser.add_argument(
+        "--max-gap",
+        type=int,
+        default=Max_gap,
+        help="Longest gap filled, in dekads (0 disables the gap filling)"
+    )
+
+    parser.add_argument(
+        "--window",
+        type=int,
+        default=Window,
+        help="Window of the Savitzky-Golay filter, in dekads (odd; 0 disables the smoothing)"
+    )
+
+    parser.add_argument(
+        "--order",
+        type=int,
+        default=Order,
+        help="Order of the polynomial of the Savitzky-Golay filter"
+    )
+
+    # --- PERFORMANCE ---
+    parser.add_argument(
+        "--max-memory",
+        type=float,
+        default=Max_memory,
+        help="Memory, in MB, for the blocks in flight"
+    )
+
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="Threads that read and smooth the blocks. By default, as many as cores"
+    )
+
+    # Dates of the dekads smoothed
+    NDVI_filter.add_selection_arguments(parser)
+
+    args = parser.parse_args()
+    if args.window and (args.window % 2 == 0 or args.window <= args.order):
+        parser.error(f"--window ({args.window}) must be odd and greater than --order ({args.order})")
+
+    return args
+
+
+def f_Define_the_directories():
+    """
+    Returns
+    -------
+    Directories : dict
+        Directories of the filter (see NDVI_filter.f_Define_the_directories), and
+        Outputs_smoothed, next to Outputs_filtered.
+    """
+    Directories = NDVI_filter.f_Define_the_directories()
+    Directories["Outputs_smoothed"] = Directories["General"] / "Outputs_smoothed"
+    Directories["Outputs_smoothed"].mkdir(parents=True, exist_ok=True)
+
+    return Directories
+
+
+# %% KERNELS
+# Every kernel works on a whole block of series at once: values (time, pixels),
+# with NaN in the gaps
+
+def f_Gap_fill(values, days, max_gap):
+    """
+    Parameters
+    ----------
+    values : ndarray
+        Series (time, pixels), with NaN in the gaps.
+    days : ndarray
+        Date of every time step, in days.
+    max_gap : int
+        Longest gap filled, in time steps.
+
+    Returns
+    -------
+    filled : ndarray
+        values, with the gaps of up to max_gap time steps filled by linear
+        interpolation (in days) between the valid values around them.
+    interpolated : ndarray
+        Booleans (time, pixels): True for the values filled.
+    """
+    valid = np.isfinite(values)
+    steps = np.arange(values.shape[0], dtype=np.int32)[:, np.newaxis]
+
+    # Previous and next valid time step of every time step
+    previous = np.maximum.accumulate(np.where(valid, steps, -1), axis=0)
+    following = np.minimum.accumulate(np.where(valid, steps, values.shape[0])[::-1], axis=0)[::-1]
+
+    interpolated = ~valid & (previous >= 0) & (following < values.shape[0]) & (following - previous - 1 <= max_gap)
+
+    # Only the values filled are interpolated
+    filled = values.copy()
+    step, pixel = np.nonzero(interpolated)
+    before, after = previous[step, pixel], following[step, pixel]
+    days = np.asarray(days, dtype=np.float64)
+    weight = (days[step] - days[before]) / (days[after] - days[before])
+    filled[step, pixel] = values[before, pixel] + (values[after, pixel] - values[before, pixel]) * weight
+
+    return filled, interpolated
+
+
+def f_Savitzky_Golay_matrix(window, order):
+    """
+    Returns
+    -------
+    matrix : ndarray
+        (window, window): row j holds the weights of the samples of a window that
+        give the least-squares polynomial of order `order` at its position j.
+    """
+    positions = np.arange(window) - window // 2
+    vandermonde = np.vander(positions, order + 1, increasing=True)
+    return vandermonde @ np.linalg.pinv(vandermonde)
+
+
+def f_Savitzky_Golay(values, window, order):
+    """
+    Parameters
+    ----------
+    values : ndarray
+        Series (time, pixels), with NaN in the gaps.
+    window, order : int
+        Window (odd, in time steps) and order of the polynomial.
+
+    Returns
+    -------
+    smoothed : ndarray
+        values smoothed with a Savitzky-Golay filter. The first and the last
+        window // 2 time steps take the polynomial of the first and the last
+        window. Where the window holds a gap, the value is not smoothed.
+    """
+    steps = values.shape[0]
+    if not window or steps < window:
+        return values
+
+    half = window // 2
+    matrix = f_Savitzky_Golay_matrix(window, order).astype(values.dtype)
+    valid = np.isfinite(values)
+    zeroed = np.where(valid, values, 0)
+
+    # Valid time steps of every window
+    cumulative = np.concatenate([np.zeros((1, values.shape[1]), dtype=np.int32), np.cumsum(valid, axis=0, dtype=np.int32)])
+    starts = np.clip(np.arange(steps) - half, 0, steps - window)
+    complete = (cumulative[starts + window] - cumulative[starts]) == window
+
+    smoothed = np.empty_like(values)
+    # Centre of the windows: one product per sample of the window
+    smoothed[half:steps - half] = sum(matrix[half, k] * zeroed[k:steps - window + 1 + k] for k in range(window))
+    # Edges: the polynomial of the first and of the last window
+    smoothed[:half] = matrix[:half] @ zeroed[:window]
+    smoothed[steps - half:] = matrix[half + 1:] @ zeroed[steps - window:]
+
+    return np.where(complete, smoothed, values)
+
+
+def f_Smooth_block(block, NDVI_attrs, days, Parameters):
+    """
+    Parameters
+    ----------
+    block : ndarray
+        Digital numbers (time, ...) of the filtered NC files.
+
+    Returns
+    -------
+    NDVI : ndarray
+        Smoothed digital numbers, with the dtype of block (the gaps left take the
+        _FillValue, or NaN).
+    interpolated : ndarray
+        Quality layer (see INTERPOLATED_FLAGS).
+    """
+    shape = block.shape
+    block = block.reshape(shape[0], -1)
+    NDVI = np.empty_like(block)
+    quality = np.empty(block.shape, dtype=np.uint8)
+
+    # The kernels run on slabs of pixels, to bound their scratch memory
+    for start in range(0, block.shape[1], Slab_pixels):
+        slab = slice(start, start + Slab_pixels)
+        NDVI[:, slab], quality[:, slab] = f_Smooth_slab(block[:, slab], NDVI_attrs, days, Parameters)
+
+    return NDVI.reshape(shape), quality.reshape(shape)
+
+
+def f_Smooth_slab(block, NDVI_attrs, days, Parameters):
+    """Gap-fills and smooths a slab (time, pixels) of digital numbers (see f_Smooth_block)."""
+    values, valid = NDVI_process.f_Valid(block, NDVI_attrs)
+    values = np.where(valid, values, np.nan).astype(np.float32)
+
+    if Parameters["Max_gap"]:
+        values, interpolated = f_Gap_fill(values, days, Parameters["Max_gap"])
+    else:
+        interpolated = np.zeros(values.shape, dtype=bool)
+    values = f_Savitzky_Golay(values, Parameters["Window"], Parameters["Order"])
+
+    # Back to digital numbers, within the valid range
+    if "valid_range" in NDVI_attrs:
+        values = np.clip(values, *np.asarray(NDVI_attrs["valid_range"], dtype=np.float32))
+    missing = ~np.isfinite(values)
+    fill_value = NDVI_attrs.get("_FillValue", np.nan)
+    if np.issubdtype(block.dtype, np.integer):
+        values = np.rint(values)
+    NDVI = np.where(missing, fill_value, values).astype(block.dtype)
+
+    quality = np.where(missing, INTERPOLATED_FLAGS["missing"], np.where(interpolated, INTERPOLATED_FLAGS["interpolated"], INTERPOLATED_FLAGS["observed"])).astype(np.uint8)
+    return NDVI, quality
+
+
+def f_Batches(indices, reach, number_of_records, max_dekads):
+    """
+    Parameters
+    ----------
+    indices : list
+        Sorted indices of the dekads to smooth.
+    reach : int
+        Dekads read on both sides of every smoothed dekad.
+    number_of_records : int
+        Number of filtered dekads.
+    max_dekads : int
+        Most filtered dekads read by a batch (at least 2 * reach + 1).
+
+    Returns
+    -------
+    batches : list
+        (first, last, indices of the batch) of every batch: the filtered dekads
+        records[first:last] are read to smooth the dekads of the batch.
+    """
+    batches, batch = [], []
+    for index in indices:
+        if batch and min(index + reach + 1, number_of_records) - max(batch[0] - reach, 0) > max_dekads:
+            batches.append(batch)
+            batch = []
+        batch.append(index)
+    if batch:
+        batches.append(batch)
+
+    return [(max(batch[0] - reach, 0), min(batch[-1] + reach + 1, number_of_records), batch) for batch in batches]
+
+
+# %% STREAMING ENGINE
+
+def f_Smooth_in_blocks(routes_to_inputs, days, outputs, Parameters, Max_memory, threads=None):
+    """
+    Streaming engine of the smoothing: the NDVI of routes_to_inputs (filtered NC
+    files on the same grid, in order of date) is read along the native chunk grid
+    of the first of them. Every block (the whole series of a chunk, or of a slab
+    of its rows when that series does not fit in Max_memory) is gap-filled and
+    smoothed on a thread pool (see f_Smooth_block), and written to the smoothed
+    NC files, chunked as the blocks, as soon as it is ready.
+
+    Parameters
+    ----------
+    routes_to_inputs : list
+        Routes to the filtered NC files of the series.
+    days : ndarray
+        Date of every filtered NC file, in days.
+    outputs : dict
+        {index in routes_to_inputs: (route to the smoothed NC file, global attributes)}
+        of the dekads to save.
+    Parameters : dict
+        Max_gap, Window and Order.
+    Max_memory : float
+        Memory, in bytes, for the blocks in flight. A ValueError is raised if not
+        even the series of a single row fits.
+    """
+    print(f"         Running: {f_Smooth_in_blocks.__name__}()")
+    start = time.perf_counter()
+
+    # Optional dependencies, only needed to smooth
+    import h5py as h5py
+    import netCDF4 as netCDF4
+    import xarray as xr
+
+    routes_to_tmp = {index: route.with_name(f"{route.name}.{os.getpid()}.tmp") for index, (route, _) in outputs.items()}
+    h5_files, output_NCs = [], {}
+    try:
+        # No chunk cache: every chunk is read once (see NDVI_filter.ChunkReader), and a
+        # cache per input (1 MB by default) would add up over the whole series
+        h5_files = [h5py.File(route, "r", rdcc_nbytes=0) for route in routes_to_inputs]
+        readers = [NDVI_filter.ChunkReader(h5_file["NDVI"]) for h5_file in h5_files]
+        NDVI_h5 = h5_files[0]["NDVI"]
+        shape, dtype = NDVI_h5.shape, NDVI_h5.dtype
+        chunks = NDVI_h5.chunks or shape
+        for route, reader in zip(routes_to_inputs, readers):
+            if reader.dataset.shape != shape:
+                raise ValueError(f"{Path(route).name} is on another grid ({reader.dataset.shape} instead of {shape})")
+
+        with xr.open_dataset(routes_to_inputs[0], decode_cf=False) as filtered_NC_ds:
+            NDVI_attrs = dict(filtered_NC_ds["NDVI"].attrs)
+
+        # Blocks in flight: the series of a slab of rows of a chunk, smoothed and its
+        # quality layer, the read buffer (and a decoded chunk, when the slab is only
+        # part of it) and the scratch of the kernels on a slab of pixels. The series
+        # grows with the dekads, so the rows of a chunk are halved until a block fits
+        threads = threads or os.cpu_count() or 1
+        columns = int(np.prod(chunks[2:]))
+
+        def block_bytes(rows):
+            pixels = rows * columns
+            chunk_bytes = int(np.prod(chunks)) * dtype.itemsize if rows < chunks[1] else 0
+            return pixels * len(readers) * (2 * dtype.itemsize + 1) + pixels * 8 + chunk_bytes + min(pixels, Slab_pixels) * len(readers) * 8 * 8
+
+        # The NC files of every dekad stay open for the whole run
+        Block_memory = Max_memory - len(readers) * File_memory * 1e6
+        rows = chunks[1]
+        while rows > 1 and block_bytes(rows) > Block_memory:
+            rows = (rows + 1) // 2
+        if block_bytes(rows) > Block_memory:
+            raise ValueError(
+                f"--max-memory {Max_memory / 1e6:.0f} MB is too small for the series of {len(readers)} dekads "
+                f"(their NC files take {len(readers) * File_memory} MB, and a single row of a chunk {block_bytes(1) / 1e6:.1f} MB)"
+            )
+        block = (chunks[0], rows, *chunks[2:])
+
+        bytes_per_block = block_bytes(rows)
+        ranges = [range(0, length, size) for length, size in zip(shape, block)]
+        number_of_blocks = int(np.prod([len(axis) for axis in ranges]))
+        blocks_in_flight = max(1, min(int(Block_memory // bytes_per_block), 2 * threads, number_of_blocks))
+        threads = max(1, min(threads, blocks_in_flight))
+        print(f"           - {len(readers)} dekads, chunks of {chunks}, blocks of {block}: {blocks_in_flight} blocks of {bytes_per_block / 1e6:.1f} MB in flight, {threads} threads")
+
+        def smooth_block(offset):
+            buffer = np.empty(block, dtype=dtype)
+            series = None
+            for index, reader in enumerate(readers):
+                valid = NDVI_process.f_Read_block(reader, offset, block, buffer)
+                if series is None:
+                    series = np.empty((len(readers), *buffer[valid].shape), dtype=dtype)
+                series[index] = buffer[valid]
+            NDVI, quality = f_Smooth_block(series, NDVI_attrs, days, Parameters)
+            target = tuple(slice(origin, origin + s.stop) for origin, s in zip(offset, valid))
+            return target, NDVI, quality
+
+        # %% CREATE THE OUTPUT FILES
+        compression = NDVI_filter.f_Codec_encoding()
+        for index, (route, attrs) in outputs.items():
+            with xr.open_dataset(routes_to_inputs[index], decode_cf=False) as filtered_NC_ds:
+                output_NC = output_NCs[index] = netCDF4.Dataset(routes_to_tmp[index], "w", format="NETCDF4")
+                output_NC.setncatts(attrs)
+                dims = filtered_NC_ds["NDVI"].dims
+                NDVI_filter.f_Copy_coordinates(output_NC, filtered_NC_ds, dims)
+
+                NDVI = output_NC.createVariable("NDVI", dtype.newbyteorder("="), dims, chunksizes=block, fill_value=NDVI_attrs.get("_FillValue", np.nan), **compression)
+                NDVI.setncatts({k: v for k, v in NDVI_attrs.items() if k != "_FillValue"})
+                quality = output_NC.createVariable("NDVI_interpolated", np.uint8, dims, chunksizes=block, fill_value=INTERPOLATED_FLAGS["missing"], **compression)
+                quality.setncatts({
+                    "long_name": "Origin of the smoothed NDVI",
+                    "flag_values": np.array([INTERPOLATED_FLAGS["observed"], INTERPOLATED_FLAGS["interpolated"]], dtype=np.uint8),
+                    "flag_meanings": "observed interpolated",
+                })
+                for variable in (NDVI, quality):
+                    variable.set_auto_maskandscale(False)
+                    # Every block is written as whole chunks: a chunk cache of a single chunk
+                    # per variable is enough, whatever the number of outputs open at once
+                    variable.set_var_chunk_cache(size=int(np.prod(block)) * variable.dtype.itemsize, preemption=1.0)
+
+        # %% STREAM THE BLOCKS
+        # The blocks span the whole series: only the first dekad of the grid is walked
+        offsets = itertools.product([0], *ranges[1:])
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            in_flight = set()
+            for offset in itertools.chain(offsets, [None]):
+                while in_flight and (offset is None or len(in_flight) >= blocks_in_flight):
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        target, NDVI, quality = future.result()
+                        for index, output_NC in output_NCs.items():
+                            output_NC["NDVI"][target] = NDVI[index]
+                            output_NC["NDVI_interpolated"][target] = quality[index]
+
+                if offset is not None:
+                    in_flight.add(pool.submit(smooth_block, offset))
+
+        for index, output_NC in output_NCs.items():
+            output_NC.close()
+            os.replace(routes_to_tmp[index], outputs[index][0])
+
+    except BaseException:
+        for index, output_NC in output_NCs.items():
+            if output_NC.isopen():
+                output_NC.close()
+            routes_to_tmp[index].unlink(missing_ok=True)
+        raise
+
+    finally:
+        for h5_file in h5_files:
+            h5_file.close()
+
+    end = time.perf_counter()
+    print(f"           - {len(outputs)} smoothed NC files saved ({number_of_blocks} blocks). The process took {end - start:.2f} seconds")
+
+
+# %% MAIN FUNCTION
+def main():
+    print(__doc__)
+    print("RUN THE SCRIPT:")
+    print(f"         Running: {main.__name__}()")
+    start = time.perf_counter()
+
+    # %% LOAD THE INPUTS
+    args = parse_arguments()
+    Parameters = {"Max_gap": max(args.max_gap, 0), "Window": args.window, "Order": args.order}
+
+    # %% DEFINE THE DIRECTORIES
+    Directories = f_Define_the_directories()
+
+    # %% LIST THE FILTERED DEKADS
+    list_of_filtered_NC_files = [name for name in NDVI_filter.f_list_of_processed_NC_files(Directories) if downloader.f_Date_of_product(name) is not None]
+    records = sorted((NDVI_process.f_Source_record(Directories["Outputs_filtered"] / name) for name in list_of_filtered_NC_files), key=lambda record: record["date"])
+    if not records:
+        print("           - WARNING: There are no filtered NC files to smooth")
+        return
+
+    # %% SMOOTHED NC FILES THAT ARE STALE
+    # A smoothed dekad depends on the filtered dekads within its reach: the window of
+    # the filter, and the longest gap filled on both sides of it
+    reach = Parameters["Window"] // 2 + (Parameters["Max_gap"] + 1 if Parameters["Max_gap"] else 0)
+    stale = {}
+    for index, record in enumerate(records):
+        if (args.start is not None and record["date"] < args.start) or (args.end is not None and record["date"] > args.end):
+            continue
+        route_to_output_NC = Directories["Outputs_smoothed"] / record["name"]
+        sources = NDVI_process.f_Sources_attr(records[max(index - reach, 0):index + reach + 1], {"smooth_version": ndvi.Version, **Parameters})
+        if not NDVI_process.f_Is_up_to_date(route_to_output_NC, sources):
+            stale[index] = (route_to_output_NC, {
+                "sources": sources,
+                "smooth_parameters": json.dumps(Parameters, sort_keys=True),
+                "smooth_version": ndvi.Version,
+                "date_created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            })
+    print(f"           - {len(stale)} smoothed NC files to process")
+
+    # %% SMOOTH
+    # Only the filtered dekads within reach of the stale ones are read, in batches
+    # whose NC files take at most half of --max-memory (the rest is for the blocks)
+    Max_dekads = max(2 * reach + 1, int(args.max_memory / 2 // File_memory))
+    for first, last, batch in f_Batches(sorted(stale), reach, len(records), Max_dekads):
+        routes_to_inputs = [Directories["Outputs_filtered"] / record["name"] for record in records[first:last]]
+        days = np.array([(record["date"] - records[0]["date"]).total_seconds() / 86400 for record in records[first:last]])
+        outputs = {index - first: stale[index] for index in batch}
+        f_Smooth_in_blocks(routes_to_inputs, days, outputs, Parameters, args.max_memory * 1e6, args.threads)
+
+    # %% SUMMARY
+    end = time.perf_counter()
+    print()
+    print(f"           - {len(records)} filtered dekads. {len(stale)} smoothed. The process took {end - start:.2f} seconds")
+
+    # %% ENDSCRIPT
+    print()
+    print("         Endscript");
+
+
+# %% RING BELL
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,459 @@
+# -*- coding: utf-8 -*-
+"""
+TRACKING:
+    https://doi.org/10.5281/zenodo.18620398
+    Product developped by LABIF-UCO ("https://labif.es/").
+    Version 20261017a (last modified by Juanan).
+
+OBJECTIVE:
+    To choose the thresholds of Launch_me_to_filter.py (Thr_uncertainty, Thr_NOBS and Filter_bits), by evaluating a grid of combinations on the downloaded NC files in a single pass, instead of filtering the whole archive once per combination.
+
+INFORMATION:
+    This script does as follows:
+
+    1) Builds every combination of the given thresholds of uncertainty, thresholds of NOBS and sets of flag bits ("off" disables a filter).
+    2) Reads every NC file (by default, all those in Outputs_downloaded) once, block by block. Every block of NDVI_unc, NOBS and QFLAG is reduced to a few classes (the combinations that keep every digital number), so a single histogram per block holds the NDVI of every combination.
+    3) Reports, for every combination (per NC file and for all of them): the valid NDVI pixels, the pixels retained and their percentage, and the mean, standard deviation, percentiles 10/50/90, minimum and maximum of the NDVI retained.
+    4) Saves the filtered NC files only for the selected combinations (--write), in Outputs_filtered\\Sweep\\<combination>, in the same pass.
+
+EXAMPLES:
+
+    run Launch_me_to_sweep_filters.py
+        Evaluates the default grid (uncertainty 0.1, 0.15, 0.2, 0.28 and off; NOBS 1, 2, 3 and off; all the flag bits or none) on every NC file.
+
+    run Launch_me_to_sweep_filters.py --Thr_uncertainty 0.15 0.28 --Thr_NOBS 2 off --Filter_bits 0,1,2,3,4,5,6,7 0,2,4,7 --start 2020-06-01 --end 2020-09-30 --mask-file ../Inputs/Spain.geojson
+        Evaluates 8 combinations on the summer of 2020, within Spain.
+
+    run Launch_me_to_sweep_filters.py --Thr_uncertainty 0.15 0.28 --Thr_NOBS 2 off --write 1 4 --Output_encoding uint8
+        Evaluates 8 combinations, and also saves the NC files filtered with the combinations 1 and 4 (as numbered in the results).
+
+WARNINGS:
+    The results are saved as CSV (by default, Ancillary\\filter_sweep.csv). The NDVI statistics are computed on the physical values (scale_factor and add_offset of the product).
+"""
+
+# %% IMPORT THE LIBRARIES
+from pathlib import Path as Path
+
+import argparse as argparse
+import csv as csv
+import itertools as itertools
+import os as os
+import time as time
+
+import numpy as np
+
+from ndvi import filter as NDVI_filter
+
+
+# %% PREVIOUS INFORMATION
+# This Script requires the following information to run smoothly:
+# Input 1: grid evaluated by default ("off" disables the filter)
+Default_Thr_uncertainty = ["0.1", "0.15", "0.2", "0.28", "off"]
+Default_Thr_NOBS = ["1", "2", "3", "off"]
+Default_Filter_bits = ["0,1,2,3,4,5,6,7", "none"]
+
+
+# %% ANCILLARY FUNCTIONS
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Evaluate a grid of filter thresholds on the NDVI products in a single pass"
+    )
+
+    # --- GRID ---
+    parser.add_argument(
+        "--Thr_uncertainty",
+        type=f_Parse_option(float),
+        nargs="+",
+        default=[f_Parse_option(float)(text) for text in Default_Thr_uncertainty],
+        help="Uncertainty thresholds (0–1) to evaluate, or off (e.g. --Thr_uncertainty 0.15 0.28 off)"
+    )
+
+    parser.add_argument(
+        "--Thr_NOBS",
+        type=f_Parse_option(int),
+        nargs="+",
+        default=[f_Parse_option(int)(text) for text in Default_Thr_NOBS],
+        help="Minimum numbers of observations to evaluate, or off (e.g. --Thr_NOBS 1 2 off)"
+    )
+
+    parser.add_argument(
+        "--Filter_bits",
+        type=f_Parse_bits,
+        nargs="+",
+        default=[f_Parse_bits(text) for text in Default_Filter_bits],
+        help="Sets of bits to exclude, as comma-separated bits, or none (e.g. --Filter_bits 0,1,2,3,4,5,6,7 0,2,4,7 none)"
+    )
+
+    parser.add_argument(
+        "--write",
+        type=int,
+        nargs="*",
+        default=[],
+        help="Numbers of the combinations whose filtered NC files are saved (in Outputs_filtered/Sweep)"
+    )
+
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=None,
+        help="CSV file where the results are saved. By default, Ancillary/filter_sweep.csv"
+    )
+
+    # The selected combinations are saved as Launch_me_to_filter.py saves them
+    NDVI_filter.add_output_arguments(parser)
+    NDVI_filter.add_selection_arguments(parser)
+    NDVI_filter.add_region_arguments(parser)
+
+    return parser.parse_args()
+
+
+def f_Parse_option(value_type):
+    """
+    Argument type for thresholds: a value of value_type, or "off" (None) to disable the filter.
+    """
+    def parse(text):
+        if text.lower() == "off":
+            return None
+        try:
+            return value_type(text)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Invalid threshold '{text}' (expected a number or off)")
+    return parse
+
+
+def f_Parse_bits(text):
+    """
+    Argument type for sets of bits: comma-separated bits (0-7), or "none".
+    """
+    if text.lower() == "none":
+        return ()
+    try:
+        bits = tuple(sorted({int(bit) for bit in text.split(",") if bit}))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid set of bits '{text}' (expected e.g. 0,2,4,7 or none)")
+    if any(bit < 0 or bit > 7 for bit in bits):
+        raise argparse.ArgumentTypeError(f"Invalid set of bits '{text}' (bits must be 0-7)")
+    return bits
+
+
+def f_Combinations(Thr_uncertainty, Thr_NOBS, Filter_bits):
+    """
+    Returns
+    -------
+    combinations : list
+        Every combination of the options, numbered from 1, as dicts with Number, Label,
+        Thr_uncertainty, Thr_NOBS and Filter_bits (None or () when the filter is off).
+    """
+    combinations = []
+    for number, (uncertainty, NOBS, bits) in enumerate(itertools.product(Thr_uncertainty, Thr_NOBS, Filter_bits), start=1):
+        combinations.append({
+            "Number": number,
+            "Label": f"unc{uncertainty if uncertainty is not None else 'off'}_nobs{NOBS if NOBS is not None else 'off'}_bits{''.join(map(str, bits)) or 'none'}",
+            "Thr_uncertainty": uncertainty,
+            "Thr_NOBS": NOBS,
+            "Filter_bits": bits,
+        })
+    return combinations
+
+
+def f_Combination_parameters(combination, Output_parameters):
+    """
+    Returns
+    -------
+    Parameters : dict
+        Parameters of Launch_me_to_filter.py (see f_Filter_parameters) for combination.
+    """
+    return {
+        **Output_parameters,
+        "Filter_uncertainty": combination["Thr_uncertainty"] is not None,
+        "Thr_uncertainty": combination["Thr_uncertainty"] or 0,
+        "Filter_NOBS": combination["Thr_NOBS"] is not None,
+        "Thr_NOBS": combination["Thr_NOBS"] or 0,
+        "Filter_bitwise": {bit: (bit in combination["Filter_bits"]) for bit in range(8)},
+    }
+
+
+def f_Sweep_classes(raw_NC_ds, Thr_uncertainty, Thr_NOBS, Filter_bits):
+    """
+    Every layer (NDVI_unc, NOBS and QFLAG) is reduced to classes: the digital
+    numbers kept by the same options fall in the same class. A block then only
+    needs one histogram of (class of NDVI_unc, class of NOBS, class of QFLAG,
+    NDVI), whatever the number of combinations.
+
+    Returns
+    -------
+    class_LUTs : list
+        For every layer, 256 class numbers (int32), indexed by its digital number.
+    keep : list
+        For every layer, booleans (classes, options): True if the option keeps the class.
+    """
+    options = {
+        "NDVI_unc": [{"Filter_uncertainty": value is not None, "Thr_uncertainty": value} for value in Thr_uncertainty],
+        "NOBS": [{"Filter_NOBS": value is not None, "Thr_NOBS": value} for value in Thr_NOBS],
+        "QFLAG": [{"Filter_bitwise": {bit: (bit in bits) for bit in range(8)}} for bits in Filter_bits],
+    }
+    Disabled = {"Filter_uncertainty": False, "Filter_NOBS": False, "Filter_bitwise": {}, "Output_encoding": "float32"}
+
+    class_LUTs = []
+    keep = []
+    for layer, layer_options in options.items():
+        # Lookup tables of every option (the same as Launch_me_to_filter.py), as columns
+        patterns = np.stack([
+            NDVI_filter.f_Mask_LUTs(raw_NC_ds, {**Disabled, **option}, verbose=False)[1].get(layer, np.ones(256, dtype=bool))
+            for option in layer_options
+        ], axis=1)
+        layer_keep, class_LUT = np.unique(patterns, axis=0, return_inverse=True)
+        class_LUTs.append(class_LUT.reshape(-1).astype(np.int32))
+        keep.append(layer_keep)
+
+    return class_LUTs, keep
+
+
+def f_Sweep_histogram(NDVI, NDVI_unc, NOBS, QFLAG, inside=None, *, class_LUTs, shape):
+    """
+    Returns
+    -------
+    histogram : ndarray
+        Pixels of the block per (class of NDVI_unc, class of NOBS, class of QFLAG,
+        digital number of NDVI), flattened. Only the pixels inside the region, if given.
+    """
+    index = np.take(class_LUTs[0], NDVI_unc)
+    index *= shape[1]
+    index += np.take(class_LUTs[1], NOBS)
+    index *= shape[2]
+    index += np.take(class_LUTs[2], QFLAG)
+    index *= 256
+    index += NDVI
+
+    if inside is not None:
+        index = index[inside]
+
+    return np.bincount(index.reshape(-1), minlength=int(np.prod(shape)) * 256)
+
+
+def f_Sweep_NC_file(every_NC_file, Directories, combinations, options, Output_parameters, write):
+    """
+    Reads every_NC_file once: the histogram of every block and, in the same
+    pass, the filtered NC files of the combinations in write.
+
+    Returns
+    -------
+    histograms : ndarray
+        Pixels retained per (option of uncertainty, option of NOBS, set of bits, digital number of NDVI).
+    unfiltered : ndarray
+        Pixels per digital number of NDVI, before filtering.
+    NDVI_attrs : dict
+        Attributes of NDVI (flag_values, scale_factor, add_offset).
+    """
+    import dask as dask
+    import xarray as xr
+
+    print(f"         Running: {f_Sweep_NC_file.__name__}()")
+    start = time.perf_counter()
+
+    route_to_input_NC = Directories["Outputs_downloaded"] / Path(every_NC_file)
+    with xr.open_dataset(route_to_input_NC, decode_cf=False) as raw_NC_ds:
+
+        # Only the window of the region of interest, if any
+        window, mask = NDVI_filter.f_Region_of_interest(raw_NC_ds, Output_parameters, Directories)
+        if window is not None:
+            raw_NC_ds = raw_NC_ds.isel(window)
+        raw_NC_ds = raw_NC_ds.chunk("auto")
+        NDVI = raw_NC_ds["NDVI"]
+
+        class_LUTs, keep = f_Sweep_classes(raw_NC_ds, *options)
+        shape = tuple(layer_keep.shape[0] for layer_keep in keep)
+
+        # %% HISTOGRAM OF EVERY BLOCK
+        layers = [raw_NC_ds[name].data for name in ("NDVI", "NDVI_unc", "NOBS", "QFLAG")]
+        if mask is not None:
+            layers.append(xr.DataArray(mask, dims=("lat", "lon")).broadcast_like(NDVI).transpose(*NDVI.dims).chunk(NDVI.chunksizes).data)
+
+        blocks = [dask.delayed(f_Sweep_histogram)(*block, class_LUTs=class_LUTs, shape=shape)
+                  for block in zip(*[layer.to_delayed().reshape(-1) for layer in layers])]
+        # Added by pairs, so only a few histograms are held at once
+        while len(blocks) > 1:
+            blocks = [dask.delayed(np.add)(blocks[index], blocks[index + 1]) if index + 1 < len(blocks) else blocks[index] for index in range(0, len(blocks), 2)]
+
+        # %% FILTERED NC FILES OF THE SELECTED COMBINATIONS
+        writes = []
+        for combination in combinations:
+            if combination["Number"] not in write:
+                continue
+            Parameters = f_Combination_parameters(combination, Output_parameters)
+            route_to_output = Directories["Outputs_filtered"] / "Sweep" / combination["Label"]
+            route_to_output.mkdir(parents=True, exist_ok=True)
+
+            NDVI_filtered = NDVI_filter.f_Apply_region_mask(NDVI_filter.f_Filter_fused(raw_NC_ds, Parameters), raw_NC_ds, mask)
+            writes.append(NDVI_filter.f_Save_the_NC(
+                NDVI_filtered, raw_NC_ds, every_NC_file, {"Outputs_filtered": route_to_output},
+                Parameters["Output_encoding"], Parameters["Compression"], compute=False,
+                attrs=NDVI_filter.f_Provenance(every_NC_file, Directories, Parameters),
+            ))
+
+        # The blocks read are shared by the histogram and the writes
+        histogram, *_ = dask.compute(blocks[0], *writes)
+        histogram = histogram.reshape(*shape, 256)
+
+        # From classes to options: the pixels kept by every combination of options
+        histograms = np.einsum("unqd,ui,nj,qk->ijkd", histogram, *[layer_keep.astype(np.int64) for layer_keep in keep])
+        unfiltered = histogram.sum(axis=(0, 1, 2))
+        NDVI_attrs = dict(NDVI.attrs)
+
+    end = time.perf_counter()
+    print(f"           - {len(combinations)} combinations evaluated, {len(writes)} saved. The process took {end - start:.2f} seconds")
+
+    return histograms, unfiltered, NDVI_attrs
+
+
+def f_Sweep_statistics(histogram, unfiltered, NDVI_attrs):
+    """
+    Parameters
+    ----------
+    histogram, unfiltered : ndarray
+        Pixels per digital number of NDVI (256), retained and before filtering.
+    NDVI_attrs : dict
+        Attributes of NDVI (flag_values, scale_factor, add_offset).
+
+    Returns
+    -------
+    statistics : dict
+        Retained pixels, retention, and mean, std, p10, p50, p90, min and max of the NDVI retained.
+    """
+    DN = np.arange(256)
+    valid = ~np.isin(DN, NDVI_attrs.get("flag_values", []))
+    counts = np.where(valid, histogram, 0)
+    valid_pixels = int(unfiltered[valid].sum())
+    values = DN * float(NDVI_attrs.get("scale_factor", 1)) + float(NDVI_attrs.get("add_offset", 0))
+
+    retained = int(counts.sum())
+    statistics = {"valid_pixels": valid_pixels, "retained_pixels": retained, "retention": retained / valid_pixels if valid_pixels else float("nan")}
+
+    if retained == 0:
+        return {**statistics, **{name: float("nan") for name in ("mean", "std", "p10", "p50", "p90", "min", "max")}}
+
+    mean = float((counts * values).sum() / retained)
+    cumulative = np.cumsum(counts)
+    percentile = lambda q: float(values[np.searchsorted(cumulative, q * retained)])
+
+    return {
+        **statistics,
+        "mean": mean,
+        "std": float(np.sqrt((counts * (values - mean) ** 2).sum() / retained)),
+        "p10": percentile(0.1),
+        "p50": percentile(0.5),
+        "p90": percentile(0.9),
+        "min": float(values[counts > 0].min()),
+        "max": float(values[counts > 0].max()),
+    }
+
+
+def f_Sweep_rows(name, histograms, unfiltered, NDVI_attrs, combinations):
+    """
+    Returns
+    -------
+    rows : list
+        One row (dict) per combination, with its statistics (see f_Sweep_statistics).
+    """
+    rows = []
+    for combination, histogram in zip(combinations, histograms.reshape(-1, 256)):
+        rows.append({
+            "file": name,
+            "number": combination["Number"],
+            "label": combination["Label"],
+            "Thr_uncertainty": "off" if combination["Thr_uncertainty"] is None else combination["Thr_uncertainty"],
+            "Thr_NOBS": "off" if combination["Thr_NOBS"] is None else combination["Thr_NOBS"],
+            "Filter_bits": ",".join(map(str, combination["Filter_bits"])) or "none",
+            **f_Sweep_statistics(histogram, unfiltered, NDVI_attrs),
+        })
+    return rows
+
+
+def f_Print_results(rows):
+    print()
+    print(f"           {'#':>3} {'combination':<34} {'retained':>12} {'%':>6} {'mean':>6} {'std':>6} {'p10':>6} {'p50':>6} {'p90':>6}")
+    for row in rows:
+        print(
+            f"           {row['number']:>3} {row['label']:<34} {row['retained_pixels']:>12} {row['retention']:>6.1%}"
+            f" {row['mean']:>6.3f} {row['std']:>6.3f} {row['p10']:>6.3f} {row['p50']:>6.3f} {row['p90']:>6.3f}"
+        )
+
+
+# %% MAIN FUNCTION
+def main():
+    print(__doc__)
+    print("RUN THE SCRIPT:")
+    print(f"         Running: {main.__name__}()")
+
+    # %% LOAD THE INPUTS
+    args = parse_arguments()
+    options = (args.Thr_uncertainty, args.Thr_NOBS, args.Filter_bits)
+    combinations = f_Combinations(*options)
+
+    unknown = sorted(set(args.write) - {combination["Number"] for combination in combinations})
+    if unknown:
+        raise ValueError(f"There are no combinations {unknown} (there are {len(combinations)})")
+
+    if not NDVI_filter.f_Codec_is_available(args.codec):
+        raise ValueError(f"The codec {args.codec} is not available in this installation of netCDF4/HDF5")
+
+    # Parameters shared by every combination: how the selected ones are saved, and the region
+    Output_parameters = {
+        "Output_encoding": args.Output_encoding,
+        "Compression": NDVI_filter.f_Codec_encoding(args.codec, args.complevel, args.shuffle),
+        "Max_memory": None,
+        "Bbox": args.bbox,
+        "Mask_file": args.mask_file,
+    }
+
+    # %% DEFINE THE DIRECTORIES
+    Directories = NDVI_filter.f_Define_the_directories()
+    # The windows downloaded with the same --bbox, if any, are read instead of the global files
+    Directories = NDVI_filter.f_Input_directories(Directories, args.bbox)
+    route_to_output = args.output if args.output is not None else Directories["Ancillary"] / "filter_sweep.csv"
+
+    # %% LIST THE NC FILES
+    list_of_available_NC_files = NDVI_filter.f_list_of_available_NC_files(Directories["Outputs_downloaded"])
+    bucket_list = NDVI_filter.f_Bucket_list(sorted(list_of_available_NC_files), [], args.start, args.end)
+    print(f"           - {len(combinations)} combinations, {len(args.write)} to save")
+
+    # %% SWEEP EVERY NC FILE
+    start = time.perf_counter()
+    rows = []
+    total = None
+    for counter, every_NC_file in enumerate(bucket_list, start=1):
+        print()
+        print(f"       **Processing NC {counter} of {len(bucket_list)} ({every_NC_file})")
+
+        histograms, unfiltered, NDVI_attrs = f_Sweep_NC_file(every_NC_file, Directories, combinations, options, Output_parameters, args.write)
+        rows.extend(f_Sweep_rows(every_NC_file, histograms, unfiltered, NDVI_attrs, combinations))
+
+        if total is None:
+            total = [histograms, unfiltered]
+        else:
+            total = [total[0] + histograms, total[1] + unfiltered]
+
+    # %% SAVE THE RESULTS
+    summary = f_Sweep_rows("ALL", *total, NDVI_attrs, combinations)
+    rows.extend(summary)
+    end = time.perf_counter()
+
+    f_Print_results(summary)
+    print()
+    print(f"           - {len(bucket_list)} NC files read once for {len(combinations)} combinations. The process took {end - start:.2f} seconds")
+
+    with open(route_to_output, "w", newline="", encoding="utf-8") as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"           - Results saved in {route_to_output}")
+
+    # %% ENDSCRIPT
+    print()
+    print("         Endscript");
+
+
+# %% RING BELL
+if __name__ == "__main__":
+    main()